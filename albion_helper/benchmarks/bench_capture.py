@@ -0,0 +1,119 @@
+"""
+Бенчмарк захвата экрана без дисплея.
+Сравнивает старый путь (новый mss.mss() на каждый скриншот) с CaptureSession.
+
+Запуск из папки albion_helper:
+    python -m benchmarks.bench_capture --open-cost-ms 2 --iterations 500
+"""
+import argparse
+import time
+
+import numpy as np
+import cv2
+
+from modules.capture_session import CaptureSession
+
+
+class StubScreenShot:
+    """Минимальная замена mss.ScreenShot: сырой BGRA-буфер и размеры"""
+
+    def __init__(self, raw, width, height):
+        self.raw = raw
+        self.width = width
+        self.height = height
+
+    @property
+    def __array_interface__(self):
+        return {
+            "version": 3,
+            "shape": (self.height, self.width, 4),
+            "typestr": "|u1",
+            "data": self.raw,
+        }
+
+
+_STUB_FRAMES = {}
+
+
+class StubGrabber:
+    """
+    Заглушка mss.mss(): имитирует стоимость открытия подключения к дисплею
+    и возвращает заранее сгенерированные кадры нужного размера.
+    """
+
+    def __init__(self, open_cost=0.0):
+        if open_cost:
+            time.sleep(open_cost)
+        self.monitors = [{"left": 0, "top": 0, "width": 3440, "height": 1440}]
+
+    def grab(self, monitor):
+        key = (monitor["width"], monitor["height"])
+        raw = _STUB_FRAMES.get(key)
+        if raw is None:
+            rng = np.random.default_rng(0)
+            raw = bytearray(rng.integers(0, 256, size=key[0] * key[1] * 4, dtype=np.uint8).tobytes())
+            _STUB_FRAMES[key] = raw
+        # mss отдаёт новый bytearray на каждый grab — повторяем это
+        return StubScreenShot(bytearray(raw), key[0], key[1])
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def legacy_capture(factory, x, y, width, height):
+    """Старая реализация capture_screen: mss открывается на каждый вызов"""
+    with factory() as sct:
+        monitor = {"top": y, "left": x, "width": width, "height": height}
+        img = np.array(sct.grab(monitor))
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+
+
+def _time_calls(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "mean_ms": sum(samples) / len(samples) * 1000,
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+    }
+
+
+def run(open_cost_ms=2.0, iterations=500, region=(0, 0, 916, 120)):
+    open_cost = open_cost_ms / 1000.0
+    factory = lambda: StubGrabber(open_cost)  # noqa: E731
+    x, y, w, h = region
+
+    results = {"legacy": _time_calls(lambda: legacy_capture(factory, x, y, w, h), iterations)}
+
+    with CaptureSession(grabber_factory=factory) as session:
+        results["session"] = _time_calls(lambda: session.grab(x, y, w, h), iterations)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк захвата экрана на заглушке")
+    parser.add_argument("--open-cost-ms", type=float, default=2.0,
+                        help="имитируемая стоимость открытия mss.mss(), мс")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--width", type=int, default=916)
+    parser.add_argument("--height", type=int, default=120)
+    args = parser.parse_args()
+
+    results = run(args.open_cost_ms, args.iterations, (0, 0, args.width, args.height))
+    for name, stats in results.items():
+        print(f"{name:22s} mean={stats['mean_ms']:.3f} ms  p50={stats['p50_ms']:.3f} ms  p99={stats['p99_ms']:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
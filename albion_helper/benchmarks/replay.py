@@ -0,0 +1,76 @@
+"""
+Офлайн-прогон детекции авто-еды по записи сессии (.albrec).
+Клавиши не нажимаются — нажатия только подсчитываются.
+
+Запуск из папки albion_helper:
+    python -m benchmarks.replay info data/recordings/session_....albrec
+    python -m benchmarks.replay run data/recordings/session_....albrec
+    python -m benchmarks.replay run --realtime data/recordings/session_....albrec
+"""
+import argparse
+import os
+import sys
+import time
+
+from modules.auto_food import AutoFoodDetector
+from modules.session_recorder import read_session, replay_detection, ReplayFrameSource
+
+
+def print_info(path):
+    header, ticks = read_session(path)
+    count, last = 0, 0.0
+    for timestamp, _ in ticks:
+        count, last = count + 1, timestamp
+    print(f"Области: {', '.join(header.get('regions', [])) or '—'}")
+    print(f"Создана: {header.get('created')}, тиков: {count}, длительность: {last:.1f} с, "
+          f"размер: {os.path.getsize(path) / 1024:.0f} КБ")
+
+
+def run(path, realtime=False, verbose=False):
+    pressed = []
+    detector = AutoFoodDetector(press_key=pressed.append)
+    started = time.perf_counter()
+    if realtime:
+        source = ReplayFrameSource(path, realtime=True)
+        results = []
+        while True:
+            frames = source()
+            if frames is None:
+                break
+            results.append((time.perf_counter() - started, detector(frames)))
+    else:
+        results = replay_detection(path, detector)
+    elapsed = time.perf_counter() - started
+
+    states = {}
+    for timestamp, result in results:
+        states[result.state] = states.get(result.state, 0) + 1
+        if verbose:
+            print(f"{timestamp:10.2f}  {result.state}")
+    print(f"Тиков: {len(results)}, нажатий: {len(pressed)}, "
+          f"состояния: {', '.join(f'{k}={v}' for k, v in sorted(states.items()))}")
+    print(f"Время: {elapsed:.2f} с ({elapsed / max(1, len(results)) * 1000:.2f} мс/тик), "
+          f"матчинг пропущен: {detector.gate.skip_ratio:.0%}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-прогон детекции авто-еды по записи сессии")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="сводка по записи")
+    info.add_argument("path")
+    replay = sub.add_parser("run", help="прогнать детекцию по записи")
+    replay.add_argument("path")
+    replay.add_argument("--realtime", action="store_true", help="соблюдать исходные интервалы между кадрами")
+    replay.add_argument("-v", "--verbose", action="store_true", help="печатать состояние каждого тика")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        print_info(args.path)
+    else:
+        run(args.path, realtime=args.realtime, verbose=args.verbose)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""
+Набор бенчмарков горячих путей без дисплея.
+
+Меряет на синтетических кадрах 3440x1440 и 1920x1080:
+- capture_screen на заглушке захвата (весь экран и область эффектов);
+- find_template_in_image в цикле по набору шаблонов (1–100) и TemplateMatcher на том же наборе;
+- TemplateMatcher с шаблонами в каждом режиме сравнения (color, gray, masked, edges);
+- find_image_difference, process_food_difference (через диск) и extract_food_changes (в памяти).
+
+Результаты (пропускная способность, p50/p99) сохраняются в JSON и сравниваются
+с сохранённым baseline, чтобы регрессии были видны сразу.
+
+Запуск из папки albion_helper:
+    python -m benchmarks.run --out bench_results.json
+    python -m benchmarks.run --quick --fail-on-regression
+    python -m benchmarks.run --update-baseline
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import cv2
+
+from benchmarks import synthetic
+from benchmarks.bench_capture import StubGrabber
+from modules.capture_session import set_default_grabber_factory
+from modules.screenshot_handler import capture_screen
+from modules.template_bank import TemplateEntry, MATCH_MODES
+from modules.template_matcher import find_template_in_image, TemplateMatcher
+from modules.image_comparer import find_image_difference
+from modules.food_processor import process_food_difference, extract_food_changes
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+BANK_SIZES = (1, 10, 30, 100)
+
+# Размер набора для сравнения режимов матчинга
+MODE_BANK_SIZE = 30
+
+# Допустимое замедление p50 относительно baseline, прежде чем считать его регрессией
+REGRESSION_TOLERANCE = 0.25
+
+# Число замеров, при котором действует REGRESSION_TOLERANCE; при меньшем допуск
+# расширяется пропорционально 1/sqrt(числа замеров) — медиана нескольких замеров шумная
+RELIABLE_SAMPLES = 100
+
+
+def measure(func, min_time=1.0, min_iterations=5, max_iterations=500):
+    """
+    Вызывает func, пока не наберётся min_time секунд (но не меньше min_iterations раз).
+    :return: dict — iterations, mean/p50/p99 в мс и пропускная способность в вызовах/с
+    """
+    func()  # прогрев: первые вызовы OpenCV и кэши
+    samples = []
+    total = 0.0
+    while len(samples) < max_iterations and (len(samples) < min_iterations or total < min_time):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        samples.append(elapsed)
+        total += elapsed
+
+    samples.sort()
+    count = len(samples)
+    return {
+        "iterations": count,
+        "mean_ms": total / count * 1000,
+        "p50_ms": samples[count // 2] * 1000,
+        "p99_ms": samples[min(count - 1, int(count * 0.99))] * 1000,
+        "throughput_per_s": count / total if total else 0.0,
+    }
+
+
+def bench_capture(resolution, timing):
+    width, height = synthetic.RESOLUTIONS[resolution]
+    ex, ey, ew, eh = synthetic.effects_rect(resolution)
+    set_default_grabber_factory(StubGrabber)
+    try:
+        return {
+            f"capture_screen/{resolution}/full": measure(lambda: capture_screen(0, 0, width, height), **timing),
+            f"capture_screen/{resolution}/effects": measure(lambda: capture_screen(ex, ey, ew, eh), **timing),
+        }
+    finally:
+        set_default_grabber_factory(None)
+
+
+def bench_matching(resolution, timing, bank_sizes=BANK_SIZES):
+    results = {}
+    icons = synthetic.make_icons(max(bank_sizes), synthetic.icon_size(resolution))
+    bank = [TemplateEntry(f"icon_{i}.png", "", icon, 0.0, 0) for i, icon in enumerate(icons)]
+
+    for size in bank_sizes:
+        subset = bank[:size]
+        # На полосе эффектов — последняя иконка набора: худший случай для раннего выхода
+        strip, _ = synthetic.make_effects_strip(resolution, [subset[-1].image], placed=1)
+
+        def legacy_loop():
+            for entry in subset:
+                if find_template_in_image(strip, entry.image):
+                    break
+
+        matcher = TemplateMatcher()
+        results[f"find_template_in_image/{resolution}/bank_{size}"] = measure(legacy_loop, **timing)
+        results[f"template_matcher_cold/{resolution}/bank_{size}"] = measure(
+            lambda: (matcher.forget(), matcher.match(strip, subset)), **timing)
+        results[f"template_matcher_tracked/{resolution}/bank_{size}"] = measure(
+            lambda: matcher.match(strip, subset), **timing)
+    return results
+
+
+def bench_match_modes(resolution, timing, size=MODE_BANK_SIZE):
+    """Холодный поиск набора шаблонов с одним и тем же режимом сравнения"""
+    results = {}
+    icons = synthetic.make_icons(size, synthetic.icon_size(resolution))
+    strip, _ = synthetic.make_effects_strip(resolution, [icons[-1]], placed=1)
+    for mode in MATCH_MODES:
+        bank = [TemplateEntry(f"icon_{i}.png", "", icon, 0.0, 0, meta={"match_mode": mode})
+                for i, icon in enumerate(icons)]
+        matcher = TemplateMatcher(track=False)
+        results[f"template_matcher_{mode}/{resolution}/bank_{size}"] = measure(
+            lambda: matcher.match(strip, bank), **timing)
+    return results
+
+
+def bench_difference(resolution, timing):
+    icons = synthetic.make_icons(4, synthetic.icon_size(resolution), seed=7)
+    before, _ = synthetic.make_effects_strip(resolution, icons[:2], placed=2, seed=11)
+    after = before.copy()
+    synthetic.place_icons(after, icons[2:], seed=12)
+
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        results[f"find_image_difference/{resolution}"] = measure(
+            lambda: find_image_difference(before, after), **timing)
+        results[f"extract_food_changes/{resolution}"] = measure(
+            lambda: extract_food_changes(before, after), **timing)
+
+        work_dir = tempfile.mkdtemp(prefix="albion_bench_")
+        try:
+            before_path = os.path.join(work_dir, "before_food.png")
+            after_path = os.path.join(work_dir, "after_food.png")
+            cv2.imwrite(before_path, before)
+            cv2.imwrite(after_path, after)
+            output_dir = os.path.join(work_dir, "diff")
+            results[f"process_food_difference/{resolution}"] = measure(
+                lambda: process_food_difference(before_path, after_path, output_dir), **timing)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def run_all(resolutions=tuple(synthetic.RESOLUTIONS), quick=False, bank_sizes=BANK_SIZES):
+    timing = {"min_time": 0.2, "min_iterations": 3, "max_iterations": 200} if quick else {}
+    results = {}
+    for resolution in resolutions:
+        results.update(bench_capture(resolution, timing))
+        results.update(bench_matching(resolution, timing, bank_sizes))
+        results.update(bench_match_modes(resolution, timing))
+        results.update(bench_difference(resolution, timing))
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def case_tolerance(tolerance, iterations):
+    """Допуск для случая с iterations замерами (в текущем прогоне или в baseline — берётся меньшее)"""
+    return tolerance * max(1.0, (RELIABLE_SAMPLES / max(iterations, 1)) ** 0.5)
+
+
+def compare(current, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Сравнивает p50 с baseline; допуск расширяется для случаев с малым числом замеров.
+    :return: list[(case, baseline_p50, current_p50, ratio, regressed)]
+    """
+    rows = []
+    base_results = baseline.get("results", {})
+    for case, stats in sorted(current["results"].items()):
+        base = base_results.get(case)
+        if base is None or not base.get("p50_ms"):
+            continue
+        ratio = stats["p50_ms"] / base["p50_ms"]
+        iterations = min(stats.get("iterations", 0), base.get("iterations", 0))
+        rows.append((case, base["p50_ms"], stats["p50_ms"], ratio, ratio > 1 + case_tolerance(tolerance, iterations)))
+    return rows
+
+
+def print_results(report):
+    print(f"{'case':58s} {'p50 ms':>10s} {'p99 ms':>10s} {'ops/s':>10s}")
+    for case, stats in sorted(report["results"].items()):
+        print(f"{case:58s} {stats['p50_ms']:10.3f} {stats['p99_ms']:10.3f} {stats['throughput_per_s']:10.1f}")
+
+
+def print_comparison(rows):
+    print()
+    print(f"{'case':58s} {'base p50':>10s} {'now p50':>10s} {'ratio':>7s}")
+    for case, base, now, ratio, regressed in rows:
+        mark = "  ⚠️ регрессия" if regressed else ""
+        print(f"{case:58s} {base:10.3f} {now:10.3f} {ratio:7.2f}{mark}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки захвата, матчинга и сравнения кадров")
+    parser.add_argument("--out", help="куда сохранить результаты (JSON)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline для сравнения")
+    parser.add_argument("--update-baseline", action="store_true", help="записать результаты как новый baseline")
+    parser.add_argument("--quick", action="store_true", help="меньше итераций — для быстрой проверки")
+    parser.add_argument("--resolution", choices=sorted(synthetic.RESOLUTIONS), action="append",
+                        help="только указанные разрешения (можно повторять)")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="допустимое замедление p50 относительно baseline (доля) при "
+                             f"{RELIABLE_SAMPLES}+ замерах; при меньшем числе замеров допуск шире")
+    parser.add_argument("--fail-on-regression", action="store_true", help="код выхода 1 при регрессии")
+    args = parser.parse_args(argv)
+    if args.update_baseline and args.quick:
+        parser.error("baseline записывается только полным прогоном (без --quick)")
+
+    report = run_all(tuple(args.resolution or synthetic.RESOLUTIONS), quick=args.quick)
+    print_results(report)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+        print(f"\n✅ Baseline обновлён: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nℹ️ Baseline не найден: {args.baseline} (создайте его с --update-baseline)")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = compare(report, baseline, args.tolerance)
+    print_comparison(rows)
+
+    regressions = [r for r in rows if r[4]]
+    if regressions and args.fail_on_regression:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Синтетические кадры и иконки для бенчмарков.
+Всё генерируется из seed, поэтому результаты воспроизводимы между запусками.
+"""
+import numpy as np
+import cv2
+
+# Разрешения, на которых меряем горячие пути
+RESOLUTIONS = {
+    "3440x1440": (3440, 1440),
+    "1920x1080": (1920, 1080),
+}
+
+# Область эффектов персонажа на 3440x1440 (ширина 916 px); для других разрешений масштабируется
+EFFECTS_RECT_3440 = (1262, 1180, 916, 120)
+ICON_SIZE_3440 = 40
+
+
+def scale_for(resolution):
+    """Коэффициент масштаба интерфейса относительно 3440x1440 (по высоте)"""
+    return RESOLUTIONS[resolution][1] / 1440
+
+
+def effects_rect(resolution):
+    """Область эффектов персонажа для разрешения"""
+    k = scale_for(resolution)
+    return tuple(int(round(v * k)) for v in EFFECTS_RECT_3440)
+
+
+def icon_size(resolution):
+    return max(8, int(round(ICON_SIZE_3440 * scale_for(resolution))))
+
+
+def make_frame(width, height, seed=0):
+    """Гладкий «шумный» BGR-кадр, похожий на игровой фон"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(max(1, height // 8), max(1, width // 8), 3), dtype=np.uint8)
+    frame = cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR)
+    return cv2.GaussianBlur(frame, (5, 5), 0)
+
+
+def make_icons(count, size, seed=1):
+    """Набор различимых иконок size x size"""
+    rng = np.random.default_rng(seed)
+    icons = []
+    for _ in range(count):
+        icon = rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8)
+        icons.append(cv2.GaussianBlur(icon, (3, 3), 0))
+    return icons
+
+
+def place_icons(frame, icons, seed=2, count=None):
+    """
+    Размещает иконки в случайных позициях ряда (как бафы на полосе эффектов).
+    :return: list[(index, (x, y, width, height))] — что и куда помещено
+    """
+    rng = np.random.default_rng(seed)
+    h, w = frame.shape[:2]
+    count = len(icons) if count is None else min(count, len(icons))
+    chosen = rng.choice(len(icons), size=count, replace=False)
+    placements = []
+    x = int(rng.integers(0, 8))
+    for idx in chosen:
+        icon = icons[idx]
+        ih, iw = icon.shape[:2]
+        if x + iw > w or ih > h:
+            break
+        y = int(rng.integers(0, h - ih + 1))
+        frame[y:y + ih, x:x + iw] = icon
+        placements.append((int(idx), (x, y, iw, ih)))
+        x += iw + int(rng.integers(2, 8))
+    return placements
+
+
+def make_effects_strip(resolution, icons, placed=3, seed=3):
+    """Полоса эффектов нужного разрешения с несколькими размещёнными иконками"""
+    _, _, w, h = effects_rect(resolution)
+    strip = make_frame(w, h, seed)
+    placements = place_icons(strip, icons, seed=seed + 1, count=placed)
+    return strip, placements
@@ -0,0 +1,316 @@
+"""
+Единая служба настроек: settings.json читается один раз на процесс.
+
+    from config.service import get_config
+    config = get_config()
+    effects = config.region("Область эффектов персонажа")   # Region или None
+    unsubscribe = config.subscribe(lambda settings, changed: ...)
+    config.set_region("Слот еды", Region(100, 200, 40, 40))
+
+Области разбираются и проверяются при загрузке и отдаются как неизменяемые Region,
+поэтому горячий путь больше не парсит словари на каждом кадре.
+Изменения из UI применяются сразу в памяти, а на диск пишутся с задержкой
+(несколько правок подряд — одна запись). Правки файла извне подхватываются
+фоновым опросом и рассылаются подписчикам.
+"""
+import copy
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+logger = logging.getLogger("AlbionHelperLogger")
+
+SETTINGS_PATH = os.path.join(os.path.dirname(__file__), "settings.json")
+
+DEFAULT_SETTINGS = {
+    "default_resolution": "3440x1440",
+    "language": "ru"
+}
+
+# Как часто проверять файл на изменения извне, в секундах
+POLL_INTERVAL = 1.0
+
+# Задержка записи на диск после последнего изменения, в секундах
+WRITE_DELAY = 0.5
+
+_RECT_FIELDS = ("x", "y", "width", "height")
+
+
+class Region(namedtuple("Region", _RECT_FIELDS)):
+    """
+    Проверенная область экрана. Это кортеж (x, y, width, height),
+    поэтому подходит везде, где ожидается прямоугольник.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Разбирает область из формата settings.json.
+        :raises ValueError: поле отсутствует, не число, или размер не положительный
+        """
+        if not isinstance(data, dict):
+            raise ValueError("область должна быть объектом")
+        values = []
+        for field in _RECT_FIELDS:
+            if field not in data:
+                raise ValueError(f"нет поля '{field}'")
+            try:
+                values.append(int(data[field]))
+            except (TypeError, ValueError):
+                raise ValueError(f"поле '{field}' не число: {data[field]!r}") from None
+        region = cls(*values)
+        if region.width <= 0 or region.height <= 0:
+            raise ValueError(f"размер должен быть больше 0: {region.width}x{region.height}")
+        return region
+
+    def to_dict(self, label):
+        return {"x": self.x, "y": self.y, "width": self.width, "height": self.height, "label": label}
+
+
+def _is_region_entry(value):
+    return isinstance(value, dict) and all(field in value for field in _RECT_FIELDS)
+
+
+class ConfigService:
+    """
+    Настройки одного файла. Снимок настроек (settings) — неизменяемое отображение,
+    которое целиком заменяется при каждом изменении; его можно держать и читать из любого потока.
+    Вложенные словари и списки снимка — копия: их правка не меняет настройки,
+    изменения вносятся только через update()/set().
+
+    Подписчики вызываются как callback(settings, changed_keys) в потоке, где произошло
+    изменение (поток UI при set(), поток опроса при правке файла). Окна Qt должны
+    переносить вызов в свой поток (см. ui.config_bridge).
+    """
+
+    def __init__(self, path=SETTINGS_PATH, defaults=DEFAULT_SETTINGS, poll_interval=POLL_INTERVAL,
+                 write_delay=WRITE_DELAY):
+        self.path = path
+        self.defaults = defaults
+        self.poll_interval = poll_interval
+        self.write_delay = write_delay
+        self._lock = threading.RLock()
+        self._subscribers = []
+        self._data = {}
+        self._settings = MappingProxyType({})
+        self._regions = {}
+        self._file_state = None
+        self._write_timer = None
+        self._watch_thread = None
+        self._watch_stop = threading.Event()
+        self.reload(notify=False)
+
+    # --- чтение ---
+
+    @property
+    def settings(self):
+        return self._settings
+
+    def get(self, key, default=None):
+        return self._settings.get(key, default)
+
+    def region(self, name):
+        """:return: Region или None, если области нет или она некорректна"""
+        return self._regions.get(name)
+
+    def regions(self):
+        """:return: dict — имя -> Region для всех корректных областей"""
+        return dict(self._regions)
+
+    # --- подписка ---
+
+    def subscribe(self, callback):
+        """
+        :param callback: callable(settings, changed_keys)
+        :return: callable без аргументов — отписка
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def _notify(self, changed):
+        if not changed:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+            settings = self._settings
+        for callback in subscribers:
+            try:
+                callback(settings, frozenset(changed))
+            except Exception as e:
+                logger.error(f"❌ Ошибка подписчика настроек: {e}")
+
+    # --- изменение ---
+
+    def _apply(self, data):
+        """
+        Заменяет снимок настроек; data переходит во владение службы.
+        :return: set изменённых ключей
+        """
+        regions = {}
+        for key, value in data.items():
+            if _is_region_entry(value):
+                try:
+                    regions[key] = Region.from_dict(value)
+                except ValueError as e:
+                    logger.warning(f"⚠️ Область '{key}' в settings.json пропущена: {e}")
+        with self._lock:
+            old = self._data
+            changed = {key for key in old.keys() | data.keys() if old.get(key) != data.get(key)}
+            self._data = data
+            # Снимок не делит вложенные объекты с _data: правка снимка снаружи
+            # не должна попасть в файл и сбить сравнение old/new при следующем изменении
+            self._settings = MappingProxyType(copy.deepcopy(data))
+            self._regions = regions
+        return changed
+
+    def update(self, values):
+        """
+        Меняет несколько ключей сразу, уведомляет подписчиков и планирует запись на диск.
+        :param values: dict — ключ -> значение (значения копируются)
+        """
+        with self._lock:
+            data = dict(self._data)
+            data.update(copy.deepcopy(values))
+            changed = self._apply(data)
+        if changed:
+            self._schedule_write()
+            self._notify(changed)
+        return changed
+
+    def set(self, key, value):
+        return self.update({key: value})
+
+    def set_region(self, name, region):
+        """
+        :param region: Region или (x, y, width, height); проверяется так же, как при загрузке
+        """
+        region = Region.from_dict(dict(zip(_RECT_FIELDS, region)))
+        return self.set(name, region.to_dict(name))
+
+    # --- файл ---
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def reload(self, notify=True):
+        """
+        Перечитывает файл, если он изменился с последнего чтения/записи.
+        Отсутствующий файл создаётся из значений по умолчанию; повреждённый —
+        игнорируется (остаются прежние настройки).
+        :return: set изменённых ключей
+        """
+        state = self._stat()
+        if state is not None and state == self._file_state:
+            return set()
+
+        if state is None:
+            data = copy.deepcopy(self.defaults)
+            with self._lock:
+                changed = self._apply(data)
+            self.flush(force=True)
+        else:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if not isinstance(data, dict):
+                    raise ValueError("ожидался объект JSON")
+            except (OSError, ValueError) as e:
+                logger.error(f"❌ Ошибка чтения settings.json: {e}")
+                self._file_state = state
+                if not self._data:
+                    self._apply(copy.deepcopy(self.defaults))
+                return set()
+            with self._lock:
+                self._file_state = state
+                changed = self._apply(data)
+            if changed and notify:
+                logger.info(f"🔄 settings.json изменён: {', '.join(sorted(changed))}")
+
+        if notify:
+            self._notify(changed)
+        return changed
+
+    def _schedule_write(self):
+        with self._lock:
+            if self._write_timer is not None:
+                self._write_timer.cancel()
+            self._write_timer = threading.Timer(self.write_delay, self.flush)
+            self._write_timer.daemon = True
+            self._write_timer.start()
+
+    def flush(self, force=False):
+        """Записывает отложенные изменения на диск сразу (атомарно, через временный файл)"""
+        with self._lock:
+            pending = self._write_timer is not None
+            if self._write_timer is not None:
+                self._write_timer.cancel()
+                self._write_timer = None
+            if not pending and not force:
+                return
+            data = self._data
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=4, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.error(f"❌ Не удалось сохранить settings.json: {e}")
+                return
+            # Собственная запись не должна восприниматься как правка извне
+            self._file_state = self._stat()
+
+    # --- наблюдение за файлом ---
+
+    def start_watching(self, interval=None):
+        """Запускает фоновую проверку файла на изменения извне"""
+        if self._watch_thread is not None and self._watch_thread.is_alive():
+            return
+        interval = interval or self.poll_interval
+        self._watch_stop.clear()
+
+        def loop():
+            while not self._watch_stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception as e:
+                    logger.error(f"❌ Ошибка перечитывания settings.json: {e}")
+
+        self._watch_thread = threading.Thread(target=loop, name="config-watch", daemon=True)
+        self._watch_thread.start()
+
+    def stop_watching(self):
+        """Останавливает наблюдение и дописывает отложенные изменения"""
+        if self._watch_thread is not None:
+            self._watch_stop.set()
+            self._watch_thread.join()
+            self._watch_thread = None
+        self.flush()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_config():
+    """Общая на процесс служба настроек (config/settings.json)"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = ConfigService()
+    return _service
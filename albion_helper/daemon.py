@@ -0,0 +1,198 @@
+"""
+Авто-режим без интерфейса: захват, детекция и нажатия клавиш без PyQt5.
+
+Области, правила и политики клавиш берутся из config/settings.json (как в окне авто-режима),
+правки файла подхватываются на лету. Статус пишется в stdout и, если задано, в JSON-файл.
+
+Запуск из папки albion_helper:
+    python daemon.py
+    python daemon.py --status-file data/status.json --dry-run
+    python daemon.py --replay data/recordings/session_....albrec --dry-run
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+
+from config.service import get_config, Region
+from modules.auto_food import AutoFoodDetector
+from modules.capture_session import close_all_sessions
+from modules.input_dispatcher import InputDispatcher, FakeBackend
+from modules.metrics import get_metrics, FLUSH_INTERVAL
+from modules.pipeline import DetectionPipeline
+from modules.rules import build_auto_food_engine
+from modules.session_recorder import ReplayFrameSource
+from modules.ui_scale import screen_resolution
+from modules.template_store import get_template_store, migrate_legacy_files
+from utils.logger import setup_logger, set_log_level
+from utils.paths import ensure_directories
+
+
+class StatusReporter:
+    """
+    Статус авто-режима: строка в stdout при смене состояния еды или срабатывании правила
+    и снимок в JSON-файле (перезаписывается атомарно) после каждой проверки.
+    """
+
+    def __init__(self, dispatcher, detector, path=None, stream=sys.stdout, json_lines=False):
+        self.dispatcher = dispatcher
+        self.detector = detector
+        self.path = path
+        self.stream = stream
+        self.json_lines = json_lines
+        self.started = time.time()
+        self.checks = 0
+        self.last_state = None
+        self._lock = threading.Lock()
+
+    def snapshot(self, result=None):
+        food = result.results.get("food") if result is not None else None
+        detail = food.detail if food is not None else None
+        match = getattr(detail, "match", None)
+        return {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "uptime": round(time.time() - self.started, 1),
+            "checks": self.checks,
+            "food_state": getattr(detail, "state", self.last_state),
+            "food_match": None if match is None else {"template": match.template_id, "score": round(match.score, 3)},
+            "fired": sorted(name for name, r in result.results.items() if r.fired) if result is not None else [],
+            "ui_scale": self.detector.scale,
+            "keys": dict(self.dispatcher.stats),
+            "stages": {name: {"p50_ms": s["p50_ms"], "p99_ms": s["p99_ms"]}
+                       for name, s in get_metrics().snapshot().items()},
+        }
+
+    def update(self, result):
+        """Вызывается из потока детекции"""
+        with self._lock:
+            self.checks += 1
+            status = self.snapshot(result)
+            changed = status["food_state"] != self.last_state or status["fired"]
+            self.last_state = status["food_state"]
+            if changed:
+                self._print(status)
+            if self.path:
+                self._write(status)
+
+    def _print(self, status):
+        if self.json_lines:
+            line = json.dumps(status, ensure_ascii=False)
+        else:
+            match = status["food_match"]
+            score = f" ({match['template']}, score={match['score']:.2f})" if match else ""
+            fired = f" · сработали: {', '.join(status['fired'])}" if status["fired"] else ""
+            line = (f"[{status['time'][11:]}] еда: {status['food_state']}{score}{fired} · "
+                    f"нажатий: {status['keys']['pressed']}")
+        print(line, file=self.stream, flush=True)
+
+    def _write(self, status):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(status, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Не удалось записать статус: {e}", file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Albion Helper — авто-режим без интерфейса")
+    parser.add_argument("--status-file", help="JSON-файл, куда после каждой проверки пишется статус")
+    parser.add_argument("--json", action="store_true", help="строки статуса в stdout в формате JSON")
+    parser.add_argument("--dry-run", action="store_true", help="не нажимать клавиши, только писать в лог")
+    parser.add_argument("--replay", help="воспроизвести запись .albrec вместо захвата экрана")
+    parser.add_argument("--duration", type=float, help="завершиться через столько секунд")
+    parser.add_argument("--log-level", help="уровень логирования (по умолчанию из settings.json)")
+    return parser.parse_args(argv)
+
+
+def run(args):
+    logger = setup_logger()
+    config = get_config()
+    set_log_level(args.log_level or config.get("log_level", "INFO"))
+    migrate_legacy_files(get_template_store())
+    settings = config.settings
+
+    frame_source = None
+    resolve = config.region
+    if args.replay:
+        # Кадры берутся по именам областей: в записи могут быть области правил, которых при воспроизведении нет
+        frame_source = ReplayFrameSource(args.replay, realtime=True, region_names=lambda: engine.region_names)
+        # Запись содержит только кадры еды; области берутся из неё, а не из настроек
+        resolve = lambda name: config.region(name) or Region(0, 0, 1, 1)
+    backend = None
+    if args.dry_run or args.replay:
+        backend = FakeBackend(on_press=lambda key: logger.info(f"⌨️ [без нажатий] клавиша '{key}'"))
+
+    dispatcher = InputDispatcher.from_settings(settings.get("input", {}), backend=backend).start()
+    ui_scale = settings.get("ui_scale")
+    detector = AutoFoodDetector(dispatcher=dispatcher, scale=float(ui_scale) if ui_scale else None,
+                                on_scale=lambda scale: config.set("ui_scale", scale),
+                                resolution=None if args.replay else screen_resolution(),
+                                reference_resolution=settings.get("default_resolution"))
+    engine = build_auto_food_engine(detector, settings, resolve=resolve, press_key=dispatcher.press,
+                                    with_rules=not args.replay)
+    status = StatusReporter(dispatcher, detector, args.status_file, json_lines=args.json)
+
+    # Без превью: захват выполняется только тогда, когда пора проверять какое-то правило
+    pipeline = DetectionPipeline(engine.rects(), detect=engine, on_result=status.update,
+                                 scheduler=engine, frame_source=frame_source)
+    pipeline.set_preview_enabled(False)
+    pipeline.set_detection_enabled(True)
+
+    def on_settings_changed(new_settings, changed):
+        if "log_level" in changed and not args.log_level:
+            set_log_level(new_settings.get("log_level", "INFO"))
+        if engine.declared_regions & changed:
+            pipeline.set_regions(engine.refresh_regions())
+            logger.info("🔄 Области обновлены из настроек")
+        if "ui_scale" in changed:
+            if new_settings.get("ui_scale"):
+                detector.set_scale(float(new_settings["ui_scale"]))
+                engine.set_scale(float(new_settings["ui_scale"]))
+            else:
+                detector.recalibrate()
+    config.subscribe(on_settings_changed)
+    config.start_watching()
+
+    metrics = get_metrics()
+    metrics.start_flushing(float(settings.get("metrics_flush_interval", FLUSH_INTERVAL)))
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    if not engine.rects():
+        logger.warning("⚠️ Ни у одного правила не заданы области — ждём настройки в settings.json")
+    logger.info("🚀 Авто-режим без интерфейса запущен")
+    print(f"Авто-режим запущен, областей: {len(engine.rects())}, правил: {len(engine.rules)}. Ctrl+C — выход.",
+          flush=True)
+    pipeline.start()
+    deadline = time.monotonic() + args.duration if args.duration else None
+    try:
+        while not stop.wait(0.5):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            if frame_source is not None and frame_source.exhausted:
+                break
+    finally:
+        pipeline.stop()
+        dispatcher.stop()
+        config.stop_watching()
+        metrics.stop_flushing()
+        close_all_sessions()
+        logger.info(f"🛑 Авто-режим остановлен: проверок {status.checks}, нажатий {dispatcher.stats['pressed']}")
+    return 0
+
+
+def main(argv=None):
+    ensure_directories()
+    return run(parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Поиск и удаление почти одинаковых шаблонов в библиотеке.
+
+Шаблоны группируются по перцептивному хешу и корреляции (modules.template_dedup);
+в каждой группе остаётся один шаблон, остальные — лишние сравнения на каждой проверке.
+Без --prune команда только показывает группы. С --prune дубликаты удаляются из хранилища,
+а их PNG переносятся в подпапку pruned/, чтобы синхронизация с папкой не вернула их обратно.
+
+Запуск из папки albion_helper:
+    python dedupe_templates.py
+    python dedupe_templates.py --category slots --prune
+"""
+import argparse
+import os
+import shutil
+import sys
+
+from modules.auto_food import FOOD_TEMPLATES_DIR, SLOT_TEMPLATES_DIR
+from modules.template_dedup import find_clusters, HASH_DISTANCE, DUPLICATE_SCORE
+from modules.template_store import get_template_store, migrate_legacy_files
+from utils.logger import setup_logger
+from utils.paths import ensure_directories
+
+# Категория -> папка, PNG из которой подтягиваются в хранилище
+CATEGORY_DIRS = {
+    "food": FOOD_TEMPLATES_DIR,
+    "slots": SLOT_TEMPLATES_DIR,
+}
+
+# Подпапка для PNG удалённых дубликатов
+PRUNED_DIR = "pruned"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Albion Helper — поиск дубликатов шаблонов")
+    parser.add_argument("--category", default="food", help="категория шаблонов (по умолчанию food)")
+    parser.add_argument("--prune", action="store_true", help="удалить дубликаты, оставив по одному шаблону в группе")
+    parser.add_argument("--distance", type=int, default=HASH_DISTANCE,
+                        help=f"максимальное расстояние между хешами (по умолчанию {HASH_DISTANCE})")
+    parser.add_argument("--score", type=float, default=DUPLICATE_SCORE,
+                        help=f"минимальная корреляция дубликата (по умолчанию {DUPLICATE_SCORE})")
+    return parser.parse_args(argv)
+
+
+def prune(store, category, duplicate, min_score=DUPLICATE_SCORE):
+    """
+    Удаляет дубликат из хранилища, а его PNG переносит в pruned/.
+    Шаблон, недостаточно похожий на оставляемый, не трогается.
+    :param duplicate: Duplicate — сходство считается с оставляемым шаблоном группы
+    :return: bool — был ли шаблон удалён
+    """
+    if duplicate.score < min_score:
+        return False
+    entry = duplicate.entry
+    source = entry.path
+    if source and os.path.isfile(source):
+        target_dir = os.path.join(os.path.dirname(source), PRUNED_DIR)
+        os.makedirs(target_dir, exist_ok=True)
+        shutil.move(source, os.path.join(target_dir, os.path.basename(source)))
+    return store.delete(entry.name, category)
+
+
+def run(args):
+    logger = setup_logger()
+    store = get_template_store()
+    migrate_legacy_files(store)
+    directory = CATEGORY_DIRS.get(args.category)
+    if directory:
+        store.sync_directory(directory, args.category)
+    store.ensure_hashes(args.category)
+
+    entries = store.load_entries(args.category)
+    clusters = find_clusters(entries, max_distance=args.distance, min_score=args.score)
+    duplicates = sum(len(cluster.duplicates) for cluster in clusters)
+    print(f"Шаблонов в категории '{args.category}': {len(entries)}, групп дубликатов: {len(clusters)}")
+    for cluster in clusters:
+        print(f"\n✔ {cluster.keep.name}")
+        for duplicate in cluster.duplicates:
+            print(f"  ✖ {duplicate.entry.name} (расстояние {duplicate.distance}, сходство {duplicate.score:.3f})")
+
+    if not duplicates:
+        return 0
+    if not args.prune:
+        print(f"\nЛишних шаблонов: {duplicates}. Запустите с --prune, чтобы удалить их.")
+        return 0
+
+    removed = 0
+    for cluster in clusters:
+        for duplicate in cluster.duplicates:
+            if prune(store, args.category, duplicate, args.score):
+                removed += 1
+    logger.info(f"🧹 Удалено дубликатов шаблонов ({args.category}): {removed}")
+    print(f"\nУдалено шаблонов: {removed}, осталось: {len(entries) - removed}")
+    return 0
+
+
+def main(argv=None):
+    ensure_directories()
+    return run(parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,21 @@
-import config
-
 import sys
+
+# Профайлер импорта ставится до остальных импортов, иначе он их не увидит
+from utils.import_profile import profiler_from_argv
+profiler = profiler_from_argv()
+
+from config.service import get_config
+
 from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QTimer
 from datetime import datetime
 import atexit
 
 from ui.main_window import AlbionHelperMainWindow
 
 from utils.paths import ensure_directories
-from utils.logger import setup_logger
+from utils.logger import setup_logger, set_log_level
+from modules.warmup import start_warmup
 
 import warnings
 # warnings.filterwarnings("ignore", category=DeprecationWarning, module="sip")
@@ -16,13 +23,29 @@ import warnings
 
 def main():
     logger = setup_logger()
-    config.load_settings()
+    config = get_config()
+    set_log_level(config.get("log_level", "INFO"))
+    # Правки settings.json на диске подхватываются без перезапуска
+    def on_settings_changed(settings, changed):
+        if "log_level" in changed:
+            set_log_level(settings.get("log_level", "INFO"))
+    config.subscribe(on_settings_changed)
+    config.start_watching()
     logger.info("🚀 Программа запущена")
     app = QApplication(sys.argv)
     # Передаем логгер в существующий класс из main_window.py
     window = AlbionHelperMainWindow(logger=logger)
     window.show()
     logger.info("/mainwindow отображено")
+    if profiler is not None:
+        profiler.mark("главное окно показано")
+    # Детекция, шаблоны и окна второго плана грузятся в фоне, когда окно уже на экране
+    def on_warmup_done(seconds):
+        if profiler is not None:
+            profiler.mark("прогрев завершён")
+            logger.info(f"⏱️ Профиль импорта: {profiler.write_report()}")
+    QTimer.singleShot(0, lambda: start_warmup(
+        modules=("ui.auto_food_mode_window", "ui.auto_template_food"), on_done=on_warmup_done))
     # Настройка завершения сессии
     def log_shutdown():
         end_time = datetime.now()
@@ -30,6 +53,13 @@ def main():
         minutes = divmod(duration.total_seconds(), 60)
         logger.info(f"🛑 Сессия завершена. Работала: {int(minutes[0])} мин {int(minutes[1])} сек")
     atexit.register(log_shutdown)
+    # Закрываем подключения к дисплею, открытые сессиями захвата
+    def close_sessions():
+        if "modules.capture_session" in sys.modules:
+            sys.modules["modules.capture_session"].close_all_sessions()
+    app.aboutToQuit.connect(close_sessions)
+    # Отложенная запись настроек выполняется до выхода
+    app.aboutToQuit.connect(config.stop_watching)
     sys.exit(app.exec_())
 
 
@@ -1,4 +1,43 @@
 # modules/__init__.py
-from .screenshot_handler import capture_screen, resize_image, save_effect_template
-from .food_processor import process_food_difference
-from .template_matcher import find_template_in_image
\ No newline at end of file
+# Имена пакета загружаются при первом обращении (PEP 562): импорт одного модуля,
+# например modules.metrics, больше не тянет за собой OpenCV и все остальные модули
+import importlib
+
+_EXPORTS = {
+    "capture_session": ("CaptureSession", "get_capture_session", "close_all_sessions", "set_default_grabber_factory"),
+    "screenshot_handler": ("capture_screen", "capture_regions", "resize_image", "save_effect_template"),
+    "food_processor": ("process_food_difference", "extract_food_changes", "dump_food_changes", "FoodChange"),
+    "template_matcher": ("find_template_in_image", "match_templates", "MatchResult", "TemplateMatcher"),
+    "template_bank": ("TemplateBank", "TemplateEntry", "get_template_bank"),
+    "pipeline": ("DetectionPipeline", "DropOldestQueue"),
+    "auto_food": ("AutoFoodDetector", "FoodCheckResult"),
+    "change_gate": ("FrameChangeGate",),
+    "scheduler": ("AdaptiveScheduler", "FixedIntervalScheduler"),
+    "session_recorder": ("SessionRecorder", "ReplayFrameSource", "read_session", "replay_detection"),
+    "metrics": ("LatencyHistogram", "MetricsRegistry", "get_metrics"),
+    "ui_scale": ("ScaledTemplateCache", "ScaleEstimate", "detect_scale", "scale_for_resolution"),
+    "input_dispatcher": ("InputDispatcher", "KeyPolicy", "PyAutoGuiBackend", "FakeBackend"),
+    "rules": ("RuleEngine", "Rule", "ConditionRule", "AutoFoodRule", "RuleResult", "EngineResult", "rules_from_settings"),
+    "burst_diff": ("FrameBurst", "BurstDiffResult", "capture_burst", "burst_difference", "merge_boxes"),
+    "template_store": ("TemplateStore", "StoreTemplateBank", "TemplateExistsError", "get_template_store",
+                       "get_store_bank", "migrate_legacy_files"),
+    "warmup": ("warm_up", "start_warmup"),
+    "template_dedup": ("phash", "find_duplicates", "find_clusters", "Duplicate", "Cluster"),
+}
+
+_LOCATIONS = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = sorted(_LOCATIONS)
+
+
+def __getattr__(name):
+    module = _LOCATIONS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,211 @@
+import os
+import time
+import logging
+from collections import namedtuple
+
+from utils.paths import TEMPLATES_DIR
+from modules.template_store import get_store_bank
+from modules.template_matcher import find_template_in_image, TemplateMatcher
+from modules.ui_scale import detect_scale, quantize_scale, scale_for_resolution
+from modules.change_gate import FrameChangeGate
+from modules.metrics import get_metrics
+
+logger = logging.getLogger("AlbionHelperLogger")
+
+FOOD_KEY = "2"
+
+# Папки, из которых PNG-шаблоны еды и слотов подтягиваются в хранилище
+FOOD_TEMPLATES_DIR = os.path.join(TEMPLATES_DIR, "food")
+SLOT_TEMPLATES_DIR = os.path.join(TEMPLATES_DIR, "slots")
+
+# Иконки-якоря для калибровки масштаба UI (шаблоны из категории "slots"), по порядку предпочтения
+ANCHOR_TEMPLATES = ("ui_anchor.png", "empty_food_slot.png")
+
+# Сколько полных проверок подряд искать якорь; дальше поиск повторяется реже
+MAX_CALIBRATION_ATTEMPTS = 10
+
+# Интервал повторного поиска якоря после MAX_CALIBRATION_ATTEMPTS неудач, в секундах
+# (якорь empty_food_slot.png виден, только пока слот еды пуст)
+CALIBRATION_RETRY_INTERVAL = 30.0
+
+# Состояния результата проверки
+FOOD_ACTIVE = "food_active"   # эффект еды найден
+SLOT_EMPTY = "slot_empty"     # эффекта нет, но и слот еды пуст
+EAT = "eat"                   # эффекта нет, еда в слоте — нужно нажать клавишу
+UNKNOWN = "unknown"           # проверку выполнить не удалось
+
+# state — одно из состояний выше, match — лучший MatchResult по еде (или None),
+# pressed — была ли нажата клавиша еды
+FoodCheckResult = namedtuple("FoodCheckResult", ["state", "match", "pressed"])
+
+
+class AutoFoodDetector:
+    """
+    Логика авто-еды без привязки к UI: ищет эффект еды в области эффектов,
+    а если его нет — проверяет слот еды и нажимает клавишу.
+    Может выполняться в любом потоке.
+    """
+
+    def __init__(self, food_templates_dir=None, press_key=None, key=FOOD_KEY, scale=None, on_scale=None,
+                 anchors=ANCHOR_TEMPLATES, dispatcher=None, resolution=None, reference_resolution=None):
+        """
+        :param press_key: callable(key) — функция нажатия клавиши (по умолчанию pyautogui.press)
+        :param dispatcher: InputDispatcher — если задан, нажатия идут через него (очередь, debounce,
+                           подтверждение по появлению эффекта), а press_key не используется
+        :param scale: float — откалиброванный масштаб UI; None — определить по якорю на первых кадрах
+        :param on_scale: callable(scale) — вызывается (в потоке детекции), когда масштаб определён
+        :param anchors: имена шаблонов-якорей в категории "slots"
+        :param resolution: str — разрешение экрана ("1920x1080")
+        :param reference_resolution: str — разрешение, на котором сняты шаблоны; вместе с resolution
+                                     задаёт масштаб, пока якорь не найден (см. scale_for_resolution)
+        """
+        self.food_templates_dir = food_templates_dir or FOOD_TEMPLATES_DIR
+        # Шаблоны берутся из хранилища; PNG, положенные в папки вручную, подтягиваются в него
+        self.food_bank = get_store_bank("food", self.food_templates_dir)
+        self.slots_bank = get_store_bank("slots", SLOT_TEMPLATES_DIR)
+        # Матчер запоминает, где еда была найдена, и сначала ищет там
+        fallback = None
+        if scale is None and resolution and reference_resolution:
+            fallback = scale_for_resolution(resolution, reference_resolution)
+        self.matcher = TemplateMatcher(scale=scale or fallback or 1.0)
+        self.calibrated = scale is not None
+        self.anchors = anchors
+        self._on_scale = on_scale
+        self._calibration_attempts = 0
+        self._next_calibration = 0.0
+        # Пропуск матчинга, если кадры не изменились с прошлой проверки
+        self.gate = FrameChangeGate()
+        self.last_result = None
+        self._last_versions = None
+        self.key = key
+        self._press_key = press_key
+        self.dispatcher = dispatcher
+        if dispatcher is not None:
+            # Появление эффекта еды подтверждает нажатие; без него нажатие повторяется
+            dispatcher.expect_confirmation(key)
+        self._detected_at = None
+
+    def press(self):
+        """:return: bool — нажатие выполнено или принято в очередь"""
+        if self.dispatcher is not None:
+            return self.dispatcher.press(self.key, detected_at=self._detected_at)
+        if self._press_key is None:
+            import pyautogui
+            self._press_key = pyautogui.press
+        self._press_key(self.key)
+        return True
+
+    @property
+    def scale(self):
+        return self.matcher.scale
+
+    def set_scale(self, scale):
+        """Задаёт масштаб UI вручную (например, из настроек) и отключает автокалибровку"""
+        if self.calibrated and quantize_scale(scale) == self.scale:
+            return
+        self.matcher.set_scale(scale)
+        self.calibrated = True
+        self.last_result = None
+
+    def recalibrate(self):
+        """Сбрасывает калибровку: масштаб будет заново определён по якорю"""
+        self.calibrated = False
+        self._calibration_attempts = 0
+        self._next_calibration = 0.0
+        self.last_result = None
+
+    def _calibrate(self, frames):
+        """Пытается определить масштаб UI по якорю на кадрах; :return: bool — успех"""
+        self._calibration_attempts += 1
+        for name in self.anchors:
+            anchor = self.slots_bank.get(name)
+            if anchor is None:
+                continue
+            for frame in frames:
+                if frame is None:
+                    continue
+                estimate = detect_scale(frame, anchor)
+                if estimate is not None:
+                    logger.info(f"📏 Масштаб UI определён по {name}: {estimate.scale:.2f} (score={estimate.score:.2f})")
+                    self.set_scale(estimate.scale)
+                    if self._on_scale is not None:
+                        self._on_scale(estimate.scale)
+                    return True
+        if self._calibration_attempts >= MAX_CALIBRATION_ATTEMPTS:
+            if self._calibration_attempts == MAX_CALIBRATION_ATTEMPTS:
+                logger.warning(f"⚠️ Якорь для калибровки не найден, пока используется масштаб {self.scale:.2f}; "
+                               f"поиск повторяется раз в {CALIBRATION_RETRY_INTERVAL:.0f} с")
+            self._next_calibration = time.monotonic() + CALIBRATION_RETRY_INTERVAL
+        return False
+
+    def check(self, img_effects, img_food_slot):
+        """
+        Одна проверка по кадрам области эффектов и слота еды.
+        Если кадры не изменились с прошлой проверки, а её итог не требовал действий,
+        матчинг пропускается и возвращается прошлый результат.
+        :return: FoodCheckResult
+        """
+        if img_effects is None:
+            logger.warning("⚠️ Не удалось сделать скриншот области эффектов")
+            return FoodCheckResult(UNKNOWN, None, False)
+
+        frames = [img_effects] if img_food_slot is None else [img_effects, img_food_slot]
+        changed = self.gate.changed(*frames)
+        versions = (self.food_bank.refresh().version, self.slots_bank.refresh().version)
+        if (not changed and versions == self._last_versions and self.last_result is not None
+                and self.last_result.state in (FOOD_ACTIVE, SLOT_EMPTY)):
+            logger.debug(f"⏭️ Кадр не изменился, пропускаем матчинг ({self.gate.skip_ratio:.0%} пропусков)")
+            return self.last_result
+
+        self._last_versions = versions
+        self.last_result = self._detect(img_effects, img_food_slot)
+        return self.last_result
+
+    def _detect(self, img_effects, img_food_slot):
+        """Полная проверка: матчинг еды и, при необходимости, слота"""
+        self._detected_at = time.monotonic()
+        if not self.calibrated and self._detected_at >= self._next_calibration:
+            self._calibrate((img_food_slot, img_effects))
+        results = self.matcher.match(img_effects, self.food_bank.entries(), first_hit=True)
+        best = results[0] if results else None
+        if best is not None and best.matched:
+            logger.info(f"✅ Еда найдена: {best.template_id} (score={best.score:.2f}, bbox={best.bbox})")
+            if self.dispatcher is not None:
+                self.dispatcher.confirm(self.key)
+            return FoodCheckResult(FOOD_ACTIVE, best, False)
+        if best is not None:
+            logger.info(f"🔍 Лучшее совпадение еды: {best.template_id} (score={best.score:.2f})")
+
+        logger.info("🍽️ Еда не найдена. Проверяю слот еды...")
+        if img_food_slot is None:
+            logger.warning("⚠️ Не удалось сделать скриншот слота еды")
+            return FoodCheckResult(UNKNOWN, best, False)
+
+        empty_food_template = self.slots_bank.get("empty_food_slot.png")
+        if empty_food_template is not None:
+            empty_food_template = self.matcher.scale_cache.entry(empty_food_template, self.scale)
+        if empty_food_template is None:
+            logger.warning("⚠️ Шаблон empty_food_slot.png не найден")
+            return FoodCheckResult(UNKNOWN, best, False)
+
+        with get_metrics().timer("slot_check"):
+            slot_empty = find_template_in_image(img_food_slot, empty_food_template)
+        if slot_empty:
+            logger.info("❌ Слот еды пуст")
+            return FoodCheckResult(SLOT_EMPTY, best, False)
+
+        if self.dispatcher is not None and self.dispatcher.pending(self.key):
+            logger.info(f"⏳ Ждём подтверждения прошлого нажатия '{self.key}'")
+            return FoodCheckResult(EAT, best, False)
+        logger.info(f"🟢 Еда найдена в слоте. Нажимаем '{self.key}'")
+        if self.dispatcher is not None:
+            # Нажатие выполнит поток диспетчера; время отправки пишется там же
+            return FoodCheckResult(EAT, best, self.press())
+        with get_metrics().timer("key_dispatch"):
+            self.press()
+        return FoodCheckResult(EAT, best, True)
+
+    def __call__(self, frames):
+        """Точка входа для DetectionPipeline: frames = [эффекты, слот еды]"""
+        img_effects, img_food_slot = frames
+        return self.check(img_effects, img_food_slot)
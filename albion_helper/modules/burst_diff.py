@@ -0,0 +1,168 @@
+"""
+Поиск эффекта еды по сериям кадров (burst) до и после еды.
+
+Вместо сравнения двух одиночных скриншотов снимается N кадров до и N кадров после.
+Для каждой серии считаются попиксельные медиана и разброс по времени:
+- медиана убирает то, что мелькнуло на одном-двух кадрах (курсор, всплывающий текст);
+- большой разброс внутри серии означает анимацию (откат умений, мигающие иконки) —
+  такие пиксели не считаются изменением.
+Изменением считается только то, что стабильно отличается между медианами серий.
+"""
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# Параметры серии по умолчанию
+BURST_FRAMES = 8
+BURST_INTERVAL = 0.1
+
+# Порог разницы медиан (в оттенках серого), как в image_comparer
+DIFF_THRESHOLD = 30
+
+# Максимальное стандартное отклонение пикселя внутри серии, при котором он считается неподвижным
+MAX_STD = 12.0
+
+# Минимальная площадь изменённой области и зазор, при котором соседние области сливаются, в пикселях
+MIN_AREA = 100
+MERGE_GAP = 4
+
+# boxes — список (x, y, w, h); mask — маска стабильных изменений (uint8, 0/255);
+# before/after — медианные BGR-кадры серий (из after удобно вырезать шаблоны)
+BurstDiffResult = namedtuple("BurstDiffResult", ["boxes", "mask", "before", "after"])
+
+
+class FrameBurst:
+    """
+    Серия кадров одной области в заранее выделенном массиве (count, height, width, 3).
+    Кадры копируются в массив, поэтому источник может переиспользовать свой буфер.
+    """
+
+    def __init__(self, count, height, width):
+        self.frames = np.empty((count, height, width, 3), dtype=np.uint8)
+        self.filled = 0
+
+    @property
+    def full(self):
+        return self.filled >= len(self.frames)
+
+    def add(self, frame):
+        """
+        Добавляет кадр; лишние кадры сверх count игнорируются.
+        :return: bool — заполнена ли серия
+        """
+        if not self.full:
+            np.copyto(self.frames[self.filled], frame)
+            self.filled += 1
+        return self.full
+
+    def reset(self):
+        self.filled = 0
+
+    def stack(self):
+        """Заполненная часть серии (view)"""
+        return self.frames[:self.filled]
+
+
+def capture_burst(grab, count=BURST_FRAMES, interval=BURST_INTERVAL):
+    """
+    Снимает серию, блокируя вызывающий поток на (count - 1) * interval секунд.
+    :param grab: callable() -> np.ndarray — захват одного BGR-кадра
+    :return: FrameBurst
+    """
+    first = grab()
+    burst = FrameBurst(count, *first.shape[:2])
+    burst.add(first)
+    while not burst.full:
+        time.sleep(interval)
+        burst.add(grab())
+    return burst
+
+
+def temporal_stats(stack):
+    """
+    Попиксельные медиана и стандартное отклонение серии.
+    :param stack: np.ndarray (N, h, w, 3) uint8
+    :return: (медиана BGR uint8 (h, w, 3), std яркости float32 (h, w))
+    """
+    median = np.median(stack, axis=0).astype(np.uint8)
+    n, h, w = stack.shape[:3]
+    gray = np.empty((n, h, w), dtype=np.uint8)
+    for i in range(n):
+        cv2.cvtColor(stack[i], cv2.COLOR_BGR2GRAY, dst=gray[i])
+    std = gray.std(axis=0, dtype=np.float32)
+    return median, std
+
+
+def merge_boxes(boxes, gap=MERGE_GAP):
+    """
+    Сливает пересекающиеся (или ближе gap пикселей) прямоугольники, пока есть что сливать.
+    :param boxes: list[(x, y, w, h)]
+    :return: list[(x, y, w, h)] — отсортированы слева направо
+    """
+    rects = [[x, y, x + w, y + h] for x, y, w, h in boxes]
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for rect in rects:
+            for other in result:
+                if (rect[0] <= other[2] + gap and other[0] <= rect[2] + gap
+                        and rect[1] <= other[3] + gap and other[1] <= rect[3] + gap):
+                    other[0], other[1] = min(other[0], rect[0]), min(other[1], rect[1])
+                    other[2], other[3] = max(other[2], rect[2]), max(other[3], rect[3])
+                    merged = True
+                    break
+            else:
+                result.append(rect)
+        rects = result
+    return sorted(((x1, y1, x2 - x1, y2 - y1) for x1, y1, x2, y2 in rects), key=lambda b: (b[0], b[1]))
+
+
+def burst_difference(before, after, threshold=DIFF_THRESHOLD, max_std=MAX_STD,
+                     min_area=MIN_AREA, gap=MERGE_GAP):
+    """
+    Находит области, стабильно изменившиеся между сериями до и после еды.
+    :param before: FrameBurst или np.ndarray (N, h, w, 3) — серия до еды
+    :param after: FrameBurst или np.ndarray (N, h, w, 3) — серия после еды
+    :return: BurstDiffResult
+    """
+    before_stack = before.stack() if isinstance(before, FrameBurst) else before
+    after_stack = after.stack() if isinstance(after, FrameBurst) else after
+    if before_stack.shape[1:] != after_stack.shape[1:]:
+        raise ValueError("Размеры кадров серий не совпадают")
+
+    return stable_difference(temporal_stats(before_stack), temporal_stats(after_stack),
+                             threshold, max_std, min_area, gap)
+
+
+def stable_difference(before_stats, after_stats, threshold=DIFF_THRESHOLD, max_std=MAX_STD,
+                      min_area=MIN_AREA, gap=MERGE_GAP):
+    """
+    То же, что burst_difference, по уже посчитанным temporal_stats серий.
+    :param before_stats: (медиана, std) серии до еды
+    :param after_stats: (медиана, std) серии после еды
+    :return: BurstDiffResult
+    """
+    median_before, std_before = before_stats
+    median_after, std_after = after_stats
+    diff = cv2.absdiff(cv2.cvtColor(median_before, cv2.COLOR_BGR2GRAY),
+                       cv2.cvtColor(median_after, cv2.COLOR_BGR2GRAY))
+    stable = (diff > threshold) & (std_before <= max_std) & (std_after <= max_std)
+    mask = stable.astype(np.uint8) * 255
+    # Заполняем мелкие дыры внутри иконок, чтобы одна иконка давала одну область
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((3, 3), np.uint8))
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = [cv2.boundingRect(c) for c in contours]
+    boxes = [b for b in merge_boxes(boxes, gap) if b[2] * b[3] >= min_area]
+    return BurstDiffResult(boxes, mask, median_before, median_after)
+
+
+def draw_boxes(image, boxes, color=(0, 255, 0)):
+    """Копия изображения с нарисованными областями (для food_diff.png)"""
+    result = image.copy()
+    for x, y, w, h in boxes:
+        cv2.rectangle(result, (x, y), (x + w, y + h), color, 2)
+    return result
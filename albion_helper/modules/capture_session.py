@@ -0,0 +1,199 @@
+import threading
+import weakref
+
+import mss
+import numpy as np
+import cv2
+
+from config.service import Region
+from modules.metrics import get_metrics
+
+# Если объединяющий прямоугольник больше суммы площадей областей во столько раз,
+# области захватываются по отдельности
+MAX_UNION_WASTE = 2.0
+
+
+def as_rect(region):
+    """
+    Приводит область к кортежу (x, y, width, height).
+    Принимает Region (уже проверенный, возвращается как есть), кортеж/список
+    или словарь формата settings.json
+    """
+    if type(region) is Region:
+        return region
+    if isinstance(region, dict):
+        return (int(region.get("x", 0)), int(region.get("y", 0)),
+                int(region.get("width", 100)), int(region.get("height", 100)))
+    x, y, width, height = region
+    return int(x), int(y), int(width), int(height)
+
+
+def union_rect(rects):
+    """Возвращает ограничивающий прямоугольник для списка (x, y, width, height)"""
+    left = min(r[0] for r in rects)
+    top = min(r[1] for r in rects)
+    right = max(r[0] + r[2] for r in rects)
+    bottom = max(r[1] + r[3] for r in rects)
+    return left, top, right - left, bottom - top
+
+
+class CaptureSession:
+    """
+    Долгоживущая сессия захвата экрана.
+    Держит одно подключение к дисплею (mss),
+    вместо того чтобы открывать и закрывать mss на каждый скриншот.
+
+    Сессия привязана к потоку, в котором создана: mss хранит контексты
+    устройства per-thread, поэтому grab() из чужого потока запрещён.
+    Для получения сессии текущего потока используйте get_capture_session().
+    """
+
+    def __init__(self, grabber_factory=None):
+        """
+        :param grabber_factory: callable — фабрика объекта захвата (по умолчанию mss.mss),
+                                 позволяет подставить заглушку в бенчмарках
+        """
+        self._grabber_factory = grabber_factory or mss.mss
+        self._grabber = None
+        self._owner = threading.get_ident()
+        self.closed = False
+
+    @property
+    def grabber(self):
+        """Лениво открывает подключение к дисплею"""
+        if self.closed:
+            raise RuntimeError("CaptureSession уже закрыта")
+        if self._grabber is None:
+            self._grabber = self._grabber_factory()
+        return self._grabber
+
+    @property
+    def monitors(self):
+        return getattr(self.grabber, "monitors", [])
+
+    def _check_thread(self):
+        if threading.get_ident() != self._owner:
+            raise RuntimeError("CaptureSession используется не из того потока, в котором создана")
+
+    def grab(self, x=0, y=0, width=100, height=100):
+        """
+        Делает скриншот области и возвращает BGR-изображение.
+        :return: np.ndarray (height, width, 3)
+        """
+        self._check_thread()
+        monitor = {"top": y, "left": x, "width": width, "height": height}
+        screenshot = self.grabber.grab(monitor)
+
+        # Смотрим на сырой BGRA-буфер без копирования
+        bgra = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)
+
+        with get_metrics().timer("color_convert"):
+            return cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR)
+
+    def _monitor_index(self, rect):
+        """Номер монитора, в который попадает левый верхний угол области (-1 — не найден)"""
+        monitors = self.monitors
+        # monitors[0] — общий прямоугольник всех мониторов, отдельные начинаются с 1
+        for idx, mon in enumerate(monitors[1:], start=1):
+            if (mon["left"] <= rect[0] < mon["left"] + mon["width"]
+                    and mon["top"] <= rect[1] < mon["top"] + mon["height"]):
+                return idx
+        return -1
+
+    def grab_regions(self, regions, max_waste=MAX_UNION_WASTE):
+        """
+        Захватывает несколько областей за один grab на каждый монитор.
+        Возвращает список BGR-представлений (views) общего кадра в порядке regions —
+        без копирования, все области сняты в один момент.
+        Если области далеко друг от друга и общий прямоугольник слишком велик,
+        каждая область захватывается отдельно.
+        :param regions: list — области в виде (x, y, width, height) или словарей из settings.json
+        :param max_waste: float — допустимое отношение площади объединения к сумме площадей
+        :return: list[np.ndarray]
+        """
+        rects = [as_rect(r) for r in regions]
+        results = [None] * len(rects)
+
+        groups = {}
+        if len(self.monitors) > 2:
+            for idx, rect in enumerate(rects):
+                groups.setdefault(self._monitor_index(rect), []).append(idx)
+        else:
+            groups[0] = list(range(len(rects)))
+
+        for indices in groups.values():
+            group_rects = [rects[i] for i in indices]
+            union = union_rect(group_rects)
+            area_sum = sum(r[2] * r[3] for r in group_rects)
+
+            if len(indices) == 1 or union[2] * union[3] > max_waste * area_sum:
+                for i in indices:
+                    results[i] = self.grab(*rects[i])
+                continue
+
+            frame = self.grab(*union)
+            for i in indices:
+                x, y, width, height = rects[i]
+                dx, dy = x - union[0], y - union[1]
+                results[i] = frame[dy:dy + height, dx:dx + width]
+
+        return results
+
+    def close(self):
+        """Закрывает подключение к дисплею"""
+        if self.closed:
+            return
+        self.closed = True
+        if self._grabber is not None:
+            try:
+                self._grabber.close()
+            finally:
+                self._grabber = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+_thread_local = threading.local()
+_all_sessions = weakref.WeakSet()
+_sessions_lock = threading.Lock()
+_default_grabber_factory = None
+
+
+def set_default_grabber_factory(factory):
+    """
+    Меняет источник кадров для всех новых сессий (None — снова mss).
+    Открытые сессии закрываются, и каждый поток при следующем вызове
+    get_capture_session() получит сессию с новой фабрикой.
+    Используется бенчмарками и воспроизведением записанных сессий.
+    """
+    global _default_grabber_factory
+    _default_grabber_factory = factory
+    close_all_sessions()
+
+
+def get_capture_session():
+    """
+    Возвращает сессию захвата текущего потока, создавая её при первом вызове
+    """
+    session = getattr(_thread_local, "session", None)
+    if session is None or session.closed:
+        session = CaptureSession(grabber_factory=_default_grabber_factory)
+        _thread_local.session = session
+        with _sessions_lock:
+            _all_sessions.add(session)
+    return session
+
+
+def close_all_sessions():
+    """
+    Закрывает все открытые сессии захвата (вызывается при завершении программы)
+    """
+    with _sessions_lock:
+        sessions = list(_all_sessions)
+        _all_sessions.clear()
+    for session in sessions:
+        session.close()
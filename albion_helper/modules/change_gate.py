@@ -0,0 +1,66 @@
+import cv2
+import numpy as np
+
+# Во сколько раз уменьшаются кадры перед сравнением
+DOWNSAMPLE = 4
+
+# Минимальное изменение яркости пикселя уменьшенного кадра, которое считается изменением
+PIXEL_DELTA = 16
+
+# Сколько пикселей уменьшенного кадра должно измениться, чтобы кадр считался новым
+MIN_CHANGED_PIXELS = 4
+
+
+class FrameChangeGate:
+    """
+    Дешёвый детектор изменений перед матчером.
+    Кадры уменьшаются в DOWNSAMPLE раз в оттенках серого и сравниваются
+    с предыдущими по порогу: если изменилось меньше MIN_CHANGED_PIXELS пикселей,
+    кадр считается прежним и матчинг можно пропустить.
+    """
+
+    def __init__(self, downsample=DOWNSAMPLE, pixel_delta=PIXEL_DELTA, min_changed_pixels=MIN_CHANGED_PIXELS):
+        self.downsample = downsample
+        self.pixel_delta = pixel_delta
+        self.min_changed_pixels = min_changed_pixels
+        self._previous = None
+        self.checks = 0
+        self.skipped = 0
+
+    def _signature(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        h, w = gray.shape[:2]
+        size = (max(1, w // self.downsample), max(1, h // self.downsample))
+        return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+    def changed(self, *frames):
+        """
+        Сравнивает кадры с предыдущим вызовом.
+        :param frames: np.ndarray — один или несколько кадров (например, эффекты и слот еды)
+        :return: bool — True, если кадры заметно изменились (или это первый вызов)
+        """
+        self.checks += 1
+        signature = [self._signature(f) for f in frames]
+        previous, self._previous = self._previous, signature
+
+        if previous is None or len(previous) != len(signature):
+            return True
+
+        for old, new in zip(previous, signature):
+            if old.shape != new.shape:
+                return True
+            diff = cv2.absdiff(old, new)
+            if np.count_nonzero(diff > self.pixel_delta) >= self.min_changed_pixels:
+                return True
+
+        self.skipped += 1
+        return False
+
+    def reset(self):
+        """Забывает предыдущий кадр — следующий вызов changed() вернёт True"""
+        self._previous = None
+
+    @property
+    def skip_ratio(self):
+        """Доля проверок, на которых кадр не изменился"""
+        return self.skipped / self.checks if self.checks else 0.0
@@ -1,55 +1,101 @@
 import os
+import logging
+from collections import namedtuple
 import cv2
 from modules.image_comparer import find_image_difference
-from utils.logger import setup_logger
 
-logger = setup_logger()
+logger = logging.getLogger("AlbionHelperLogger")
 
-def process_food_difference(before_image_path, after_image_path, output_dir=None):
+# Найденное изменение: index — номер, bbox — (x, y, w, h) в области, image — BGR-вырезка из кадра «после»
+FoodChange = namedtuple("FoodChange", ["index", "bbox", "image"])
+
+
+def _as_image(image):
+    """Путь к файлу или уже загруженный BGR-кадр"""
+    if isinstance(image, str):
+        return cv2.imread(image)
+    return image
+
+
+def extract_food_changes(before, after, boxes=None):
     """
-    Сравнивает два изображения (до и после еды), находит изменения,
-    сохраняет food_diff и обрезанные изображения изменений.
-    :param before_image_path: str — путь к скриншоту до еды
-    :param after_image_path: str — путь к скриншоту после еды
-    :param output_dir: str — папка для сохранения результатов
-    :return: list[str] — список путей к обрезанным изображениям
+    Находит изменения между кадрами до и после еды и вырезает их в памяти, без записи на диск.
+    :param before: np.ndarray или str — кадр до еды (или путь к нему)
+    :param after: np.ndarray или str — кадр после еды (или путь к нему)
+    :param boxes: list[(x, y, w, h)] — готовые области (например, из burst_difference);
+                  None — искать через find_image_difference
+    :return: (list[FoodChange], np.ndarray или None — кадр с отмеченными областями)
     """
-    if output_dir is None:
-        output_dir = os.path.join("data", "templates", "temp", "diff")
+    img_before = _as_image(before)
+    img_after = _as_image(after)
+    if img_before is None or img_after is None:
+        logger.error("❌ Не удалось загрузить одно или оба изображения")
+        return [], None
+
+    if boxes is None:
+        boxes, result_img = find_image_difference(img_before, img_after)
+    else:
+        result_img = img_after.copy()
+        for x, y, w, h in boxes:
+            cv2.rectangle(result_img, (x, y), (x + w, y + h), (0, 255, 0), 2)
+
+    # Вырезки копируются, чтобы не держать весь кадр и не зависеть от его дальнейших изменений
+    changes = [FoodChange(idx, (x, y, w, h), img_after[y:y + h, x:x + w].copy())
+               for idx, (x, y, w, h) in enumerate(boxes)]
+    return changes, result_img
 
+
+def dump_food_changes(changes, result_img, output_dir, before=None, after=None):
+    """
+    Отладочный дамп: food_diff.png, change_{idx}.png и (если переданы) кадры до/после.
+    :return: list[str] — пути к вырезкам
+    """
     os.makedirs(output_dir, exist_ok=True)
 
     # Очищаем папку перед новым сохранением
     for f in os.listdir(output_dir):
         os.remove(os.path.join(output_dir, f))
 
-    # Загружаем изображения
-    img_before = cv2.imread(before_image_path)
-    img_after = cv2.imread(after_image_path)
-
-    if img_before is None or img_after is None:
-        logger.error("❌ Не удалось загрузить одно или оба изображения")
-        return []
-
-    # Используем готовую функцию для поиска различий
-    bounding_boxes, result_img = find_image_difference(img_before, img_after)
-
-    if not bounding_boxes:
-        logger.info("🔍 Изменений не найдено")
-        return []
+    if before is not None:
+        cv2.imwrite(os.path.join(output_dir, "before_food.png"), before)
+    if after is not None:
+        cv2.imwrite(os.path.join(output_dir, "after_food.png"), after)
 
     # 1. Сохраняем изображение с разницей (food_diff)
-    food_diff_path = os.path.join(output_dir, "food_diff.png")
-    cv2.imwrite(food_diff_path, result_img)
-    logger.info(f"✅ Изображение разницы сохранено: {food_diff_path}")
+    if result_img is not None:
+        food_diff_path = os.path.join(output_dir, "food_diff.png")
+        cv2.imwrite(food_diff_path, result_img)
+        logger.info(f"✅ Изображение разницы сохранено: {food_diff_path}")
 
-    # 2. Обрезаем и сохраняем каждую найденную область
+    # 2. Сохраняем каждую найденную область
     saved_paths = []
-    for idx, (x, y, w, h) in enumerate(bounding_boxes):
-        cropped = img_after[y:y + h, x:x + w]
-        cropped_path = os.path.join(output_dir, f"change_{idx}.png")
-        cv2.imwrite(cropped_path, cropped)
-        logger.info(f"✅ Область изменения [{idx}] сохранена: {cropped_path}")
+    for change in changes:
+        cropped_path = os.path.join(output_dir, f"change_{change.index}.png")
+        cv2.imwrite(cropped_path, change.image)
+        logger.info(f"✅ Область изменения [{change.index}] сохранена: {cropped_path}")
         saved_paths.append(cropped_path)
+    return saved_paths
+
+
+def process_food_difference(before_image_path, after_image_path, output_dir=None):
+    """
+    Сравнивает два изображения (до и после еды), находит изменения,
+    сохраняет food_diff и обрезанные изображения изменений.
+    Для работы без диска используйте extract_food_changes.
+    :param before_image_path: str или np.ndarray — скриншот до еды
+    :param after_image_path: str или np.ndarray — скриншот после еды
+    :param output_dir: str — папка для сохранения результатов
+    :return: list[str] — список путей к обрезанным изображениям
+    """
+    if output_dir is None:
+        output_dir = os.path.join("data", "templates", "temp", "diff")
+
+    changes, result_img = extract_food_changes(before_image_path, after_image_path)
+    if not changes:
+        if result_img is not None:
+            logger.info("🔍 Изменений не найдено")
+        # Старые вырезки в папке не должны выглядеть как новый результат
+        dump_food_changes([], None, output_dir)
+        return []
 
-    return saved_paths
\ No newline at end of file
+    return dump_food_changes(changes, result_img, output_dir)
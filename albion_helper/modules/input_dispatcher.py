@@ -0,0 +1,293 @@
+"""
+Неблокирующая отправка нажатий клавиш.
+
+Детекторы и правила только ставят нажатие в очередь (dispatcher.press), а сама
+клавиша нажимается в отдельном потоке. Для каждой клавиши действуют:
+- debounce — повторный запрос в течение debounce секунд отбрасывается;
+- ожидание подтверждения — после нажатия клавиша не нажимается снова, пока детектор
+  не подтвердит результат (dispatcher.confirm, например эффект еды появился);
+  без подтверждения за confirm_timeout нажатие повторяется до max_retries раз
+  с нарастающим (backoff) ожиданием;
+- cooldown — после подтверждения клавиша молчит ещё cooldown секунд.
+
+Задержки «детекция -> нажатие -> подтверждение» пишутся в гистограммы metrics:
+input_queue, input_confirm и reaction.
+"""
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+from modules.metrics import get_metrics
+
+logger = logging.getLogger("AlbionHelperLogger")
+
+# Значения политики клавиши по умолчанию, в секундах
+DEBOUNCE = 0.3
+COOLDOWN = 0.0
+CONFIRM_TIMEOUT = 3.0
+MAX_RETRIES = 2
+BACKOFF = 2.0
+
+# debounce/cooldown/confirm_timeout — секунды; confirm_timeout=None — подтверждение не ждём;
+# backoff — во сколько раз растёт ожидание подтверждения с каждым повтором
+KeyPolicy = namedtuple("KeyPolicy", ["debounce", "cooldown", "confirm_timeout", "max_retries", "backoff"])
+
+# По умолчанию подтверждение не ждём: его умеет давать не каждый детектор
+DEFAULT_POLICY = KeyPolicy(DEBOUNCE, COOLDOWN, None, MAX_RETRIES, BACKOFF)
+
+
+def policy_from_settings(settings, base=DEFAULT_POLICY):
+    """KeyPolicy из словаря настроек (поля, которых нет, берутся из base)"""
+    values = base._asdict()
+    for field in KeyPolicy._fields:
+        if field in settings:
+            value = settings[field]
+            values[field] = None if value is None else (int(value) if field == "max_retries" else float(value))
+    return KeyPolicy(**values)
+
+
+class PyAutoGuiBackend:
+    """Настоящая клавиатура через pyautogui (без встроенной паузы pyautogui.PAUSE)"""
+
+    def __init__(self):
+        self._pyautogui = None
+
+    def press(self, key):
+        if self._pyautogui is None:
+            import pyautogui
+            self._pyautogui = pyautogui
+        self._pyautogui.press(key, _pause=False)
+
+
+class FakeBackend:
+    """
+    Клавиатура-заглушка: запоминает нажатия (для тестов, воспроизведения записей
+    и работы без дисплея).
+    """
+
+    def __init__(self, on_press=None, clock=time.monotonic):
+        self.on_press = on_press
+        self.clock = clock
+        self.presses = []
+
+    def press(self, key):
+        self.presses.append((self.clock(), key))
+        if self.on_press is not None:
+            self.on_press(key)
+
+
+class _KeyState:
+    __slots__ = ("last_request", "queued", "pressed_at", "detected_at", "attempts", "deadline", "cooldown_until")
+
+    def __init__(self):
+        self.last_request = None
+        self.queued = False
+        self.pressed_at = None     # время первого нажатия, ожидающего подтверждения
+        self.detected_at = None
+        self.attempts = 0
+        self.deadline = None       # когда повторить нажатие без подтверждения
+        self.cooldown_until = 0.0
+
+
+class InputDispatcher:
+    """
+    Очередь нажатий с политиками по клавишам (см. описание модуля).
+    press() и confirm() можно вызывать из любого потока; они не блокируются.
+    """
+
+    def __init__(self, backend=None, policies=None, default_policy=DEFAULT_POLICY, clock=time.monotonic):
+        """
+        :param backend: объект с press(key) — по умолчанию PyAutoGuiBackend
+        :param policies: dict — клавиша -> KeyPolicy
+        """
+        self.backend = backend or PyAutoGuiBackend()
+        self.policies = dict(policies or {})
+        self.default_policy = default_policy
+        self.clock = clock
+        self._queue = deque()
+        self._states = {}
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self.stats = {"requested": 0, "pressed": 0, "debounced": 0, "suppressed": 0,
+                      "retries": 0, "confirmed": 0, "failed": 0}
+
+    @classmethod
+    def from_settings(cls, settings, **kwargs):
+        """
+        Диспетчер из секции "input" в settings.json:
+            {"default": {"debounce": 0.3}, "keys": {"2": {"cooldown": 5, "confirm_timeout": 3}}}
+        """
+        default = policy_from_settings(settings.get("default", {}))
+        policies = {str(key): policy_from_settings(spec, default) for key, spec in settings.get("keys", {}).items()}
+        return cls(policies=policies, default_policy=default, **kwargs)
+
+    def policy(self, key):
+        return self.policies.get(key, self.default_policy)
+
+    def expect_confirmation(self, key, timeout=CONFIRM_TIMEOUT):
+        """
+        Включает ожидание подтверждения для клавиши, если её политика не задана явно
+        (вызывает детектор, который умеет подтверждать свои нажатия).
+        """
+        if key not in self.policies:
+            self.policies[key] = self.default_policy._replace(confirm_timeout=timeout)
+
+    def _state(self, key):
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _KeyState()
+        return state
+
+    # --- запуск ---
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+            self._stop = False
+        self._thread = threading.Thread(target=self._loop, name="input-dispatch", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        with self._cond:
+            self._stop = True
+            self._queue.clear()
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # --- запросы ---
+
+    def press(self, key, detected_at=None):
+        """
+        Ставит нажатие в очередь.
+        :param detected_at: float — время (по clock), когда детектор решил нажать; для метрики reaction
+        :return: bool — принят ли запрос (False — отброшен политикой клавиши)
+        """
+        now = self.clock()
+        policy = self.policy(key)
+        with self._cond:
+            self.stats["requested"] += 1
+            state = self._state(key)
+            if state.last_request is not None and now - state.last_request < policy.debounce:
+                self.stats["debounced"] += 1
+                return False
+            state.last_request = now
+            if state.queued or state.pressed_at is not None or now < state.cooldown_until:
+                # Ждём подтверждения прошлого нажатия или идёт откат
+                self.stats["suppressed"] += 1
+                return False
+            state.detected_at = detected_at if detected_at is not None else now
+            state.attempts = 0
+            state.queued = True
+            self._queue.append((key, now))
+            self._cond.notify()
+        return True
+
+    def confirm(self, key):
+        """
+        Детектор подтверждает, что нажатие сработало (например, появился эффект).
+        :return: bool — было ли нажатие, ожидающее подтверждения
+        """
+        now = self.clock()
+        with self._cond:
+            state = self._states.get(key)
+            if state is None or state.pressed_at is None:
+                return False
+            metrics = get_metrics()
+            metrics.observe("input_confirm", now - state.pressed_at)
+            metrics.observe("reaction", now - state.detected_at)
+            state.pressed_at = None
+            state.deadline = None
+            state.cooldown_until = now + self.policy(key).cooldown
+            self.stats["confirmed"] += 1
+            self._cond.notify()
+        return True
+
+    def pending(self, key):
+        """Стоит ли клавиша в очереди или ожидает подтверждения"""
+        with self._cond:
+            state = self._states.get(key)
+            return state is not None and (state.queued or state.pressed_at is not None)
+
+    # --- поток отправки ---
+
+    def _next_retry(self):
+        """(клавиша, время) ближайшего повтора или None"""
+        deadlines = [(s.deadline, k) for k, s in self._states.items() if s.deadline is not None]
+        if not deadlines:
+            return None
+        deadline, key = min(deadlines)
+        return key, deadline
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._stop:
+                    if self._queue:
+                        key, requested_at = self._queue.popleft()
+                        self._states[key].queued = False
+                        retry = False
+                        break
+                    next_retry = self._next_retry()
+                    now = self.clock()
+                    if next_retry is not None and next_retry[1] <= now:
+                        key, requested_at = next_retry[0], now
+                        retry = self._retry_due(key, now)
+                        if retry is None:
+                            continue
+                        break
+                    self._cond.wait(None if next_retry is None else next_retry[1] - now)
+                else:
+                    return
+            self._send(key, requested_at, retry)
+
+    def _retry_due(self, key, now):
+        """Решает, повторять ли неподтверждённое нажатие (вызывается под блокировкой)"""
+        state = self._states[key]
+        policy = self.policy(key)
+        if state.attempts > policy.max_retries:
+            logger.warning(f"⚠️ Нажатие '{key}' не подтверждено после {state.attempts} попыток")
+            self.stats["failed"] += 1
+            state.pressed_at = None
+            state.deadline = None
+            state.cooldown_until = now + policy.cooldown
+            return None
+        self.stats["retries"] += 1
+        return True
+
+    def _send(self, key, requested_at, retry):
+        metrics = get_metrics()
+        try:
+            with metrics.timer("key_dispatch"):
+                self.backend.press(key)
+        except Exception as e:
+            logger.error(f"❌ Ошибка нажатия клавиши '{key}': {e}")
+            with self._cond:
+                state = self._state(key)
+                state.pressed_at = None
+                state.deadline = None
+            return
+        now = self.clock()
+        if not retry:
+            metrics.observe("input_queue", now - requested_at)
+        policy = self.policy(key)
+        with self._cond:
+            self.stats["pressed"] += 1
+            state = self._state(key)
+            if retry and state.pressed_at is None:
+                # Подтверждение пришло, пока выполнялся повтор
+                return
+            if retry:
+                logger.info(f"🔁 Повторное нажатие '{key}' (попытка {state.attempts + 1})")
+            if policy.confirm_timeout is None:
+                state.cooldown_until = now + policy.cooldown
+                return
+            if state.pressed_at is None:
+                state.pressed_at = now
+            state.deadline = now + policy.confirm_timeout * policy.backoff ** state.attempts
+            state.attempts += 1
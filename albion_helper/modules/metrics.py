@@ -0,0 +1,215 @@
+"""
+Замер времени стадий горячего пути (захват, конвертация цвета, загрузка шаблонов,
+матчинг, проверка слота, нажатие клавиши) в скользящие гистограммы.
+
+    from modules.metrics import get_metrics
+    with get_metrics().timer("capture"):
+        frames = session.grab_regions(regions)
+
+Запись одного замера — пара perf_counter и инкремент счётчика корзины,
+поэтому таймеры можно оставлять в горячем пути постоянно.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+
+from utils.paths import LOGS_DIR
+
+logger = logging.getLogger("AlbionHelperLogger")
+
+# Границы корзин гистограммы в секундах: от 10 мкс до ~10 с с шагом 2^(1/4) (~19%)
+BUCKET_BOUNDS = tuple(1e-5 * 2 ** (i / 4) for i in range(81))
+
+# Гистограмма хранит замеры за последние WINDOW..2*WINDOW секунд
+WINDOW = 60.0
+
+# Как часто сбрасывать снимок метрик в файл, в секундах
+FLUSH_INTERVAL = 30.0
+
+# Имя файла метрик рядом с логами: logs/<дата>/metrics.jsonl
+METRICS_FILENAME = "metrics.jsonl"
+
+
+class _Generation:
+    __slots__ = ("counts", "count", "total", "max", "started")
+
+    def __init__(self, started):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.started = started
+
+
+class LatencyHistogram:
+    """
+    Скользящая гистограмма задержек.
+    Хранит два поколения: текущее и предыдущее; когда текущему исполняется window секунд,
+    предыдущее выбрасывается. Снимок объединяет оба, то есть покрывает последние
+    window..2*window секунд.
+    """
+
+    def __init__(self, window=WINDOW, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self._lock = threading.Lock()
+        now = clock()
+        self._current = _Generation(now)
+        self._previous = _Generation(now)
+        self.total_count = 0
+
+    def observe(self, seconds):
+        now = self.clock()
+        with self._lock:
+            current = self._current
+            if now - current.started >= self.window:
+                self._previous = current
+                current = self._current = _Generation(now)
+            current.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+            current.count += 1
+            current.total += seconds
+            if seconds > current.max:
+                current.max = seconds
+            self.total_count += 1
+
+    def snapshot(self):
+        """
+        :return: dict — count, mean/p50/p90/p99/max в мс (None, если замеров в окне нет)
+        """
+        with self._lock:
+            generations = (self._previous, self._current)
+            count = sum(g.count for g in generations)
+            if not count:
+                return None
+            counts = [a + b for a, b in zip(generations[0].counts, generations[1].counts)]
+            total = sum(g.total for g in generations)
+            maximum = max(g.max for g in generations)
+
+        def percentile(q):
+            rank = q * count
+            seen = 0
+            for idx, n in enumerate(counts):
+                seen += n
+                if seen >= rank:
+                    # Верхняя граница корзины, но не больше реального максимума
+                    bound = BUCKET_BOUNDS[idx] if idx < len(BUCKET_BOUNDS) else maximum
+                    return min(bound, maximum) * 1000
+            return maximum * 1000
+
+        return {
+            "count": count,
+            "mean_ms": total / count * 1000,
+            "p50_ms": percentile(0.5),
+            "p90_ms": percentile(0.9),
+            "p99_ms": percentile(0.99),
+            "max_ms": maximum * 1000,
+        }
+
+
+class _StageTimer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class MetricsRegistry:
+    """
+    Набор именованных гистограмм стадий и периодический сброс снимков в файл.
+    Потокобезопасен: стадии пишутся из потоков конвейера, снимки читает UI.
+    """
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._flush_thread = None
+        self._flush_stop = threading.Event()
+
+    def histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, LatencyHistogram(self.window))
+        return histogram
+
+    def observe(self, name, seconds):
+        self.histogram(name).observe(seconds)
+
+    def timer(self, name):
+        """Контекстный менеджер, замеряющий время блока в гистограмму name"""
+        return _StageTimer(self.histogram(name))
+
+    def snapshot(self):
+        """:return: dict — стадия -> статистика (см. LatencyHistogram.snapshot)"""
+        with self._lock:
+            items = list(self._histograms.items())
+        stages = {}
+        for name, histogram in sorted(items):
+            stats = histogram.snapshot()
+            if stats is not None:
+                stages[name] = stats
+        return stages
+
+    def flush(self, path=None):
+        """
+        Дописывает снимок одной строкой JSON в файл метрик.
+        :param path: str — файл (по умолчанию logs/<дата>/metrics.jsonl)
+        """
+        stages = self.snapshot()
+        if not stages:
+            return
+        if path is None:
+            path = os.path.join(LOGS_DIR, datetime.now().strftime("%Y-%m-%d"), METRICS_FILENAME)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        line = json.dumps({"time": datetime.now().isoformat(timespec="seconds"), "stages": stages})
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def start_flushing(self, interval=FLUSH_INTERVAL, path=None):
+        """Запускает фоновый сброс снимков каждые interval секунд"""
+        if self._flush_thread is not None and self._flush_thread.is_alive():
+            return
+        self._flush_stop.clear()
+
+        def loop():
+            while not self._flush_stop.wait(interval):
+                try:
+                    self.flush(path)
+                except OSError as e:
+                    logger.error(f"❌ Не удалось записать метрики: {e}")
+
+        self._flush_thread = threading.Thread(target=loop, name="metrics-flush", daemon=True)
+        self._flush_thread.start()
+
+    def stop_flushing(self, path=None):
+        """Останавливает фоновый сброс и записывает последний снимок"""
+        if self._flush_thread is None:
+            return
+        self._flush_stop.set()
+        self._flush_thread.join()
+        self._flush_thread = None
+        try:
+            self.flush(path)
+        except OSError as e:
+            logger.error(f"❌ Не удалось записать метрики: {e}")
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics():
+    """Общий на процесс реестр метрик"""
+    return _registry
@@ -0,0 +1,236 @@
+import threading
+import time
+import logging
+from collections import deque
+
+from modules.capture_session import get_capture_session
+from modules.scheduler import FixedIntervalScheduler
+from modules.metrics import get_metrics
+
+logger = logging.getLogger("AlbionHelperLogger")
+
+
+class DropOldestQueue:
+    """
+    Ограниченная очередь между стадиями конвейера.
+    При переполнении выбрасывается самый старый элемент: детектору
+    важен свежий кадр, а не полная история.
+    """
+
+    def __init__(self, maxsize=2):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Возвращает следующий элемент или None, если очередь закрыта или истёк timeout"""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._items.clear()
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+class DetectionPipeline:
+    """
+    Фоновый конвейер «захват → детекция».
+    Стадия захвата в своём потоке снимает области с интервалом capture_interval
+    и отдаёт кадры в on_frames (превью); когда планировщик считает, что пора,
+    кадры кладутся в очередь детектору. Стадия детекции в отдельном потоке вызывает detect(frames)
+    и отдаёт результат в on_result.
+    Колбэки вызываются из рабочих потоков — UI должен пересылать их через сигналы Qt.
+    """
+
+    def __init__(self, regions, detect=None, on_frames=None, on_result=None,
+                 capture_interval=0.5, detect_interval=10.0, queue_size=2, scheduler=None,
+                 frame_source=None, recorder=None):
+        """
+        :param regions: list — области (x, y, width, height) или словари из settings.json
+        :param detect: callable(frames) -> result — функция детекции (None — только захват)
+        :param on_frames: callable(frames) — получает каждый захваченный кадр
+        :param on_result: callable(result) — получает результат детекции
+        :param scheduler: планировщик проверок (см. modules.scheduler);
+                          по умолчанию — постоянный интервал detect_interval
+        :param frame_source: callable(regions) -> frames или None — источник кадров вместо
+                             захвата экрана (например, ReplayFrameSource); None от источника — кадров нет
+        :param recorder: объект с record(frames) — получает каждый захваченный кадр (SessionRecorder)
+        """
+        self._regions = list(regions)
+        self.detect = detect
+        self.on_frames = on_frames
+        self.on_result = on_result
+        self.capture_interval = capture_interval
+        self.scheduler = scheduler or FixedIntervalScheduler(detect_interval)
+        self.frame_source = frame_source
+        self.recorder = recorder
+
+        self._queue_size = queue_size
+        self._queue = DropOldestQueue(queue_size)
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._detect_enabled = False
+        self._preview_enabled = True
+        self._threads = []
+
+    @property
+    def running(self):
+        return any(t.is_alive() for t in self._threads)
+
+    @property
+    def dropped_frames(self):
+        return self._queue.dropped
+
+    def set_regions(self, regions):
+        """Меняет области захвата на лету"""
+        with self._lock:
+            self._regions = list(regions)
+        self._wake.set()
+
+    def set_preview_enabled(self, enabled, capture_interval=None):
+        """
+        Включает/выключает кадры для превью (например, когда окно свёрнуто).
+        Без превью захват выполняется только тогда, когда нужна детекция.
+        """
+        with self._lock:
+            self._preview_enabled = enabled
+            if capture_interval is not None:
+                self.capture_interval = capture_interval
+        self._wake.set()
+
+    def set_detection_enabled(self, enabled):
+        """Включает/выключает передачу кадров детектору (захват для превью продолжается)"""
+        with self._lock:
+            self._detect_enabled = enabled
+        if enabled:
+            self.scheduler.request_now()
+        self._wake.set()
+
+    def request_detection(self):
+        """Просит выполнить детекцию на ближайшем кадре, не дожидаясь планировщика"""
+        self.scheduler.request_now()
+        self._wake.set()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._capture_loop, name="capture-stage", daemon=True)]
+        if self.detect is not None:
+            self._threads.append(threading.Thread(target=self._detect_loop, name="detect-stage", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        self._wake.set()
+        self._queue.close()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+        self._threads = []
+        self._queue = DropOldestQueue(self._queue_size)
+        self.scheduler.cancel()
+
+    def _detection_due(self):
+        with self._lock:
+            if not self._detect_enabled or self.detect is None:
+                return False
+        if self.scheduler.due():
+            self.scheduler.begin()
+            return True
+        return False
+
+    def _next_delay(self, started):
+        """Сколько ждать до следующего захвата (None — до явного пробуждения)"""
+        with self._lock:
+            detecting = self._detect_enabled and self.detect is not None
+            delay = None
+            if self._preview_enabled:
+                delay = max(0.0, self.capture_interval - (time.monotonic() - started))
+        if detecting:
+            # Проверка может понадобиться раньше следующего кадра превью
+            until_due = self.scheduler.time_until_due()
+            if until_due is not None:
+                delay = until_due if delay is None else min(delay, until_due)
+        return delay
+
+    def _capture_loop(self):
+        metrics = get_metrics()
+        session = None
+        grab = self.frame_source
+        if grab is None:
+            session = get_capture_session()
+            grab = session.grab_regions
+        try:
+            while not self._stop.is_set():
+                # Сбрасываем до чтения состояния: пробуждение во время итерации не теряется
+                self._wake.clear()
+                started = time.monotonic()
+                with self._lock:
+                    regions = self._regions
+                    preview = self._preview_enabled
+                detection_due = self._detection_due()
+
+                frames = None
+                if regions and (preview or detection_due):
+                    try:
+                        with metrics.timer("capture"):
+                            frames = grab(regions)
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка захвата экрана: {e}")
+
+                if frames is not None:
+                    recorder = self.recorder
+                    if recorder is not None:
+                        recorder.record(frames)
+                    if preview and self.on_frames is not None:
+                        self.on_frames(frames)
+                    if detection_due:
+                        self._queue.put(frames)
+                elif detection_due:
+                    # Кадра для детекции нет — планируем следующую попытку
+                    self.scheduler.record(None)
+
+                self._wake.wait(self._next_delay(started))
+        finally:
+            if session is not None:
+                session.close()
+
+    def _detect_loop(self):
+        metrics = get_metrics()
+        while not self._stop.is_set():
+            frames = self._queue.get(timeout=0.5)
+            if frames is None:
+                continue
+            try:
+                with metrics.timer("detect"):
+                    result = self.detect(frames)
+            except Exception as e:
+                logger.error(f"❌ Ошибка детекции: {e}")
+                result = None
+            self.scheduler.record(result)
+            self._wake.set()
+            if result is None:
+                continue
+            if self.on_result is not None and not self._stop.is_set():
+                self.on_result(result)
@@ -0,0 +1,535 @@
+"""
+Движок правил: несколько наблюдателей (еда, куртка R, шлем D, ...) на одном кадре.
+
+Каждое правило объявляет свои области, условие (детекторы) и действие, а также приоритет.
+Движок собирает области всех правил, и конвейер снимает их одним захватом за тик
+(CaptureSession сама решает, снимать ли объединяющий прямоугольник). Затем правила,
+которым пора проверяться, оцениваются по общему кадру в порядке приоритета.
+Детектор, общий для нескольких правил, считается один раз за тик.
+
+Движок одновременно является планировщиком для DetectionPipeline: у каждого правила
+свой планировщик, а конвейер просыпается к ближайшей проверке любого из них.
+
+    engine = RuleEngine(rules_from_settings(settings.get("rules", [])))
+    pipeline = DetectionPipeline(engine.rects(), detect=engine, scheduler=engine)
+"""
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+
+from config.service import get_config
+from modules.scheduler import FixedIntervalScheduler, AdaptiveScheduler
+from modules.template_matcher import TemplateMatcher, MATCH_THRESHOLD
+from modules.template_store import get_store_bank
+from modules.metrics import get_metrics
+
+logger = logging.getLogger("AlbionHelperLogger")
+
+# Интервал проверки правила по умолчанию, в секундах
+RULE_INTERVAL = 1.0
+
+# Сколько действий (нажатий) движок выполняет за один тик; остальные правила ждут следующего
+MAX_ACTIONS_PER_TICK = 1
+
+# Области авто-еды в settings.json
+EFFECTS_REGION = "Область эффектов персонажа"
+FOOD_SLOT_REGION = "Слот еды"
+
+# name — имя правила, fired — выполнено ли действие, detail — результат детектора
+# (для AutoFoodRule — FoodCheckResult)
+RuleResult = namedtuple("RuleResult", ["name", "fired", "detail"])
+
+# results — dict имя правила -> RuleResult для правил, проверенных в этом тике;
+# deferred — имена правил, отложенных из-за лимита действий
+EngineResult = namedtuple("EngineResult", ["results", "deferred"])
+
+
+class RuleContext:
+    """Состояние одного тика: кадры по именам областей, время и кэш детекторов"""
+
+    def __init__(self, frames, now, history, rule=None):
+        self.frames = frames
+        self.now = now
+        self.history = history
+        self.rule = rule
+        self._cache = {}
+
+    def frame(self, region):
+        return self.frames.get(region)
+
+    def last_fired(self, rule_name):
+        return self.history.get(rule_name)
+
+    def evaluate(self, condition):
+        """
+        Значение условия, посчитанное не более одного раза за тик.
+        Условия, зависящие от проверяющего правила (per_rule), не кэшируются.
+        """
+        if condition.per_rule:
+            return condition.evaluate(self)
+        key = id(condition)
+        if key not in self._cache:
+            self._cache[key] = condition.evaluate(self)
+        return self._cache[key]
+
+
+# --- Детекторы ---
+
+class TemplatePresent:
+    """Есть ли в области хотя бы один шаблон из категории хранилища (или из списка имён)"""
+
+    def __init__(self, region, category, names=None, threshold=MATCH_THRESHOLD, matcher=None):
+        self.region = region
+        self.bank = get_store_bank(category)
+        self.names = set(names) if names else None
+        self.matcher = matcher or TemplateMatcher(threshold)
+        # Результат кэшируется по кадру, поэтому условие не зависит от правила
+        self.per_rule = False
+
+    @property
+    def regions(self):
+        return [self.region]
+
+    def evaluate(self, ctx):
+        frame = ctx.frame(self.region)
+        if frame is None:
+            return False
+        entries = self.bank.refresh().entries()
+        if self.names is not None:
+            entries = [e for e in entries if e.name in self.names]
+        if not entries:
+            return False
+        results = self.matcher.match(frame, entries, first_hit=True)
+        return bool(results) and results[0].matched
+
+
+class PixelStat:
+    """
+    Статистика пикселей области в пределах [minimum, maximum].
+    Например, иконка умения на откате затемнена: mean яркости выше порога — умение готово.
+    """
+
+    STATS = ("mean", "std")
+
+    def __init__(self, region, stat="mean", minimum=None, maximum=None, channel=None):
+        """
+        :param stat: "mean" или "std"
+        :param channel: None — яркость (серый), 0/1/2 — канал B/G/R
+        """
+        if stat not in self.STATS:
+            raise ValueError(f"Неизвестная статистика: {stat}")
+        self.region = region
+        self.stat = stat
+        self.minimum = minimum
+        self.maximum = maximum
+        self.channel = channel
+        self.per_rule = False
+
+    @property
+    def regions(self):
+        return [self.region]
+
+    def value(self, frame):
+        if self.channel is None:
+            plane = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        else:
+            plane = frame[:, :, self.channel]
+        mean, std = cv2.meanStdDev(plane)
+        return float((mean if self.stat == "mean" else std)[0][0])
+
+    def evaluate(self, ctx):
+        frame = ctx.frame(self.region)
+        if frame is None:
+            return False
+        value = self.value(frame)
+        if self.minimum is not None and value < self.minimum:
+            return False
+        if self.maximum is not None and value > self.maximum:
+            return False
+        return True
+
+
+class After:
+    """
+    Прошло не меньше delay секунд после срабатывания правила rule,
+    и текущее правило с тех пор не срабатывало (цепочки вида R -> 6 с -> D).
+    """
+
+    def __init__(self, rule, delay):
+        self.rule = rule
+        self.delay = delay
+        # Зависит от того, какое правило его проверяет
+        self.per_rule = True
+
+    @property
+    def regions(self):
+        return []
+
+    def evaluate(self, ctx):
+        fired = ctx.last_fired(self.rule)
+        if fired is None or ctx.now - fired < self.delay:
+            return False
+        own = ctx.last_fired(ctx.rule.name) if ctx.rule is not None else None
+        return own is None or own < fired
+
+
+class Not:
+    def __init__(self, condition):
+        self.condition = condition
+        self.per_rule = condition.per_rule
+
+    @property
+    def regions(self):
+        return self.condition.regions
+
+    def evaluate(self, ctx):
+        return not ctx.evaluate(self.condition)
+
+
+# --- Действия ---
+
+class PressKey:
+    def __init__(self, key):
+        self.key = key
+
+    def run(self, press_key):
+        press_key(self.key)
+
+    def __repr__(self):
+        return f"<PressKey {self.key}>"
+
+
+# --- Правила ---
+
+class Rule:
+    """
+    Базовое правило: имя, области, приоритет и собственный планировщик проверок.
+    Подклассы реализуют evaluate(ctx) -> RuleResult.
+    """
+
+    def __init__(self, name, regions, priority=0, scheduler=None, interval=RULE_INTERVAL, enabled=True):
+        self.name = name
+        self.regions = list(regions)
+        self.priority = priority
+        self.scheduler = scheduler or FixedIntervalScheduler(interval)
+        self.enabled = enabled
+        # Включено и все области заданы (см. RuleEngine.refresh_regions)
+        self.active = False
+
+    @property
+    def can_act(self):
+        """Может ли правило выполнить действие (такие правила подчиняются лимиту действий за тик)"""
+        return True
+
+    def evaluate(self, ctx):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name} p={self.priority}>"
+
+
+class ConditionRule(Rule):
+    """Все условия истинны -> действие (не чаще cooldown секунд)"""
+
+    def __init__(self, name, conditions, action=None, priority=0, interval=RULE_INTERVAL, cooldown=0.0,
+                 scheduler=None, enabled=True):
+        regions = []
+        for condition in conditions:
+            for region in condition.regions:
+                if region not in regions:
+                    regions.append(region)
+        super().__init__(name, regions, priority, scheduler, interval, enabled)
+        self.conditions = list(conditions)
+        self.action = action
+        self.cooldown = cooldown
+
+    @property
+    def can_act(self):
+        return self.action is not None
+
+    def evaluate(self, ctx):
+        for condition in self.conditions:
+            if not ctx.evaluate(condition):
+                return RuleResult(self.name, False, False)
+        if self.action is None:
+            return RuleResult(self.name, False, True)
+        last = ctx.last_fired(self.name)
+        if last is not None and ctx.now - last < self.cooldown:
+            return RuleResult(self.name, False, True)
+        self.action.run(ctx.press_key)
+        return RuleResult(self.name, True, True)
+
+
+class AutoFoodRule(Rule):
+    """
+    Авто-еда как правило движка: AutoFoodDetector сам решает, нажимать ли клавишу,
+    а планирование остаётся адаптивным (AdaptiveScheduler по FoodCheckResult).
+    """
+
+    def __init__(self, detector, effects_region, food_slot_region, scheduler=None, priority=100, name="food"):
+        super().__init__(name, [effects_region, food_slot_region], priority,
+                         scheduler or FixedIntervalScheduler(RULE_INTERVAL))
+        self.detector = detector
+
+    def evaluate(self, ctx):
+        effects, slot = (ctx.frame(r) for r in self.regions)
+        result = self.detector.check(effects, slot)
+        return RuleResult(self.name, result.pressed, result)
+
+
+class RuleEngine:
+    """
+    Оценивает правила по общему кадру. Совместим с DetectionPipeline:
+    engine(frames) — функция детекции, сам engine — планировщик (due/begin/record/...).
+    """
+
+    def __init__(self, rules, resolve=None, press_key=None, max_actions=MAX_ACTIONS_PER_TICK,
+                 clock=time.monotonic):
+        """
+        :param rules: list[Rule]
+        :param resolve: callable(имя области) -> Region или None (по умолчанию — из службы настроек)
+        :param press_key: callable(key) — нажатие клавиши, обычно InputDispatcher.press, который сам
+                          замеряет отправку (по умолчанию pyautogui.press с метрикой key_dispatch)
+        """
+        self.resolve = resolve or get_config().region
+        self.rules = sorted(rules, key=lambda r: r.priority, reverse=True)
+        names = [r.name for r in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError("Имена правил повторяются")
+        self.max_actions = max_actions
+        self.clock = clock
+        self._press_key = press_key
+        self._direct_press = press_key is None   # нажатие через pyautogui в потоке детекции
+        self._lock = threading.Lock()
+        self._pending = []
+        self.history = {}
+        self.region_names = []
+        self._rects = []
+        self.refresh_regions()
+
+    # --- области ---
+
+    def refresh_regions(self):
+        """
+        Перечитывает прямоугольники областей (например, после изменения настроек).
+        Правила, у которых не задана хотя бы одна область, пропускаются.
+        :return: list — прямоугольники в порядке region_names
+        """
+        names, rects = [], []
+        for rule in self.rules:
+            resolved = [self.resolve(region) for region in rule.regions]
+            if any(rect is None for rect in resolved):
+                if rule.enabled:
+                    logger.warning(f"⚠️ Правило '{rule.name}' пропущено: не заданы области {rule.regions}")
+                rule.active = False
+                continue
+            rule.active = rule.enabled
+            for region, rect in zip(rule.regions, resolved):
+                if region not in names:
+                    names.append(region)
+                    rects.append(rect)
+        with self._lock:
+            self.region_names, self._rects = names, rects
+        return list(rects)
+
+    @property
+    def declared_regions(self):
+        """Имена всех областей, которые используют правила (включая ещё не заданные)"""
+        return {region for rule in self.rules for region in rule.regions}
+
+    def rects(self):
+        with self._lock:
+            return list(self._rects)
+
+    def set_scale(self, scale):
+        """Передаёт масштаб UI матчерам условий по шаблонам"""
+        for rule in self.rules:
+            for condition in getattr(rule, "conditions", []):
+                while isinstance(condition, Not):
+                    condition = condition.condition
+                matcher = getattr(condition, "matcher", None)
+                if matcher is not None:
+                    matcher.set_scale(scale)
+
+    def press_key(self, key):
+        if self._press_key is None:
+            import pyautogui
+            self._press_key = pyautogui.press
+        if not self._direct_press:
+            # Переданная функция (InputDispatcher.press) только ставит клавишу в очередь; отправку замеряет диспетчер
+            self._press_key(key)
+            return
+        with get_metrics().timer("key_dispatch"):
+            self._press_key(key)
+
+    # --- детекция ---
+
+    def __call__(self, frames):
+        with self._lock:
+            names = self.region_names
+            pending = list(self._pending)
+        if len(frames) != len(names):
+            logger.warning(f"⚠️ Получено кадров: {len(frames)}, ожидалось: {len(names)}")
+        ctx = RuleContext(dict(zip(names, frames)), self.clock(), self.history)
+        ctx.press_key = self.press_key
+
+        metrics = get_metrics()
+        results, deferred = {}, []
+        actions = 0
+        for rule in pending:
+            if rule.can_act and actions >= self.max_actions:
+                # Лимит нажатий за тик исчерпан правилом с большим приоритетом — проверим в следующем тике
+                deferred.append(rule.name)
+                continue
+            ctx.rule = rule
+            with metrics.timer(f"rule_{rule.name}"):
+                try:
+                    result = rule.evaluate(ctx)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка правила '{rule.name}': {e}")
+                    result = RuleResult(rule.name, False, None)
+            results[rule.name] = result
+            if result.fired:
+                actions += 1
+                self.history[rule.name] = ctx.now
+                logger.info(f"⚡ Правило '{rule.name}' сработало")
+        return EngineResult(results, deferred)
+
+    # --- планирование (интерфейс FixedIntervalScheduler) ---
+
+    def _active(self):
+        return [rule for rule in self.rules if rule.active]
+
+    def due(self):
+        with self._lock:
+            if self._pending:
+                return False
+        return any(rule.scheduler.due() for rule in self._active())
+
+    def time_until_due(self):
+        with self._lock:
+            if self._pending:
+                return None
+        delays = [rule.scheduler.time_until_due() for rule in self._active()]
+        delays = [d for d in delays if d is not None]
+        return min(delays) if delays else None
+
+    def begin(self):
+        due = [rule for rule in self._active() if rule.scheduler.due()]
+        for rule in due:
+            rule.scheduler.begin()
+        with self._lock:
+            self._pending = due
+
+    def record(self, result):
+        """Передаёт результаты в планировщики правил; отложенные правила остаются «пора»"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        results = result.results if isinstance(result, EngineResult) else {}
+        for rule in pending:
+            rule_result = results.get(rule.name)
+            if rule_result is None:
+                rule.scheduler.cancel()
+                if result is not None:
+                    rule.scheduler.request_now()
+                else:
+                    rule.scheduler.record(None)
+            else:
+                rule.scheduler.record(rule_result.detail)
+
+    def cancel(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for rule in pending:
+            rule.scheduler.cancel()
+
+    def request_now(self):
+        for rule in self._active():
+            rule.scheduler.request_now()
+
+
+# --- Правила из settings.json ---
+
+def _build_condition(spec, cache, scale):
+    """Условие из словаря; одинаковые описания дают один объект (считается один раз за тик)"""
+    key = json.dumps(spec, sort_keys=True, ensure_ascii=False)
+    if key in cache:
+        return cache[key]
+    kind = spec.get("type")
+    if kind == "template":
+        threshold = float(spec.get("threshold", MATCH_THRESHOLD))
+        condition = TemplatePresent(spec["region"], spec.get("category", "food"), spec.get("templates"),
+                                    matcher=TemplateMatcher(threshold, scale=scale))
+    elif kind == "slot_empty":
+        threshold = float(spec.get("threshold", MATCH_THRESHOLD))
+        condition = TemplatePresent(spec["region"], "slots", [spec.get("template", "empty_food_slot.png")],
+                                    matcher=TemplateMatcher(threshold, scale=scale))
+    elif kind == "pixel":
+        condition = PixelStat(spec["region"], spec.get("stat", "mean"), spec.get("min"), spec.get("max"),
+                              spec.get("channel"))
+    elif kind == "after":
+        condition = After(spec["rule"], float(spec.get("seconds", 0)))
+    else:
+        raise ValueError(f"Неизвестный тип условия: {kind}")
+    if spec.get("negate"):
+        condition = Not(condition)
+    cache[key] = condition
+    return condition
+
+
+def rules_from_settings(specs, scale=1.0, reserved=()):
+    """
+    Правила из секции "rules" в settings.json, например:
+        {"name": "jacket", "key": "r", "priority": 20, "interval": 0.5, "cooldown": 2,
+         "when": [{"type": "pixel", "region": "Куртка (R)", "stat": "mean", "min": 90}]}
+        {"name": "helmet", "key": "d", "priority": 10,
+         "when": [{"type": "after", "rule": "jacket", "seconds": 6},
+                  {"type": "pixel", "region": "Шлем (D)", "stat": "mean", "min": 90}]}
+    Типы условий: template, slot_empty, pixel, after; "negate": true инвертирует условие.
+    Некорректные правила и правила с повторяющимся или занятым именем пропускаются с записью в лог.
+    :param scale: float — масштаб UI для условий по шаблонам (см. modules.ui_scale)
+    :param reserved: iterable[str] — имена, уже занятые другими правилами движка (например, "food")
+    :return: list[ConditionRule]
+    """
+    cache = {}
+    rules = []
+    names = set(reserved)
+    for spec in specs or []:
+        try:
+            if spec["name"] in names:
+                raise ValueError(f"имя '{spec['name']}' уже занято")
+            conditions = [_build_condition(c, cache, scale) for c in spec.get("when", [])]
+            if not conditions:
+                raise ValueError("нет условий")
+            action = PressKey(str(spec["key"])) if spec.get("key") else None
+            rules.append(ConditionRule(spec["name"], conditions, action,
+                                       priority=int(spec.get("priority", 0)),
+                                       interval=float(spec.get("interval", RULE_INTERVAL)),
+                                       cooldown=float(spec.get("cooldown", 0.0)),
+                                       enabled=bool(spec.get("enabled", True))))
+            names.add(spec["name"])
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"❌ Правило {spec.get('name', '?') if isinstance(spec, dict) else spec} пропущено: {e}")
+    return rules
+
+
+def build_auto_food_engine(detector, settings, resolve=None, press_key=None, with_rules=True):
+    """
+    Движок авто-режима: правило еды (адаптивный планировщик из "auto_food_scheduler")
+    и, если with_rules, правила из секции "rules". Общий для окна авто-режима и daemon.py.
+    :param detector: AutoFoodDetector
+    :param settings: отображение настроек (снимок службы настроек)
+    """
+    food_rule = AutoFoodRule(
+        detector, EFFECTS_REGION, FOOD_SLOT_REGION,
+        # Интервал проверки еды подстраивается под её состояние
+        scheduler=AdaptiveScheduler.from_settings(settings.get("auto_food_scheduler", {}))
+    )
+    rules = [food_rule]
+    if with_rules:
+        rules += rules_from_settings(settings.get("rules", []), scale=detector.scale, reserved=[food_rule.name])
+    return RuleEngine(rules, resolve=resolve, press_key=press_key)
@@ -0,0 +1,160 @@
+import time
+import random
+import threading
+
+from modules.auto_food import FOOD_ACTIVE, SLOT_EMPTY, EAT
+
+# Интервалы проверки авто-еды, в секундах
+MIN_INTERVAL = 0.5
+MAX_INTERVAL = 15.0
+
+# Случайное отклонение интервала (доля), чтобы проверки не шли строго периодично
+JITTER = 0.1
+
+# Сколько длится эффект еды и за сколько до окончания начинать частые проверки
+BUFF_DURATION = 1800.0
+EXPIRY_WINDOW = 20.0
+
+# Начальный интервал при пустом слоте; удваивается до MAX_INTERVAL
+EMPTY_BACKOFF_START = 2.0
+
+
+class FixedIntervalScheduler:
+    """
+    Планировщик проверок с постоянным интервалом.
+    Интерфейс общий с AdaptiveScheduler: due() / begin() / record() / request_now().
+    """
+
+    def __init__(self, interval=10.0, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._next_check = clock()
+        self._in_progress = False
+
+    def due(self):
+        """Пора ли запускать проверку"""
+        with self._lock:
+            return not self._in_progress and self.clock() >= self._next_check
+
+    def time_until_due(self):
+        """Сколько секунд осталось до следующей проверки (None — пока идёт проверка)"""
+        with self._lock:
+            if self._in_progress:
+                return None
+            return max(0.0, self._next_check - self.clock())
+
+    def begin(self):
+        """Проверка запущена: до её результата новые не планируются"""
+        with self._lock:
+            self._in_progress = True
+
+    def record(self, result):
+        """Результат проверки (FoodCheckResult или None при ошибке) — планирует следующую"""
+        interval = self._interval_for(result)
+        with self._lock:
+            self._in_progress = False
+            self._next_check = self.clock() + interval
+        return interval
+
+    def cancel(self):
+        """Запущенная проверка отменена (например, конвейер остановлен)"""
+        with self._lock:
+            self._in_progress = False
+
+    def request_now(self):
+        """Внеочередная проверка на ближайшем кадре"""
+        with self._lock:
+            self._next_check = self.clock()
+
+    def _interval_for(self, result):
+        return self.interval
+
+
+class AdaptiveScheduler(FixedIntervalScheduler):
+    """
+    Адаптивный планировщик проверок авто-еды:
+    - эффект еды активен — проверяем редко, но учащаем проверки к ожидаемому окончанию;
+    - клавиша только что нажата — быстро проверяем, появился ли эффект
+      (если эффекта всё нет, интервал между нажатиями удваивается);
+    - слот еды пуст — интервал растёт экспоненциально до max_interval.
+    Время берётся из clock, случайность — из rng, поэтому планировщик
+    можно проверять с поддельными часами.
+    """
+
+    def __init__(self, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, jitter=JITTER,
+                 buff_duration=BUFF_DURATION, expiry_window=EXPIRY_WINDOW,
+                 empty_backoff_start=EMPTY_BACKOFF_START, clock=time.monotonic, rng=None):
+        super().__init__(min_interval, clock)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.buff_duration = buff_duration
+        self.expiry_window = expiry_window
+        self.empty_backoff_start = empty_backoff_start
+        self.rng = rng or random.Random()
+
+        self.buff_started = None   # когда (по clock) начался текущий эффект еды
+        self._pressed_at = None    # когда была нажата клавиша (первое нажатие, ещё не подтверждённое эффектом)
+        self._empty_streak = 0
+        self._eat_streak = 0
+
+    @classmethod
+    def from_settings(cls, settings, **kwargs):
+        """
+        Создаёт планировщик из словаря настроек (секция "auto_food_scheduler" в settings.json)
+        """
+        keys = ("min_interval", "max_interval", "jitter", "buff_duration", "expiry_window", "empty_backoff_start")
+        params = {k: float(settings[k]) for k in keys if k in settings}
+        params.update(kwargs)
+        return cls(**params)
+
+    def _interval_for(self, result):
+        now = self.clock()
+        state = getattr(result, "state", None)
+
+        if state == FOOD_ACTIVE:
+            self._empty_streak = 0
+            self._eat_streak = 0
+            if self._pressed_at is not None:
+                # Эффект появился после нажатия — знаем, когда он закончится
+                self.buff_started = self._pressed_at
+                self._pressed_at = None
+            if self.buff_started is None:
+                # Эффект уже был при запуске: время окончания неизвестно
+                return self._bounded(self.max_interval)
+            remaining = self.buff_started + self.buff_duration - now
+            if remaining < -self.expiry_window:
+                # Эффект держится дольше ожидаемого — оценка окончания неверна
+                self.buff_started = None
+                return self._bounded(self.max_interval)
+            return self._bounded(remaining - self.expiry_window)
+
+        self.buff_started = None
+
+        if state == EAT:
+            # Быстро проверяем, появился ли эффект; если нет — повторные нажатия всё реже
+            self._empty_streak = 0
+            if getattr(result, "pressed", False) and self._pressed_at is None:
+                # Эффект отсчитывается от настоящего нажатия, а не от проверок в ожидании подтверждения
+                self._pressed_at = now
+            interval = self.min_interval * (2 ** self._eat_streak)
+            self._eat_streak += 1
+            return self._bounded(interval)
+
+        self._eat_streak = 0
+        # Нажатие не дало эффекта — следующее будет отсчитываться заново
+        self._pressed_at = None
+
+        if state == SLOT_EMPTY:
+            interval = self.empty_backoff_start * (2 ** self._empty_streak)
+            self._empty_streak += 1
+            return self._bounded(interval)
+
+        # Ошибка или неизвестное состояние — повторяем не слишком часто
+        return self._bounded(self.empty_backoff_start)
+
+    def _bounded(self, interval):
+        if self.jitter:
+            interval *= 1 + self.rng.uniform(-self.jitter, self.jitter)
+        return min(self.max_interval, max(self.min_interval, interval))
@@ -1,16 +1,24 @@
-import mss
-import numpy as np
 import cv2
 import os
 
+from modules.capture_session import get_capture_session
+
 
 def capture_screen(x=0, y=0, width=100, height=100):
-    with mss.mss() as sct:
-        monitor = {"top": y, "left": x, "width": width, "height": height}
-        screenshot = sct.grab(monitor)
-        img = np.array(screenshot)
-        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-        return img
+    """
+    Делает скриншот области через сессию захвата текущего потока.
+    Возвращает новый BGR-массив, который можно хранить.
+    """
+    return get_capture_session().grab(x, y, width, height)
+
+
+def capture_regions(regions):
+    """
+    Захватывает несколько областей одним скриншотом (см. CaptureSession.grab_regions).
+    :param regions: list — области (x, y, width, height) или словари из settings.json
+    :return: list[np.ndarray] — представления общего кадра в порядке regions
+    """
+    return get_capture_session().grab_regions(regions)
 
 
 def resize_image(image, max_width=200, max_height=100):
@@ -0,0 +1,300 @@
+"""
+Запись и воспроизведение кадров авто-режима.
+
+Формат файла (.albrec):
+    MAGIC | uint32 длина заголовка | JSON-заголовок (области, время создания)
+    далее записи-тики:
+        float64 время (с от начала записи) | uint16 число областей
+        для каждой области: uint8 флаги | uint16 высота | uint16 ширина | uint32 длина | zlib-данные
+Кадр хранится либо целиком (KEYFRAME), либо как XOR с предыдущим кадром той же
+области (DELTA), либо не хранится вовсе, если не изменился (REPEAT). Неподвижная
+полоса эффектов поэтому почти не занимает места, и запись можно держать часами.
+"""
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger("AlbionHelperLogger")
+
+MAGIC = b"ALBREC1\n"
+TICK_HEADER = struct.Struct("<dH")
+FRAME_HEADER = struct.Struct("<BHHI")
+
+KEYFRAME = 1
+DELTA = 2
+REPEAT = 3
+
+# Полный кадр пишется раз в столько тиков, чтобы повреждение файла не ломало всю запись
+KEYFRAME_INTERVAL = 300
+
+# Буфер файла сбрасывается на диск раз в столько тиков: поток записи фоновый,
+# и при аварийном завершении теряется только хвост записи
+FLUSH_TICKS = 10
+
+# Сколько ждать поток записи при закрытии, в секундах
+CLOSE_TIMEOUT = 5.0
+
+# Сколько тиков в секунду записывать максимум
+RECORD_FPS = 1.0
+
+# Уровень сжатия zlib: 1 — быстрее всего, запись не должна грузить поток захвата
+COMPRESSION_LEVEL = 1
+
+
+class SessionRecorder:
+    """
+    Пишет кадры в файл .albrec в фоновом потоке.
+    record() только кладёт кадры в очередь и никогда не блокирует поток захвата:
+    если запись не успевает, тик отбрасывается и учитывается в dropped.
+    """
+
+    def __init__(self, path, region_names=None, max_fps=RECORD_FPS, queue_size=64):
+        self.path = path
+        self.region_names = list(region_names or [])
+        self.max_fps = max_fps
+        self.dropped = 0
+        self.ticks = 0
+        self.bytes_written = 0
+        self.error = None   # ошибка записи в файл; после неё тики только отбрасываются
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._first_tick = None
+        self._last_tick = None
+        self._previous = {}
+        self._since_keyframe = KEYFRAME_INTERVAL
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "wb")
+        header = json.dumps({
+            "version": 1,
+            "regions": self.region_names,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }, ensure_ascii=False).encode("utf-8")
+        self._file.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self.bytes_written = self._file.tell()
+
+        self._thread = threading.Thread(target=self._writer_loop, name="session-recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, frames, timestamp=None):
+        """
+        Добавляет тик (список кадров областей). Вызывается из потока захвата.
+        :param timestamp: float — время по time.monotonic (None — текущее)
+        :return: bool — был ли тик принят
+        """
+        now = time.monotonic() if timestamp is None else timestamp
+        if self.max_fps and self._last_tick is not None and now - self._last_tick < 1.0 / self.max_fps:
+            return False
+        self._last_tick = now
+        if self._first_tick is None:
+            self._first_tick = now
+        try:
+            # Кадры могут быть представлениями общего буфера — копируем перед передачей в другой поток
+            self._queue.put_nowait((now - self._first_tick, [np.array(f, copy=True) for f in frames]))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _encode(self, index, frame):
+        previous = self._previous.get(index)
+        self._previous[index] = frame
+        h, w = frame.shape[:2]
+
+        if previous is not None and previous.shape == frame.shape and self._since_keyframe < KEYFRAME_INTERVAL:
+            if np.array_equal(previous, frame):
+                return FRAME_HEADER.pack(REPEAT, h, w, 0)
+            payload = zlib.compress(np.bitwise_xor(previous, frame).tobytes(), COMPRESSION_LEVEL)
+            return FRAME_HEADER.pack(DELTA, h, w, len(payload)) + payload
+
+        payload = zlib.compress(frame.tobytes(), COMPRESSION_LEVEL)
+        return FRAME_HEADER.pack(KEYFRAME, h, w, len(payload)) + payload
+
+    def _writer_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                # Очередь разбирается и после ошибки, чтобы record() и close() не блокировались
+                self.dropped += 1
+                continue
+            try:
+                self._write_tick(*item)
+            except Exception as e:
+                self.error = e
+                self.dropped += 1
+                logger.error(f"❌ Ошибка записи {self.path}: {e}. Дальнейшие кадры не сохраняются")
+
+    def _write_tick(self, timestamp, frames):
+        if self._since_keyframe >= KEYFRAME_INTERVAL:
+            self._previous.clear()
+        chunks = [TICK_HEADER.pack(timestamp, len(frames))]
+        chunks.extend(self._encode(i, f) for i, f in enumerate(frames))
+        self._since_keyframe = 0 if self._since_keyframe >= KEYFRAME_INTERVAL else self._since_keyframe + 1
+        data = b"".join(chunks)
+        self._file.write(data)
+        self.bytes_written += len(data)
+        self.ticks += 1
+        if self.ticks % FLUSH_TICKS == 0:
+            self._file.flush()
+
+    def close(self):
+        """Дописывает очередь и закрывает файл (ждёт поток записи не дольше CLOSE_TIMEOUT)"""
+        if self._file.closed:
+            return
+        try:
+            self._queue.put(None, timeout=CLOSE_TIMEOUT)
+        except queue.Full:
+            pass
+        self._thread.join(CLOSE_TIMEOUT)
+        if self._thread.is_alive():
+            # Файл не закрывается, пока в него может писать поток записи
+            logger.warning(f"⚠️ Запись {self.path} не завершилась за {CLOSE_TIMEOUT:g} с")
+            return
+        try:
+            self._file.close()
+        except OSError as e:
+            logger.error(f"❌ Ошибка закрытия {self.path}: {e}")
+        logger.info(f"⏹️ Запись сохранена: {self.path} ({self.ticks} тиков, {self.bytes_written / 1024:.0f} КБ, "
+                    f"пропущено {self.dropped})")
+
+
+def read_session(path):
+    """
+    Читает файл .albrec. Оборванный конец файла (запись прервана аварийно)
+    считается концом записи: неполный тик пропускается с предупреждением.
+    :return: (header: dict, генератор (timestamp, list[np.ndarray]))
+    """
+    f = open(path, "rb")
+    if f.read(len(MAGIC)) != MAGIC:
+        f.close()
+        raise ValueError(f"Не файл записи albion_helper: {path}")
+    (header_len,) = struct.unpack("<I", f.read(4))
+    header = json.loads(f.read(header_len).decode("utf-8"))
+
+    def ticks():
+        previous = {}
+        try:
+            while True:
+                raw = f.read(TICK_HEADER.size)
+                if len(raw) < TICK_HEADER.size:
+                    return
+                timestamp, count = TICK_HEADER.unpack(raw)
+                frames = []
+                try:
+                    for index in range(count):
+                        flags, h, w, length = FRAME_HEADER.unpack(f.read(FRAME_HEADER.size))
+                        if flags == REPEAT:
+                            frame = previous[index]
+                        else:
+                            data = np.frombuffer(zlib.decompress(f.read(length)), dtype=np.uint8).reshape(h, w, 3)
+                            frame = data if flags == KEYFRAME else np.bitwise_xor(previous[index], data)
+                        previous[index] = frame
+                        frames.append(frame)
+                except (struct.error, zlib.error, ValueError, KeyError) as e:
+                    logger.warning(f"⚠️ Запись {path} оборвана на {timestamp:.1f} с: {e}")
+                    return
+                yield timestamp, frames
+        finally:
+            f.close()
+
+    return header, ticks()
+
+
+class ReplayFrameSource:
+    """
+    Источник кадров из записи вместо живого захвата экрана.
+    Подключается к DetectionPipeline параметром frame_source: каждый вызов
+    возвращает кадры следующего тика. При realtime=True запись идёт по часам:
+    вызов возвращает тик, соответствующий прошедшему времени (пропущенные тики
+    отбрасываются, а раньше времени первого ещё не наступившего тика вызов ждёт),
+    поэтому редкие захваты, как у адаптивного планировщика, не замедляют воспроизведение.
+    Иначе кадры отдаются по одному тику так быстро, как их забирают.
+    exhausted становится True, когда отдан последний тик (при realtime) или запись закончилась.
+    Если задан region_names, кадры выбираются по именам областей из заголовка записи
+    в том порядке, в каком их ждёт потребитель (например, RuleEngine.region_names).
+    """
+
+    def __init__(self, path, realtime=True, loop=False, region_names=None):
+        """
+        :param region_names: callable() -> list[str] — области в порядке потребителя
+                             (None — кадры в порядке записи); области, которых нет в записи, получают None
+        """
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.region_names = region_names
+        self.exhausted = False
+        self._open()
+
+    def _open(self):
+        self.header, self._ticks = read_session(self.path)
+        self._positions = {name: i for i, name in enumerate(self.header.get("regions", []))}
+        self._replay_started = None
+        self._pending = None    # тик, прочитанный заранее при пропуске
+
+    def _next_tick(self):
+        """:raises StopIteration: запись закончилась"""
+        if self._pending is not None:
+            tick, self._pending = self._pending, None
+            return tick
+        return next(self._ticks)
+
+    def __call__(self, regions=None):
+        """
+        :param regions: игнорируется — области определены записью
+        :return: list[np.ndarray] или None, если запись закончилась
+        """
+        try:
+            timestamp, frames = self._next_tick()
+        except StopIteration:
+            if not self.loop:
+                self.exhausted = True
+                return None
+            self._open()
+            return self(regions)
+
+        if self.realtime:
+            now = time.monotonic()
+            if self._replay_started is None:
+                self._replay_started = now - timestamp
+            elapsed = now - self._replay_started
+            # Тики, время которых уже прошло, пропускаются: отдаётся последний наступивший
+            for tick in self._ticks:
+                if tick[0] > elapsed:
+                    self._pending = tick
+                    break
+                timestamp, frames = tick
+            else:
+                # Отдаётся последний тик: конец записи виден сразу, а не при следующем захвате
+                self.exhausted = not self.loop
+            delay = timestamp - elapsed
+            if delay > 0:
+                time.sleep(delay)
+        return self._select(frames)
+
+    def _select(self, frames):
+        if self.region_names is None or not self._positions:
+            return frames
+        positions = self._positions
+        return [frames[positions[name]] if name in positions else None for name in self.region_names()]
+
+
+def replay_detection(path, detect):
+    """
+    Прогоняет детекцию по всей записи так быстро, как возможно.
+    :param detect: callable(frames) -> result (например, AutoFoodDetector с фиктивным нажатием)
+    :return: list[(timestamp, result)]
+    """
+    _, ticks = read_session(path)
+    return [(timestamp, detect(frames)) for timestamp, frames in ticks]
+
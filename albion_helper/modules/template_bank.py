@@ -0,0 +1,295 @@
+import os
+import threading
+import time
+import logging
+
+import cv2
+import numpy as np
+
+from modules.metrics import get_metrics
+
+logger = logging.getLogger("AlbionHelperLogger")
+
+TEMPLATE_EXTENSIONS = (".png", ".jpg")
+
+# Масштаб уменьшенной копии шаблона для грубого поиска
+PYRAMID_SCALE = 0.5
+
+# Шаблоны меньше этого размера (после уменьшения) не масштабируются
+MIN_SCALED_SIDE = 8
+
+# Как часто (в секундах) bank перечитывает папку с шаблонами
+REFRESH_INTERVAL = 2.0
+
+# Режимы сравнения шаблона (meta["match_mode"]):
+# color  — грубый поиск в сером, проверка в цвете (по умолчанию);
+# gray   — только серый: в 3 раза меньше работы, для иконок, различающихся формой, а не цветом;
+# masked — как color, но без пикселей вне маски: прозрачные пиксели PNG и рамка шириной
+#          meta["mask_border"] (углы и край иконки, где виден фон или индикатор отката);
+# edges  — по контурам (Canny), для иконок, у которых плывут цвета
+MATCH_COLOR = "color"
+MATCH_GRAY = "gray"
+MATCH_MASKED = "masked"
+MATCH_EDGES = "edges"
+MATCH_MODES = (MATCH_COLOR, MATCH_GRAY, MATCH_MASKED, MATCH_EDGES)
+
+# Рамка, исключаемая из сравнения в режиме masked, в пикселях (если у PNG нет прозрачности)
+MASK_BORDER = 2
+
+# Пороги Canny и размытие контуров (чтобы сдвиг на пиксель не обнулял совпадение)
+EDGE_LOW = 50
+EDGE_HIGH = 150
+EDGE_BLUR = 3
+
+# Рамка, исключаемая в режиме edges: контур края иконки зависит от фона под ней
+EDGE_BORDER = 2
+
+
+def downscale(image, scale=PYRAMID_SCALE):
+    """Уменьшенная копия для грубого уровня пирамиды или None, если шаблон слишком мал"""
+    h, w = image.shape[:2]
+    scaled_w, scaled_h = int(w * scale), int(h * scale)
+    if min(scaled_w, scaled_h) < MIN_SCALED_SIDE:
+        return None
+    return cv2.resize(image, (scaled_w, scaled_h), interpolation=cv2.INTER_AREA)
+
+
+def edge_map(gray):
+    """Размытая карта контуров серого изображения для режима edges"""
+    edges = cv2.Canny(gray, EDGE_LOW, EDGE_HIGH)
+    return cv2.GaussianBlur(edges, (EDGE_BLUR, EDGE_BLUR), 0)
+
+
+def build_mask(shape, alpha=None, border=0):
+    """
+    Маска сравнения (255 — пиксель сравнивается, 0 — нет).
+    :param shape: (h, w) шаблона
+    :param alpha: np.ndarray — альфа-канал PNG или None
+    :param border: int — ширина исключаемой рамки в пикселях
+    :return: np.ndarray uint8 или None, если сравниваются все пиксели
+    """
+    h, w = shape[:2]
+    mask = np.full((h, w), 255, dtype=np.uint8) if alpha is None else np.where(alpha > 0, 255, 0).astype(np.uint8)
+    if border > 0 and min(h, w) > 2 * border:
+        mask[:border, :] = 0
+        mask[-border:, :] = 0
+        mask[:, :border] = 0
+        mask[:, -border:] = 0
+    return None if mask.all() else mask
+
+
+def read_template(path):
+    """
+    Читает файл шаблона.
+    :return: (BGR-изображение, альфа-канал или None) или (None, None), если файл не читается
+    """
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        return None, None
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR), None
+    if image.shape[2] == 4:
+        alpha = image[:, :, 3]
+        return np.ascontiguousarray(image[:, :, :3]), (None if alpha.min() == 255 else alpha.copy())
+    return image, None
+
+
+class TemplateEntry:
+    """
+    Один декодированный шаблон и его предрасчитанные формы для матчера
+    """
+
+    def __init__(self, name, path, image, mtime, size, precomputed=None, meta=None, alpha=None):
+        """
+        :param precomputed: (gray, scaled, mean, std) — уже посчитанные формы (например, из TemplateStore)
+        :param meta: dict — дополнительные данные шаблона (категория, разрешение, режим сравнения и т.п.)
+        :param alpha: np.ndarray — альфа-канал PNG (для режима masked) или None
+        """
+        self.name = name
+        self.path = path
+        self.image = image
+        self.mtime = mtime
+        self.size = size
+        self.meta = meta or {}
+        self.alpha = alpha
+        # Формы для режимов masked и edges считаются при первом запросе
+        self._edges = None
+        self._mode_forms = None
+
+        if precomputed is not None:
+            self.gray, self.scaled, self.mean, self.std = precomputed
+            return
+
+        self.gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        self.scaled = downscale(self.gray)
+
+        mean, std = cv2.meanStdDev(self.gray)
+        self.mean = float(mean[0][0])
+        self.std = float(std[0][0])
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    @property
+    def match_mode(self):
+        """Режим сравнения из meta (неизвестный режим — color)"""
+        mode = self.meta.get("match_mode", MATCH_COLOR)
+        return mode if mode in MATCH_MODES else MATCH_COLOR
+
+    @property
+    def threshold(self):
+        """Собственный порог шаблона из meta или None (порог матчера)"""
+        threshold = self.meta.get("threshold")
+        return None if threshold is None else float(threshold)
+
+    @property
+    def edges(self):
+        """Карта контуров для режима edges"""
+        if self._edges is None:
+            self._edges = edge_map(self.gray)
+        return self._edges
+
+    def mode_forms(self):
+        """
+        Формы для режимов masked и edges.
+        Маской проверяется только окно вокруг кандидата, а грубый поиск (в том числе на
+        уровне пирамиды) идёт без маски по прямоугольнику, который она покрывает.
+        :return: (маска или None, грубый шаблон, его уменьшенная копия или None,
+                  (dx, dy) — смещение грубого шаблона внутри полного)
+        """
+        if self._mode_forms is None:
+            if self.match_mode == MATCH_EDGES:
+                source, border = self.edges, self.meta.get("mask_border", EDGE_BORDER)
+            else:
+                source, border = self.gray, self.meta.get("mask_border", MASK_BORDER if self.alpha is None else 0)
+            mask = build_mask(source.shape, self.alpha, int(border))
+            if mask is not None and not mask.any():
+                mask = None
+            x, y, w, h = cv2.boundingRect(mask) if mask is not None else (0, 0, source.shape[1], source.shape[0])
+            # Угол грубого шаблона выравнивается (внутрь маски) по шагу пирамиды, как у полного шаблона
+            step = max(1, int(round(1 / PYRAMID_SCALE)))
+            dx, dy = -x % step, -y % step
+            x, y, w, h = x + dx, y + dy, max(1, w - dx), max(1, h - dy)
+            coarse = source[y:y + h, x:x + w]
+            self._mode_forms = (mask, coarse, downscale(coarse), (x, y))
+        return self._mode_forms
+
+    def __repr__(self):
+        h, w = self.image.shape[:2]
+        return f"<TemplateEntry {self.name} {w}x{h}>"
+
+
+class TemplateBank:
+    """
+    Кэш шаблонов из одной папки.
+    Каждый файл декодируется один раз; при обновлении перечитываются только файлы,
+    у которых изменились mtime или размер, удалённые файлы убираются из кэша.
+    """
+
+    def __init__(self, directory, extensions=TEMPLATE_EXTENSIONS, refresh_interval=REFRESH_INTERVAL):
+        self.directory = directory
+        self.extensions = extensions
+        self.refresh_interval = refresh_interval
+        self._entries = {}
+        self._last_refresh = None
+        self._lock = threading.RLock()
+        # Увеличивается при каждом изменении набора шаблонов
+        self.version = 0
+
+    def refresh(self, force=False):
+        """
+        Синхронизирует кэш с папкой.
+        Без force повторная проверка диска выполняется не чаще refresh_interval.
+        :return: TemplateBank — self, чтобы можно было писать bank.refresh().entries()
+        """
+        with self._lock:
+            now = time.monotonic()
+            if (not force and self._last_refresh is not None
+                    and now - self._last_refresh < self.refresh_interval):
+                return self
+            self._last_refresh = now
+            with get_metrics().timer("template_refresh"):
+                self._scan()
+            return self
+
+    def _scan(self):
+        """Сверяет кэш с содержимым папки (вызывается под блокировкой)"""
+        if not os.path.isdir(self.directory):
+            if self._entries:
+                self._entries.clear()
+                self.version += 1
+            return
+
+        seen = set()
+        with os.scandir(self.directory) as it:
+            for item in it:
+                if not item.is_file() or not item.name.lower().endswith(self.extensions):
+                    continue
+                seen.add(item.name)
+                stat = item.stat()
+                entry = self._entries.get(item.name)
+                if entry is not None and entry.mtime == stat.st_mtime and entry.size == stat.st_size:
+                    continue
+                self._load(item.name, item.path, stat)
+
+        for name in list(self._entries):
+            if name not in seen:
+                del self._entries[name]
+                self.version += 1
+
+    def _load(self, name, path, stat):
+        with get_metrics().timer("template_load"):
+            image, alpha = read_template(path)
+        if image is None:
+            logger.warning(f"⚠️ Не удалось загрузить шаблон: {path}")
+            if self._entries.pop(name, None) is not None:
+                self.version += 1
+            return
+        self._entries[name] = TemplateEntry(name, path, image, stat.st_mtime, stat.st_size, alpha=alpha)
+        self.version += 1
+
+    def entries(self):
+        """Список шаблонов, отсортированный по имени файла"""
+        with self._lock:
+            return [self._entries[name] for name in sorted(self._entries)]
+
+    def get(self, name):
+        """Шаблон по имени файла или None"""
+        with self._lock:
+            return self._entries.get(name)
+
+    def invalidate(self, name=None):
+        """Сбрасывает один шаблон (или все) — следующий refresh перечитает их с диска"""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+            self._last_refresh = None
+            self.version += 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __iter__(self):
+        return iter(self.entries())
+
+
+_banks = {}
+_banks_lock = threading.Lock()
+
+
+def get_template_bank(directory):
+    """
+    Возвращает общий для всего процесса TemplateBank для папки.
+    Окно авто-еды и другие потребители получают один и тот же кэш.
+    """
+    key = os.path.normcase(os.path.abspath(directory))
+    with _banks_lock:
+        bank = _banks.get(key)
+        if bank is None:
+            bank = TemplateBank(directory)
+            _banks[key] = bank
+        return bank
@@ -0,0 +1,174 @@
+"""
+Поиск почти одинаковых шаблонов по перцептивному хешу.
+
+Одна и та же иконка, снятая в разные дни, даёт немного разные вырезки (другие границы,
+сдвиг на пиксель), а каждая из них стоит отдельного matchTemplate на каждой проверке.
+Дубликаты ищутся в два шага:
+1. pHash (DCT уменьшенного серого изображения, 63 бита) отбирает кандидатов
+   с расстоянием Хэмминга не больше HASH_DISTANCE — это дёшево даже для сотен шаблонов;
+2. кандидат подтверждается корреляцией: середина меньшей вырезки ищется в большей,
+   поэтому несовпадающие границы вырезок не мешают.
+
+    from modules.template_dedup import find_duplicates, find_clusters
+    duplicates = find_duplicates(image, store.load_entries("food"))
+    for cluster in find_clusters(store.load_entries("food")):
+        print(cluster.keep.name, [d.entry.name for d in cluster.duplicates])
+"""
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from modules.ui_scale import resize_to_scale, template_scale, quantize_scale
+
+# Сторона уменьшенного изображения для DCT и сторона блока низких частот
+HASH_IMAGE_SIZE = 32
+HASH_SIZE = 8
+
+# Максимальное расстояние Хэмминга между хешами кандидатов (из 63 бит).
+# У разных иконок расстояние в среднем около 31; у вырезок одной иконки, сдвинутых
+# на 1-2 пикселя, — до 20. Порог только отбирает кандидатов, решает корреляция.
+HASH_DISTANCE = 20
+
+# Минимальная корреляция, при которой кандидат считается дубликатом
+DUPLICATE_SCORE = 0.9
+
+# Вырезки, размеры которых (после приведения к одному масштабу UI) отличаются сильнее, не сравниваются
+MAX_SIZE_RATIO = 1.3
+
+# Доля стороны, отрезаемая с каждого края меньшей вырезки перед поиском в большей
+CROP_MARGIN = 0.1
+
+# entry — похожий шаблон, distance — расстояние Хэмминга между хешами, score — корреляция
+Duplicate = namedtuple("Duplicate", ["entry", "distance", "score"])
+
+# keep — шаблон, который остаётся (больше всего похож на остальные), duplicates — list[Duplicate]
+Cluster = namedtuple("Cluster", ["keep", "duplicates"])
+
+
+def _gray(image):
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def phash(image):
+    """
+    Перцептивный хеш изображения.
+    :param image: np.ndarray — BGR или серое изображение
+    :return: int — 63 бита (постоянная составляющая DCT в хеш не входит)
+    """
+    small = cv2.resize(_gray(image), (HASH_IMAGE_SIZE, HASH_IMAGE_SIZE), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(small.astype(np.float32))[:HASH_SIZE, :HASH_SIZE].flatten()[1:]
+    value = 0
+    for bit in low > np.median(low):
+        value = (value << 1) | int(bit)
+    return value
+
+
+def format_hash(value):
+    """Хеш в виде строки для хранилища"""
+    return f"{value:016x}"
+
+
+def parse_hash(text):
+    return int(text, 16)
+
+
+def hash_distance(a, b):
+    """Расстояние Хэмминга между двумя хешами"""
+    return bin(a ^ b).count("1")
+
+
+def entry_hash(entry):
+    """Хеш шаблона: из хранилища (meta["phash"]) или посчитанный заново"""
+    stored = entry.meta.get("phash")
+    return parse_hash(stored) if stored else phash(entry.image)
+
+
+def similarity(image_a, image_b):
+    """
+    Корреляция двух вырезок одной иконки: середина меньшей ищется в большей.
+    :return: float — от -1 до 1; 0.0, если размеры несопоставимы
+    """
+    a, b = _gray(image_a), _gray(image_b)
+    (ha, wa), (hb, wb) = a.shape, b.shape
+    if max(ha / hb, hb / ha, wa / wb, wb / wa) > MAX_SIZE_RATIO:
+        return 0.0
+    small, large = (a, b) if ha * wa <= hb * wb else (b, a)
+    h, w = small.shape
+    dy, dx = int(h * CROP_MARGIN), int(w * CROP_MARGIN)
+    inner = small[dy:h - dy, dx:w - dx][:large.shape[0], :large.shape[1]]
+    result = cv2.matchTemplate(large, inner, cv2.TM_CCOEFF_NORMED)
+    return float(np.nan_to_num(result.max()))
+
+
+def _at_scale(entry, ui_scale):
+    """Изображение шаблона, приведённое к масштабу UI ui_scale (None — как есть)"""
+    if ui_scale is None:
+        return entry.image
+    factor = quantize_scale(ui_scale / template_scale(entry))
+    if factor == 1.0:
+        return entry.image
+    image = resize_to_scale(entry.image, factor)
+    return entry.image if image is None else image
+
+
+def find_duplicates(image, entries, ui_scale=None, max_distance=HASH_DISTANCE, min_score=DUPLICATE_SCORE):
+    """
+    Шаблоны, почти совпадающие с изображением.
+    :param image: np.ndarray — новая вырезка (BGR)
+    :param entries: iterable[TemplateEntry] — существующие шаблоны
+    :param ui_scale: float — масштаб UI, на котором снята вырезка (шаблоны приводятся к нему)
+    :return: list[Duplicate] по убыванию score
+    """
+    target = phash(image)
+    found = []
+    for entry in entries:
+        distance = hash_distance(target, entry_hash(entry))
+        if distance > max_distance:
+            continue
+        score = similarity(image, _at_scale(entry, ui_scale))
+        if score >= min_score:
+            found.append(Duplicate(entry, distance, score))
+    found.sort(key=lambda d: d.score, reverse=True)
+    return found
+
+
+def find_clusters(entries, max_distance=HASH_DISTANCE, min_score=DUPLICATE_SCORE):
+    """
+    Группы почти одинаковых шаблонов библиотеки.
+    Шаблоны сравниваются попарно (pHash + корреляция). Группы строятся жадно: первым
+    остаётся шаблон с наибольшим числом похожих (при равенстве — с большим суммарным
+    сходством, затем меньшая вырезка), в его группу попадают только шаблоны, похожие
+    на него самого, а не через цепочку соседей; затем то же для оставшихся.
+    :return: list[Cluster] — только группы из двух и больше шаблонов
+    """
+    entries = list(entries)
+    hashes = [entry_hash(e) for e in entries]
+
+    # i -> {j: (расстояние, корреляция)} для похожих пар
+    links = {i: {} for i in range(len(entries))}
+    for i in range(len(entries)):
+        for j in range(i + 1, len(entries)):
+            distance = hash_distance(hashes[i], hashes[j])
+            if distance > max_distance:
+                continue
+            score = similarity(entries[i].image, _at_scale(entries[j], template_scale(entries[i])))
+            if score >= min_score:
+                links[i][j] = links[j][i] = (distance, score)
+
+    clusters = []
+    free = set(range(len(entries)))
+    while free:
+        # Меньшая вырезка предпочтительнее: в ней меньше фона и её дешевле сравнивать
+        keep = max(sorted(free), key=lambda i: (len(links[i].keys() & free),
+                                                sum(links[i][j][1] for j in links[i].keys() & free),
+                                                -entries[i].image.size))
+        members = links[keep].keys() & free
+        free -= members | {keep}
+        if not members:
+            continue
+        duplicates = [Duplicate(entries[i], *links[keep][i]) for i in members]
+        duplicates.sort(key=lambda d: d.score, reverse=True)
+        clusters.append(Cluster(entries[keep], duplicates))
+    clusters.sort(key=lambda c: c.keep.name)
+    return clusters
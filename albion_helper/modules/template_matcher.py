@@ -1,19 +1,344 @@
+from collections import namedtuple
+
 import cv2
 import numpy as np
 
+from modules.template_bank import (PYRAMID_SCALE, MATCH_COLOR, MATCH_GRAY, MATCH_MASKED, MATCH_EDGES,
+                                   downscale, edge_map)
+from modules.metrics import get_metrics
+from modules.ui_scale import ScaledTemplateCache, resize_to_scale, quantize_scale
+
+# Порог по умолчанию; у шаблона может быть свой (meta["threshold"])
 MATCH_THRESHOLD = 0.85
 
-def find_template_in_image(screen_img, template_img):
+# Насколько ниже порога может быть серый (предварительный) результат,
+# чтобы шаблон всё ещё проверялся в цвете
+PREFILTER_MARGIN = 0.15
+
+# То же для уменьшенного уровня пирамиды: при смещении иконки на нечётный пиксель
+# грубый результат заметно ниже, чем в полном разрешении
+PYRAMID_MARGIN = 0.4
+
+# Отступ окна проверки вокруг найденной позиции, в пикселях
+VERIFY_PADDING = 2
+
+# Насколько иконка может сдвинуться от последней известной позиции, в пикселях
+TRACK_MARGIN = 6
+
+# template_id — имя шаблона, score — лучший коэффициент корреляции,
+# bbox — (x, y, width, height) на изображении экрана, matched — прошёл ли порог
+MatchResult = namedtuple("MatchResult", ["template_id", "score", "bbox", "matched"])
+
+# Шаблон, подготовленный к сравнению в своём режиме (см. MATCH_MODES в template_bank):
+# image — что сравнивается при проверке (BGR, серый или контуры), mask — маска или None,
+# coarse/scaled — шаблон для грубого поиска в полном и уменьшенном разрешении (scaled может быть None),
+# offset — (dx, dy) грубого шаблона внутри полного, threshold — собственный порог шаблона или None
+_Part = namedtuple("_Part", ["id", "mode", "threshold", "image", "mask", "coarse", "scaled", "offset"])
+
+
+def best_match(screen_img, template_img, method=cv2.TM_CCOEFF_NORMED, mask=None):
+    """
+    Ищет лучшую позицию шаблона на изображении.
+    :param mask: np.ndarray — маска шаблона (0 — пиксель не сравнивается) или None
+    :return: (score, (x, y, width, height)) или None, если шаблон больше изображения
+    """
+    if screen_img.shape[0] < template_img.shape[0] or screen_img.shape[1] < template_img.shape[1]:
+        return None
+
+    result = cv2.matchTemplate(screen_img, template_img, method, mask=mask)
+    if mask is not None:
+        # С маской результат на однотонных участках не определён (NaN/inf)
+        np.nan_to_num(result, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+    _, max_val, _, max_loc = cv2.minMaxLoc(result)
+    h, w = template_img.shape[:2]
+    return float(max_val), (max_loc[0], max_loc[1], w, h)
+
+
+def find_template_in_image(screen_img, template, threshold=None):
     """
     Ищет шаблон на изображении экрана.
+    :param template: np.ndarray (BGR) или TemplateEntry — у записи учитываются режим сравнения и порог
+    :param threshold: float — порог вместо порога шаблона / MATCH_THRESHOLD
     Возвращает True, если найдено совпадение.
     """
-    if screen_img.shape[0] < template_img.shape[0] or screen_img.shape[1] < template_img.shape[1]:
+    if hasattr(template, "image"):
+        part = _template_part(template)
+        match = best_match(_Screen(screen_img).verify_view(part.mode), part.image, mask=part.mask)
+    else:
+        part = None
+        match = best_match(screen_img, template)
+    if match is None:
         return False
+    if threshold is None:
+        threshold = part.threshold if part is not None and part.threshold is not None else MATCH_THRESHOLD
+    return match[0] >= threshold
+
+
+def _template_part(template):
+    """_Part для TemplateEntry (в режиме из его meta) или пары (id, BGR-изображение) (режим color)"""
+    if not hasattr(template, "image"):
+        template_id, image = template
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return _Part(template_id, MATCH_COLOR, None, image, None, gray, downscale(gray), (0, 0))
+    mode, threshold = template.match_mode, template.threshold
+    if mode == MATCH_GRAY:
+        return _Part(template.name, mode, threshold, template.gray, None, template.gray, template.scaled, (0, 0))
+    if mode in (MATCH_MASKED, MATCH_EDGES):
+        image = template.edges if mode == MATCH_EDGES else template.image
+        return _Part(template.name, mode, threshold, image, *template.mode_forms())
+    return _Part(template.name, mode, threshold, template.image, None, template.gray, template.scaled, (0, 0))
+
+
+class _Screen:
+    """Кадр и его формы для разных режимов: серый, уменьшенный и контуры считаются по первому запросу"""
+
+    def __init__(self, image, gray=None, pyramid_scale=PYRAMID_SCALE):
+        self.image = image
+        self.pyramid_scale = pyramid_scale
+        self._gray = gray
+        self._scaled = None
+        self._edges = None
+        self._scaled_edges = None
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    @property
+    def scaled(self):
+        if self._scaled is None:
+            h, w = self.gray.shape[:2]
+            self._scaled = cv2.resize(self.gray, (int(w * self.pyramid_scale), int(h * self.pyramid_scale)),
+                                      interpolation=cv2.INTER_AREA)
+        return self._scaled
+
+    @property
+    def edges(self):
+        if self._edges is None:
+            self._edges = edge_map(self.gray)
+        return self._edges
+
+    def verify_view(self, mode):
+        """Изображение, с которым сравнивается шаблон в режиме mode при проверке"""
+        if mode == MATCH_GRAY:
+            return self.gray
+        if mode == MATCH_EDGES:
+            return self.edges
+        return self.image
 
-    result = cv2.matchTemplate(screen_img, template_img, cv2.TM_CCOEFF_NORMED)
-    _, max_val, _, _ = cv2.minMaxLoc(result)
+    def coarse_view(self, mode):
+        """Изображение для грубого поиска в полном разрешении"""
+        return self.edges if mode == MATCH_EDGES else self.gray
 
-    if max_val >= MATCH_THRESHOLD:
-        return True
-    return False
\ No newline at end of file
+    def scaled_view(self, mode):
+        """Изображение для грубого поиска на уровне пирамиды"""
+        if mode != MATCH_EDGES:
+            return self.scaled
+        if self._scaled_edges is None:
+            h, w = self.edges.shape[:2]
+            self._scaled_edges = cv2.resize(self.edges, (int(w * self.pyramid_scale), int(h * self.pyramid_scale)),
+                                            interpolation=cv2.INTER_AREA)
+        return self._scaled_edges
+
+
+def _verify(screen_img, image, bbox, padding=VERIFY_PADDING, mask=None):
+    """Проверка шаблона в маленьком окне вокруг позиции bbox (в цвете, сером или по контурам)"""
+    x, y, w, h = bbox
+    left, top = max(0, x - padding), max(0, y - padding)
+    right = min(screen_img.shape[1], x + w + padding)
+    bottom = min(screen_img.shape[0], y + h + padding)
+    match = best_match(screen_img[top:bottom, left:right], image, mask=mask)
+    if match is None:
+        return None
+    score, (mx, my, mw, mh) = match
+    return score, (left + mx, top + my, mw, mh)
+
+
+class TemplateMatcher:
+    """
+    Матчер набора шаблонов с состоянием между кадрами.
+    1. Шаблоны, найденные на прошлых кадрах, сначала проверяются в окне вокруг
+       последней позиции — иконки баффов почти не двигаются.
+    2. Остальные ищутся грубо: на уменьшенном сером кадре (уровень пирамиды)
+       или, при use_pyramid=False, на сером кадре в полном разрешении.
+    3. Кандидаты проверяются в полном разрешении в маленьком окне.
+    Как сравнивается шаблон, задаёт его режим (meta["match_mode"]): color — проверка
+    в цвете, gray — только серый, masked — проверка с маской
+    (грубый поиск — по прямоугольнику, который покрывает маска), edges — по контурам. Порог шаблона (meta["threshold"]) заменяет общий threshold.
+    Шаблоны предварительно приводятся к масштабу UI (scale); копии под масштаб
+    строятся один раз и берутся из scale_cache.
+    """
+
+    def __init__(self, threshold=MATCH_THRESHOLD, use_pyramid=True, track=True,
+                 pyramid_scale=PYRAMID_SCALE, track_margin=TRACK_MARGIN, scale=1.0, scale_cache=None):
+        self.threshold = threshold
+        self.use_pyramid = use_pyramid
+        self.track = track
+        self.pyramid_scale = pyramid_scale
+        self.track_margin = track_margin
+        self.scale = quantize_scale(scale)
+        self.scale_cache = scale_cache or ScaledTemplateCache()
+        # template_id -> bbox последнего совпадения, по порядку от самого свежего
+        self._last_locations = {}
+        self.stats = {"tracked_hits": 0, "tracked_misses": 0, "coarse_scans": 0, "full_scans": 0}
+
+    def forget(self, template_id=None):
+        """Забывает последнюю позицию шаблона (или всех шаблонов)"""
+        if template_id is None:
+            self._last_locations.clear()
+        else:
+            self._last_locations.pop(template_id, None)
+
+    def set_scale(self, scale):
+        """Меняет масштаб UI; позиции, запомненные на прежнем масштабе, забываются"""
+        scale = quantize_scale(scale)
+        if scale != self.scale:
+            self.scale = scale
+            self.forget()
+
+    def scaled(self, templates):
+        """
+        Шаблоны под текущий масштаб UI.
+        TemplateEntry берутся из кэша; пары (id, изображение) масштабируются при каждом вызове.
+        """
+        result = []
+        for template in templates:
+            if hasattr(template, "image"):
+                template = self.scale_cache.entry(template, self.scale)
+            elif self.scale != 1.0:
+                image = resize_to_scale(template[1], self.scale)
+                template = None if image is None else (template[0], image)
+            if template is not None:
+                result.append(template)
+        return result
+
+    def _remember(self, template_id, bbox):
+        if self.track:
+            self._last_locations.pop(template_id, None)
+            self._last_locations[template_id] = bbox
+
+    def match(self, screen_img, templates, first_hit=True, screen_gray=None):
+        """
+        Ищет набор шаблонов на кадре.
+        :param screen_img: np.ndarray — BGR-кадр
+        :param templates: iterable — TemplateEntry из TemplateBank или пары (id, BGR-изображение)
+        :param first_hit: bool — остановиться на первом уверенном совпадении;
+                          иначе проверяются и ранжируются все кандидаты
+        :param screen_gray: np.ndarray — готовый серый кадр, если он уже посчитан
+        :return: list[MatchResult] — сначала совпадения, затем остальные, внутри групп
+                 по убыванию score. Для шаблонов, не дошедших до цветной проверки,
+                 score — результат грубого поиска.
+        """
+        with get_metrics().timer("match"):
+            return self._match(screen_img, templates, first_hit, screen_gray)
+
+    def _threshold(self, part):
+        return self.threshold if part.threshold is None else part.threshold
+
+    def _coarse(self, screen, part):
+        """
+        Грубый поиск одного шаблона.
+        :return: ((score, bbox) или None, отступ окна проверки, допуск к порогу)
+        """
+        h, w = part.image.shape[:2]
+        dx, dy = part.offset
+        if self.use_pyramid and part.scaled is not None:
+            match = best_match(screen.scaled_view(part.mode), part.scaled)
+            if match is not None:
+                self.stats["coarse_scans"] += 1
+                score, (x, y, _, _) = match
+                bbox = (int(round(x / self.pyramid_scale)) - dx, int(round(y / self.pyramid_scale)) - dy, w, h)
+                padding = VERIFY_PADDING + int(np.ceil(1 / self.pyramid_scale))
+                return (score, bbox), padding, PYRAMID_MARGIN
+        match = best_match(screen.coarse_view(part.mode), part.coarse)
+        if match is None:
+            return None, VERIFY_PADDING, PREFILTER_MARGIN
+        self.stats["full_scans"] += 1
+        score, (x, y, _, _) = match
+        return (score, (x - dx, y - dy, w, h)), VERIFY_PADDING, PREFILTER_MARGIN
+
+    def _match(self, screen_img, templates, first_hit, screen_gray):
+        metrics = get_metrics()
+        parts = [_template_part(t) for t in self.scaled(templates)]
+        if self.use_pyramid and self.pyramid_scale != PYRAMID_SCALE:
+            # Предрасчитанные копии в TemplateBank сделаны под PYRAMID_SCALE
+            parts = [p._replace(scaled=downscale(p.coarse, self.pyramid_scale)) for p in parts]
+        screen = _Screen(screen_img, screen_gray, self.pyramid_scale)
+        results = []
+
+        # 1. Проверка последних известных позиций
+        if self.track and self._last_locations:
+            by_id = {p.id: p for p in parts}
+            for template_id in reversed(list(self._last_locations)):
+                part = by_id.get(template_id)
+                if part is None:
+                    continue
+                verified = _verify(screen.verify_view(part.mode), part.image, self._last_locations[template_id],
+                                   self.track_margin, part.mask)
+                if verified is not None and verified[0] >= self._threshold(part):
+                    self.stats["tracked_hits"] += 1
+                    self._remember(template_id, verified[1])
+                    results.append(MatchResult(template_id, verified[0], verified[1], True))
+                    if first_hit:
+                        return results
+                else:
+                    self.stats["tracked_misses"] += 1
+                    self.forget(template_id)
+            found = {r.template_id for r in results}
+            parts = [p for p in parts if p.id not in found]
+
+        # 2. Грубый поиск (серый кадр, его уменьшенная копия и контуры считаются, только если нужны)
+        candidates = []
+        template_timer = metrics.timer("match_template")
+        for part in parts:
+            with template_timer:
+                match, padding, margin = self._coarse(screen, part)
+            if match is None:
+                continue
+
+            score, bbox = match
+            if score >= self._threshold(part) - margin:
+                candidates.append((score, part, bbox, padding))
+            else:
+                results.append(MatchResult(part.id, score, bbox, False))
+
+        # 3. Проверка кандидатов в полном разрешении в режиме шаблона
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        verify_timer = metrics.timer("match_verify")
+        for idx, (coarse_score, part, bbox, padding) in enumerate(candidates):
+            with verify_timer:
+                verified = _verify(screen.verify_view(part.mode), part.image, bbox, padding, part.mask)
+            if verified is None:
+                results.append(MatchResult(part.id, coarse_score, bbox, False))
+                continue
+            score, bbox = verified
+            matched = score >= self._threshold(part)
+            results.append(MatchResult(part.id, score, bbox, matched))
+            if matched:
+                self._remember(part.id, bbox)
+                if first_hit:
+                    results.extend(MatchResult(c[1].id, c[0], c[2], False) for c in candidates[idx + 1:])
+                    break
+
+        results.sort(key=lambda r: (r.matched, r.score), reverse=True)
+        return results
+
+
+def match_templates(screen_img, templates, threshold=MATCH_THRESHOLD, first_hit=True, screen_gray=None):
+    """
+    Ищет сразу набор шаблонов на одном кадре без состояния между вызовами.
+    Сначала все шаблоны прогоняются по серому кадру (в 3 раза дешевле цветного),
+    затем кандидаты проверяются в маленьком окне вокруг найденной позиции
+    в порядке убывания серого результата (в цвете или в режиме шаблона, см. TemplateMatcher).
+    :param screen_img: np.ndarray — BGR-кадр
+    :param templates: iterable — TemplateEntry из TemplateBank или пары (id, BGR-изображение)
+    :param threshold: float — порог совпадения для шаблонов без собственного порога
+    :param first_hit: bool — остановить проверку на первом уверенном совпадении;
+                      иначе проверяются и ранжируются все кандидаты
+    :param screen_gray: np.ndarray — готовый серый кадр, если он уже посчитан
+    :return: list[MatchResult] — см. TemplateMatcher.match
+    """
+    matcher = TemplateMatcher(threshold, use_pyramid=False, track=False)
+    return matcher.match(screen_img, templates, first_hit=first_hit, screen_gray=screen_gray)
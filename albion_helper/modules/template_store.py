@@ -0,0 +1,559 @@
+"""
+Хранилище шаблонов в SQLite вместо JSON-файлов, которые каждый раз читались и
+перезаписывались целиком.
+
+- ключ — (категория, имя); вставка атомарна, дубликат даёт TemplateExistsError;
+- индексы по категории и разрешению — выборки не сканируют всю библиотеку;
+- рядом с изображением хранятся формы для матчера (серый, уменьшенный серый,
+  среднее и отклонение), поэтому загрузка сотен шаблонов не пересчитывает их,
+  и альфа-канал PNG для режима сравнения masked;
+- у каждого изображения есть перцептивный хеш (phash) — по нему find_similar
+  находит почти одинаковые шаблоны, а update_image заменяет изображение существующего;
+- режим сравнения и порог шаблона хранятся в meta (set_match_mode);
+- StoreTemplateBank даёт тот же интерфейс, что TemplateBank, и подхватывает PNG,
+  положенные в папку категории вручную.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from utils.paths import ROOT_DIR, TEMPLATES_DIR, TEMPLATE_STORE_DB, EFFECT_TEMPLATES_JSON
+from modules.template_bank import (TemplateEntry, TEMPLATE_EXTENSIONS, REFRESH_INTERVAL, PYRAMID_SCALE, MIN_SCALED_SIDE,
+                                   MATCH_MODES, read_template)
+from modules.template_dedup import phash, format_hash, find_duplicates
+from modules.metrics import get_metrics
+
+logger = logging.getLogger("AlbionHelperLogger")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    category   TEXT NOT NULL,
+    name       TEXT NOT NULL,
+    label      TEXT,
+    x          INTEGER,
+    y          INTEGER,
+    width      INTEGER,
+    height     INTEGER,
+    resolution TEXT,
+    source     TEXT,
+    source_mtime REAL,
+    source_size  INTEGER,
+    meta       TEXT,
+    created    REAL NOT NULL,
+    image      BLOB,
+    gray       BLOB,
+    scaled     BLOB,
+    scaled_w   INTEGER,
+    scaled_h   INTEGER,
+    mean       REAL,
+    std        REAL,
+    alpha      BLOB,
+    phash      TEXT,
+    PRIMARY KEY (category, name)
+);
+CREATE INDEX IF NOT EXISTS templates_resolution ON templates (category, resolution);
+CREATE INDEX IF NOT EXISTS templates_source ON templates (source);
+CREATE TABLE IF NOT EXISTS revisions (
+    category TEXT PRIMARY KEY,
+    value    INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS migrations (
+    path TEXT PRIMARY KEY,
+    done REAL NOT NULL
+);
+"""
+
+RECORD_FIELDS = ["category", "name", "label", "x", "y", "width", "height", "resolution", "source", "meta", "created"]
+
+# Колонки изображения и предрасчитанных форм (порядок как в _decode_entry)
+IMAGE_FIELDS = ["image", "gray", "scaled", "scaled_w", "scaled_h", "mean", "std", "alpha", "phash"]
+
+# Колонки, добавленные после первой версии схемы: имя -> тип
+ADDED_COLUMNS = {"alpha": "BLOB", "phash": "TEXT"}
+
+# Запись без изображения — для выборок и списков
+TemplateRecord = namedtuple("TemplateRecord", RECORD_FIELDS)
+
+
+class TemplateExistsError(ValueError):
+    """Шаблон с таким именем в категории уже есть"""
+
+
+def _encode_image(image, alpha=None):
+    """BGR-изображение (и альфа-канал) -> значения колонок изображения и предрасчитанных форм"""
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape
+    scaled_w, scaled_h = int(w * PYRAMID_SCALE), int(h * PYRAMID_SCALE)
+    scaled = None
+    if min(scaled_w, scaled_h) >= MIN_SCALED_SIDE:
+        scaled = cv2.resize(gray, (scaled_w, scaled_h), interpolation=cv2.INTER_AREA)
+    mean, std = cv2.meanStdDev(gray)
+    return {
+        "width": w,
+        "height": h,
+        "image": image.tobytes(),
+        "gray": gray.tobytes(),
+        "scaled": scaled.tobytes() if scaled is not None else None,
+        "scaled_w": scaled_w if scaled is not None else None,
+        "scaled_h": scaled_h if scaled is not None else None,
+        "mean": float(mean[0][0]),
+        "std": float(std[0][0]),
+        "alpha": np.ascontiguousarray(alpha, dtype=np.uint8).tobytes() if alpha is not None else None,
+        "phash": format_hash(phash(image)),
+    }
+
+
+def _decode_entry(row):
+    """Строка с колонками изображения -> TemplateEntry без пересчёта форм"""
+    (category, name, label, x, y, width, height, resolution, source, meta, created,
+     image, gray, scaled, scaled_w, scaled_h, mean, std, alpha, image_hash) = row
+    img = np.frombuffer(image, dtype=np.uint8).reshape(height, width, 3)
+    gray_img = np.frombuffer(gray, dtype=np.uint8).reshape(height, width)
+    scaled_img = None
+    if scaled is not None:
+        scaled_img = np.frombuffer(scaled, dtype=np.uint8).reshape(scaled_h, scaled_w)
+    alpha_img = np.frombuffer(alpha, dtype=np.uint8).reshape(height, width) if alpha is not None else None
+    meta_dict = json.loads(meta) if meta else {}
+    meta_dict.update(category=category, label=label, resolution=resolution, x=x, y=y)
+    if image_hash:
+        meta_dict["phash"] = image_hash
+    return TemplateEntry(name, source or "", img, created, len(image),
+                         precomputed=(gray_img, scaled_img, mean, std), meta=meta_dict, alpha=alpha_img)
+
+
+class TemplateStore:
+    """
+    Хранилище шаблонов. Потокобезопасно: у каждого потока своё подключение,
+    база в режиме WAL, поэтому чтение из потока детекции не мешает записи из GUI.
+    """
+
+    def __init__(self, path=TEMPLATE_STORE_DB):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(templates)")}
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in columns:
+                # База создана до появления этой колонки
+                conn.execute(f"ALTER TABLE templates ADD COLUMN {column} {column_type}")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """Закрывает подключение текущего потока"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def _bump(conn, category):
+        conn.execute("INSERT INTO revisions (category, value) VALUES (?, 1) "
+                     "ON CONFLICT(category) DO UPDATE SET value = value + 1", (category,))
+
+    def revision(self, category):
+        """Счётчик изменений категории: меняется при каждой записи в неё"""
+        row = self._conn().execute("SELECT value FROM revisions WHERE category = ?", (category,)).fetchone()
+        return row[0] if row else 0
+
+    def add(self, name, category, image=None, x=None, y=None, width=None, height=None, label=None,
+            resolution=None, source=None, source_mtime=None, source_size=None, meta=None, replace=False,
+            alpha=None):
+        """
+        Добавляет шаблон одной транзакцией.
+        :param image: np.ndarray — BGR-изображение (None — только координаты области)
+        :param alpha: np.ndarray — альфа-канал изображения (прозрачные пиксели не сравниваются в режиме masked)
+        :param replace: bool — заменить существующий шаблон с тем же именем
+        :raises TemplateExistsError: шаблон уже есть, а replace=False
+        """
+        values = {
+            "category": category, "name": name, "label": label, "x": x, "y": y,
+            "width": width, "height": height, "resolution": resolution,
+            "source": source, "source_mtime": source_mtime, "source_size": source_size,
+            "meta": json.dumps(meta, ensure_ascii=False) if meta else None,
+            "created": time.time(),
+            "image": None, "gray": None, "scaled": None, "scaled_w": None, "scaled_h": None,
+            "mean": None, "std": None, "alpha": None, "phash": None,
+        }
+        if image is not None:
+            values.update(_encode_image(image, alpha))
+
+        columns = ", ".join(values)
+        placeholders = ", ".join(f":{k}" for k in values)
+        verb = "INSERT OR REPLACE" if replace else "INSERT"
+        conn = self._conn()
+        try:
+            with conn:
+                conn.execute(f"{verb} INTO templates ({columns}) VALUES ({placeholders})", values)
+                self._bump(conn, category)
+        except sqlite3.IntegrityError:
+            raise TemplateExistsError(f"Темплейт '{name}' уже существует в категории '{category}'")
+
+    def update_image(self, name, category, image, alpha=None, meta=None, source_mtime=None, source_size=None):
+        """
+        Заменяет изображение существующего шаблона, сохраняя имя, подпись и meta
+        (например, когда новая вырезка того же эффекта лучше старой).
+        :param meta: dict — поля, которые дописываются в meta шаблона
+        :param source_mtime: float — новое время изменения файла-источника (None — не менять)
+        :param source_size: int — новый размер файла-источника (None — не менять)
+        :return: bool — найден ли шаблон
+        """
+        values = _encode_image(image, alpha)
+        for column, value in (("source_mtime", source_mtime), ("source_size", source_size)):
+            if value is not None:
+                values[column] = value
+        conn = self._conn()
+        with conn:
+            row = conn.execute("SELECT meta FROM templates WHERE category = ? AND name = ?",
+                               (category, name)).fetchone()
+            if row is None:
+                return False
+            merged = json.loads(row[0]) if row[0] else {}
+            merged.update(meta or {})
+            values.update(meta=json.dumps(merged, ensure_ascii=False) if merged else None,
+                          category=category, name=name)
+            assignments = ", ".join(f"{k} = :{k}" for k in values if k not in ("category", "name"))
+            conn.execute(f"UPDATE templates SET {assignments} WHERE category = :category AND name = :name", values)
+            self._bump(conn, category)
+        return True
+
+    def ensure_hashes(self, category=None):
+        """
+        Считает перцептивный хеш шаблонам, сохранённым до его появления.
+        :return: int — сколько хешей посчитано
+        """
+        sql = "SELECT category, name, image, width, height FROM templates WHERE image IS NOT NULL AND phash IS NULL"
+        params = []
+        if category is not None:
+            sql += " AND category = ?"
+            params.append(category)
+        conn = self._conn()
+        rows = conn.execute(sql, params).fetchall()
+        if not rows:
+            return 0
+        updates = []
+        for row_category, name, image, width, height in rows:
+            img = np.frombuffer(image, dtype=np.uint8).reshape(height, width, 3)
+            updates.append((format_hash(phash(img)), row_category, name))
+        with conn:
+            # Хеш не влияет на матчинг, поэтому ревизия категории не меняется
+            conn.executemany("UPDATE templates SET phash = ? WHERE category = ? AND name = ?", updates)
+        return len(updates)
+
+    def find_similar(self, image, category, ui_scale=None):
+        """
+        Шаблоны категории, почти совпадающие с изображением (см. modules.template_dedup).
+        :param ui_scale: float — масштаб UI, на котором снято изображение
+        :return: list[Duplicate] — сначала самые похожие
+        """
+        self.ensure_hashes(category)
+        return find_duplicates(image, self.load_entries(category), ui_scale=ui_scale)
+
+    def delete(self, name, category):
+        """:return: bool — был ли шаблон удалён"""
+        conn = self._conn()
+        with conn:
+            deleted = conn.execute("DELETE FROM templates WHERE category = ? AND name = ?",
+                                   (category, name)).rowcount
+            if deleted:
+                self._bump(conn, category)
+        return bool(deleted)
+
+    def set_match_mode(self, name, category, mode, threshold=None, mask_border=None):
+        """
+        Записывает в meta шаблона режим сравнения и, если заданы, собственный порог
+        и ширину исключаемой рамки (None — убрать поле, будет значение по умолчанию).
+        :param mode: str — один из MATCH_MODES
+        :return: bool — найден ли шаблон
+        :raises ValueError: неизвестный режим или порог вне (0, 1]
+        """
+        if mode not in MATCH_MODES:
+            raise ValueError(f"Неизвестный режим сравнения: {mode} (допустимы: {', '.join(MATCH_MODES)})")
+        if threshold is not None and not 0 < threshold <= 1:
+            raise ValueError(f"Порог должен быть в (0, 1]: {threshold}")
+        conn = self._conn()
+        with conn:
+            row = conn.execute("SELECT meta FROM templates WHERE category = ? AND name = ?",
+                               (category, name)).fetchone()
+            if row is None:
+                return False
+            meta = json.loads(row[0]) if row[0] else {}
+            meta["match_mode"] = mode
+            for key, value in (("threshold", threshold), ("mask_border", mask_border)):
+                if value is None:
+                    meta.pop(key, None)
+                else:
+                    meta[key] = value
+            conn.execute("UPDATE templates SET meta = ? WHERE category = ? AND name = ?",
+                         (json.dumps(meta, ensure_ascii=False), category, name))
+            self._bump(conn, category)
+        return True
+
+    def exists(self, name, category):
+        return self._conn().execute("SELECT 1 FROM templates WHERE category = ? AND name = ?",
+                                    (category, name)).fetchone() is not None
+
+    def get(self, name, category):
+        """:return: TemplateRecord или None"""
+        row = self._conn().execute(f"SELECT {', '.join(RECORD_FIELDS)} FROM templates "
+                                   "WHERE category = ? AND name = ?", (category, name)).fetchone()
+        return TemplateRecord(*row) if row else None
+
+    def find(self, category=None, resolution=None, label=None):
+        """
+        Выборка записей (без изображений) по категории, разрешению и подписи.
+        :return: list[TemplateRecord], отсортированный по имени
+        """
+        clauses, params = [], []
+        for column, value in (("category", category), ("resolution", resolution), ("label", label)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn().execute(f"SELECT {', '.join(RECORD_FIELDS)} FROM templates {where} ORDER BY name",
+                                    params).fetchall()
+        return [TemplateRecord(*row) for row in rows]
+
+    def categories(self):
+        return [row[0] for row in self._conn().execute("SELECT DISTINCT category FROM templates ORDER BY 1")]
+
+    def load_entries(self, category, resolution=None):
+        """
+        Шаблоны категории с изображениями (для матчера).
+        :param resolution: str — только шаблоны этого разрешения и без указанного разрешения
+        :return: list[TemplateEntry]
+        """
+        sql = (f"SELECT {', '.join(RECORD_FIELDS + IMAGE_FIELDS)} "
+               "FROM templates WHERE category = ? AND image IS NOT NULL")
+        params = [category]
+        if resolution is not None:
+            sql += " AND (resolution = ? OR resolution IS NULL)"
+            params.append(resolution)
+        rows = self._conn().execute(sql + " ORDER BY name", params).fetchall()
+        return [_decode_entry(row) for row in rows]
+
+    def load_entry(self, name, category):
+        """:return: TemplateEntry или None (нет шаблона или у него нет изображения)"""
+        row = self._conn().execute(
+            f"SELECT {', '.join(RECORD_FIELDS + IMAGE_FIELDS)} "
+            "FROM templates WHERE category = ? AND name = ? AND image IS NOT NULL", (category, name)).fetchone()
+        return _decode_entry(row) if row else None
+
+    def sync_directory(self, directory, category):
+        """
+        Переносит в хранилище изображения из папки: новые файлы добавляются под именем файла,
+        у изменившихся обновляется изображение в записи, к которой файл уже привязан
+        (даже если она названа иначе, например перенесена из JSON), записи удалённых файлов убираются.
+        :return: int — сколько записей изменено
+        """
+        directory = os.path.abspath(directory)
+        known = {}      # файл -> (время изменения, размер)
+        names = {}      # файл -> имя записи, к которой он привязан
+        for source, mtime, size, name in self._conn().execute(
+                "SELECT source, source_mtime, source_size, name FROM templates "
+                "WHERE category = ? AND source IS NOT NULL", (category,)):
+            known[source] = (mtime, size)
+            names[source] = name
+        changed = 0
+        seen = set()
+        if os.path.isdir(directory):
+            with os.scandir(directory) as it:
+                for item in it:
+                    if not item.is_file() or not item.name.lower().endswith(TEMPLATE_EXTENSIONS):
+                        continue
+                    path = os.path.abspath(item.path)
+                    seen.add(path)
+                    stat = item.stat()
+                    if known.get(path) == (stat.st_mtime, stat.st_size):
+                        continue
+                    with get_metrics().timer("template_load"):
+                        image, alpha = read_template(path)
+                    if image is None:
+                        logger.warning(f"⚠️ Не удалось загрузить шаблон: {path}")
+                        continue
+                    if path in names and self.update_image(names[path], category, image, alpha,
+                                                           source_mtime=stat.st_mtime, source_size=stat.st_size):
+                        # Имя, подпись, режим сравнения и порог записи переживают замену файла
+                        changed += 1
+                        continue
+                    h, w = image.shape[:2]
+                    record = self.get(item.name, category)
+                    meta = json.loads(record.meta) if record is not None and record.meta else None
+                    self.add(item.name, category, image, width=w, height=h, source=path, meta=meta,
+                             source_mtime=stat.st_mtime, source_size=stat.st_size, replace=True, alpha=alpha)
+                    changed += 1
+
+        removed = [p for p in known if os.path.dirname(p) == directory and p not in seen]
+        if removed:
+            conn = self._conn()
+            with conn:
+                conn.executemany("DELETE FROM templates WHERE category = ? AND source = ?",
+                                 [(category, p) for p in removed])
+                self._bump(conn, category)
+            changed += len(removed)
+        return changed
+
+    def migrate_json(self, json_path, category, image_dir=None):
+        """
+        Однократно переносит записи старого JSON-файла (region_templates.json / food_templates.json).
+        Изображение берётся из image_dir/<template>, если оно указано и существует.
+        Уже существующие имена пропускаются. Повторный вызов для того же файла ничего не делает.
+        :return: int — сколько записей перенесено
+        """
+        json_path = os.path.abspath(json_path)
+        conn = self._conn()
+        if not os.path.exists(json_path) or conn.execute(
+                "SELECT 1 FROM migrations WHERE path = ?", (json_path,)).fetchone():
+            return 0
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"⚠️ Не удалось прочитать {json_path}: {e}")
+            items = []
+
+        migrated = 0
+        for item in items:
+            name = item.get("name")
+            if not name or self.exists(name, category):
+                continue
+            image, source = None, {}
+            template = item.get("template")
+            if template and image_dir:
+                image_path = os.path.abspath(os.path.join(image_dir, template))
+                image = cv2.imread(image_path)
+                if image is not None:
+                    # Файл привязан к записи, чтобы sync_directory не добавил его второй раз под именем файла
+                    stat = os.stat(image_path)
+                    source = {"source": image_path, "source_mtime": stat.st_mtime, "source_size": stat.st_size}
+            self.add(name, category, image, item.get("x"), item.get("y"), item.get("width"), item.get("height"),
+                     label=item.get("label"), meta={"migrated_from": json_path}, **source)
+            migrated += 1
+
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO migrations (path, done) VALUES (?, ?)", (json_path, time.time()))
+        if migrated:
+            logger.info(f"📦 Перенесено шаблонов из {json_path}: {migrated}")
+        return migrated
+
+
+def migrate_legacy_files(store):
+    """
+    Переносит в хранилище все известные старые JSON-файлы шаблонов,
+    включая файлы из прежних несогласованных путей (ROOT_DIR/food, ../data/data/templates/food).
+    """
+    food_dirs = [
+        os.path.join(TEMPLATES_DIR, "food"),
+        os.path.join(ROOT_DIR, "food"),
+        os.path.join(os.path.dirname(ROOT_DIR), "data", "data", "templates", "food"),
+    ]
+    total = 0
+    for food_dir in food_dirs:
+        total += store.migrate_json(os.path.join(food_dir, "food_templates.json"), "food", food_dir)
+    for region_json in (os.path.join(TEMPLATES_DIR, "region_templates.json"), EFFECT_TEMPLATES_JSON):
+        total += store.migrate_json(region_json, "region")
+    return total
+
+
+class StoreTemplateBank:
+    """
+    Шаблоны одной категории из TemplateStore с интерфейсом TemplateBank
+    (refresh / version / entries / get), чтобы матчер и детектор не знали об источнике.
+    Если указана directory, при refresh в хранилище подтягиваются PNG из папки.
+    """
+
+    def __init__(self, store, category, directory=None, resolution=None, refresh_interval=REFRESH_INTERVAL):
+        self.store = store
+        self.category = category
+        self.directory = directory
+        self.resolution = resolution
+        self.refresh_interval = refresh_interval
+        self._entries = {}
+        self._revision = None
+        self._last_refresh = None
+        self._lock = threading.RLock()
+        self.version = 0
+
+    def refresh(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            if (not force and self._last_refresh is not None
+                    and now - self._last_refresh < self.refresh_interval):
+                return self
+            self._last_refresh = now
+            with get_metrics().timer("template_refresh"):
+                if self.directory is not None:
+                    self.store.sync_directory(self.directory, self.category)
+                revision = self.store.revision(self.category)
+                if revision != self._revision:
+                    self._entries = {e.name: e for e in self.store.load_entries(self.category, self.resolution)}
+                    self._revision = revision
+                    self.version += 1
+            return self
+
+    def entries(self):
+        """Список шаблонов, отсортированный по имени"""
+        with self._lock:
+            return [self._entries[name] for name in sorted(self._entries)]
+
+    def get(self, name):
+        with self._lock:
+            return self._entries.get(name)
+
+    def invalidate(self, name=None):
+        """Следующий refresh перечитает категорию из хранилища"""
+        with self._lock:
+            self._revision = None
+            self._last_refresh = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __iter__(self):
+        return iter(self.entries())
+
+
+_stores = {}
+_store_banks = {}
+_stores_lock = threading.Lock()
+
+
+def get_template_store(path=TEMPLATE_STORE_DB):
+    """Общее на процесс хранилище (подключения всё равно отдельные для каждого потока)"""
+    key = os.path.normcase(os.path.abspath(path))
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = TemplateStore(path)
+            _stores[key] = store
+        return store
+
+
+def get_store_bank(category, directory=None, store=None):
+    """Общий на процесс StoreTemplateBank для категории"""
+    store = store or get_template_store()
+    key = (os.path.normcase(os.path.abspath(store.path)), category)
+    with _stores_lock:
+        bank = _store_banks.get(key)
+        if bank is None:
+            bank = StoreTemplateBank(store, category, directory)
+            _store_banks[key] = bank
+        return bank
@@ -0,0 +1,215 @@
+"""
+Масштаб интерфейса игры относительно масштаба, на котором сняты шаблоны.
+
+Шаблоны — вырезки с экрана конкретного разрешения и масштаба UI. На другом мониторе
+(например, 1920x1080 вместо 3440x1440) или при другом масштабе UI в настройках игры
+иконки меньше или больше, и шаблоны перестают совпадать.
+
+Масштаб определяется один раз (калибровкой по известной иконке-якорю) и дальше
+матчинг идёт на одном масштабе: копии шаблонов под него строятся один раз и
+хранятся в ScaledTemplateCache, а не пересчитываются на каждом кадре.
+"""
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+import cv2
+import numpy as np
+
+from modules.template_bank import TemplateEntry
+from modules.metrics import get_metrics
+
+logger = logging.getLogger("AlbionHelperLogger")
+
+# Диапазон и шаг перебора масштабов при калибровке
+CALIBRATION_MIN_SCALE = 0.5
+CALIBRATION_MAX_SCALE = 1.5
+CALIBRATION_STEP = 0.05
+
+# Шаг уточнения вокруг лучшего масштаба грубого перебора
+REFINE_STEP = 0.01
+
+# Минимальный коэффициент корреляции якоря, при котором калибровке можно верить
+ANCHOR_THRESHOLD = 0.8
+
+# Масштабы округляются до этого шага: близкие значения делят одну запись кэша
+SCALE_PRECISION = 0.01
+
+# Сколько масштабов держать в кэше (обычно используется один; остальные — после перекалибровки)
+SCALE_CACHE_SIZE = 4
+
+# Шаблоны меньше этого размера после масштабирования не используются
+MIN_TEMPLATE_SIDE = 4
+
+# scale — найденный масштаб, score — коэффициент корреляции якоря на нём,
+# bbox — (x, y, width, height) якоря на кадре
+ScaleEstimate = namedtuple("ScaleEstimate", ["scale", "score", "bbox"])
+
+
+def quantize_scale(scale, precision=SCALE_PRECISION):
+    return round(round(scale / precision) * precision, 4)
+
+
+def parse_resolution(resolution):
+    """:return: (width, height) из строки вида "3440x1440" или None"""
+    try:
+        width, height = str(resolution).lower().split("x")
+        return int(width), int(height)
+    except (AttributeError, ValueError):
+        return None
+
+
+def scale_for_resolution(resolution, reference):
+    """
+    Ожидаемый масштаб UI при переходе от разрешения reference к resolution.
+    Интерфейс Albion масштабируется по высоте экрана, поэтому 3440x1440 -> 1920x1080 даёт 0.75.
+    :return: float или None, если разрешения не разобрать
+    """
+    current, base = parse_resolution(resolution), parse_resolution(reference)
+    if current is None or base is None:
+        return None
+    return quantize_scale(current[1] / base[1])
+
+
+def screen_resolution():
+    """:return: str — разрешение основного монитора ("1920x1080") или None, если его не узнать"""
+    try:
+        from mss import mss
+        with mss() as sct:
+            monitor = sct.monitors[1] if len(sct.monitors) > 1 else sct.monitors[0]
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось определить разрешение экрана: {e}")
+        return None
+    return f"{monitor['width']}x{monitor['height']}"
+
+
+def resize_to_scale(image, scale):
+    """Копия изображения в масштабе scale (None, если результат слишком мал)"""
+    h, w = image.shape[:2]
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    if min(new_w, new_h) < MIN_TEMPLATE_SIDE:
+        return None
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    return cv2.resize(image, (new_w, new_h), interpolation=interpolation)
+
+
+def template_scale(entry):
+    """Масштаб UI, на котором снят шаблон (meta["ui_scale"], по умолчанию 1.0)"""
+    return float(entry.meta.get("ui_scale", 1.0)) if hasattr(entry, "meta") else 1.0
+
+
+class ScaledTemplateCache:
+    """
+    Копии шаблонов под масштаб UI.
+    Копия строится один раз на пару (шаблон, масштаб); LRU по масштабам
+    не даёт кэшу расти при перекалибровках. Шаблон, перезагруженный банком
+    (новый объект TemplateEntry), пересчитывается автоматически.
+    """
+
+    def __init__(self, max_scales=SCALE_CACHE_SIZE):
+        self.max_scales = max_scales
+        # масштаб -> {имя шаблона: (исходный TemplateEntry, копия или None)}
+        self._scales = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        with self._lock:
+            self._scales.clear()
+
+    def _variants(self, scale):
+        with self._lock:
+            variants = self._scales.get(scale)
+            if variants is None:
+                variants = self._scales[scale] = {}
+                while len(self._scales) > self.max_scales:
+                    self._scales.popitem(last=False)
+            else:
+                self._scales.move_to_end(scale)
+            return variants
+
+    def entry(self, entry, scale):
+        """
+        Копия одного шаблона под масштаб UI scale с учётом масштаба, на котором он снят.
+        :return: TemplateEntry (сам entry, если масштабировать не нужно) или None,
+                 если шаблон становится слишком мал
+        """
+        factor = quantize_scale(scale / template_scale(entry))
+        if factor == 1.0:
+            return entry
+        variants = self._variants(factor)
+        cached = variants.get(entry.name)
+        if cached is not None and cached[0] is entry:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        with get_metrics().timer("template_rescale"):
+            image = resize_to_scale(entry.image, factor)
+            scaled = None
+            if image is not None:
+                alpha = None
+                if entry.alpha is not None:
+                    alpha = cv2.resize(entry.alpha, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_NEAREST)
+                scaled = TemplateEntry(entry.name, entry.path, image, entry.mtime, entry.size,
+                                       meta=dict(entry.meta, ui_scale=scale), alpha=alpha)
+        variants[entry.name] = (entry, scaled)
+        return scaled
+
+    def entries(self, entries, scale):
+        """Копии набора шаблонов под масштаб scale (слишком маленькие пропускаются)"""
+        result = []
+        for entry in entries:
+            scaled = self.entry(entry, scale)
+            if scaled is not None:
+                result.append(scaled)
+        return result
+
+
+def _match_at(screen_gray, anchor_gray, scale):
+    template = resize_to_scale(anchor_gray, scale)
+    if template is None or template.shape[0] > screen_gray.shape[0] or template.shape[1] > screen_gray.shape[1]:
+        return None
+    result = cv2.matchTemplate(screen_gray, template, cv2.TM_CCOEFF_NORMED)
+    _, max_val, _, max_loc = cv2.minMaxLoc(result)
+    h, w = template.shape[:2]
+    return float(max_val), (max_loc[0], max_loc[1], w, h)
+
+
+def detect_scale(screen_img, anchor, min_scale=CALIBRATION_MIN_SCALE, max_scale=CALIBRATION_MAX_SCALE,
+                 step=CALIBRATION_STEP, threshold=ANCHOR_THRESHOLD):
+    """
+    Определяет масштаб UI по иконке-якорю, которая точно есть на кадре.
+    Сначала грубый перебор масштабов с шагом step, затем уточнение с шагом REFINE_STEP
+    вокруг лучшего. Выполняется один раз при калибровке, а не на каждом кадре.
+    :param screen_img: np.ndarray — BGR-кадр области, где виден якорь
+    :param anchor: TemplateEntry или BGR-изображение якоря, снятое на масштабе 1.0
+                   (для TemplateEntry учитывается meta["ui_scale"])
+    :return: ScaleEstimate или None, если якорь не найден ни на одном масштабе
+    """
+    base = 1.0
+    if hasattr(anchor, "image"):
+        base = template_scale(anchor)
+        anchor = anchor.image
+    screen_gray = cv2.cvtColor(screen_img, cv2.COLOR_BGR2GRAY) if screen_img.ndim == 3 else screen_img
+    anchor_gray = cv2.cvtColor(anchor, cv2.COLOR_BGR2GRAY) if anchor.ndim == 3 else anchor
+
+    def search(scales):
+        best = None
+        for scale in scales:
+            match = _match_at(screen_gray, anchor_gray, scale / base)
+            if match is not None and (best is None or match[0] > best.score):
+                best = ScaleEstimate(quantize_scale(scale), match[0], match[1])
+        return best
+
+    best = search(np.arange(min_scale, max_scale + step / 2, step))
+    if best is None:
+        return None
+    refined = search(np.arange(best.scale - step + REFINE_STEP, best.scale + step, REFINE_STEP))
+    if refined is not None and refined.score > best.score:
+        best = refined
+    if best.score < threshold:
+        logger.info(f"📏 Якорь не найден: лучший масштаб {best.scale:.2f}, score={best.score:.2f}")
+        return None
+    return best
@@ -0,0 +1,103 @@
+"""
+Прогрев в фоне после показа главного окна.
+
+Первое открытие окна авто-режима и первая проверка раньше платили за всё сразу:
+импорт OpenCV и модулей детекции, открытие хранилища, декодирование шаблонов
+и первые вызовы cv2 (инициализация пулов потоков и оптимизированных ядер).
+Прогрев делает это заранее в фоновом потоке, пока пользователь смотрит на окно
+(заодно старые JSON-файлы шаблонов переносятся в хранилище):
+
+    from modules.warmup import start_warmup
+    start_warmup(modules=("ui.auto_food_mode_window",))
+
+Общие на процесс банки шаблонов (get_store_bank) после прогрева уже заполнены,
+поэтому детектор получает готовые шаблоны. Время прогрева пишется в метрику warmup.
+"""
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger("AlbionHelperLogger")
+
+# Модули детекции, которые импортируются заранее (основная часть — OpenCV и numpy)
+WARMUP_MODULES = (
+    "modules.auto_food",
+    "modules.rules",
+    "modules.input_dispatcher",
+)
+
+# Размер кадра для пробных вызовов cv2
+WARMUP_FRAME_SIZE = (64, 64)
+
+
+def _warm_opencv():
+    """Первые вызовы функций горячего пути на маленьком кадре"""
+    import cv2
+    import numpy as np
+
+    frame = np.zeros((*WARMUP_FRAME_SIZE, 4), dtype=np.uint8)
+    bgr = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+    cv2.matchTemplate(gray, small, cv2.TM_CCOEFF_NORMED)
+    cv2.matchTemplate(bgr, bgr[:16, :16], cv2.TM_CCOEFF_NORMED)
+    cv2.meanStdDev(gray)
+
+
+def _warm_templates():
+    """
+    Переносит старые JSON-файлы шаблонов в хранилище и декодирует шаблоны еды и слотов
+    в общие банки, которые потом возьмёт детектор
+    """
+    from modules.auto_food import FOOD_TEMPLATES_DIR, SLOT_TEMPLATES_DIR
+    from modules.template_store import get_store_bank, get_template_store, migrate_legacy_files
+
+    migrate_legacy_files(get_template_store())
+    count = 0
+    for category, directory in (("food", FOOD_TEMPLATES_DIR), ("slots", SLOT_TEMPLATES_DIR)):
+        count += len(get_store_bank(category, directory).refresh(force=True))
+    return count
+
+
+def warm_up(modules=()):
+    """
+    Выполняет прогрев в текущем потоке.
+    :param modules: дополнительные модули для импорта (например, окна, которые откроются позже)
+    :return: float — длительность прогрева в секундах
+    """
+    from modules.metrics import get_metrics
+
+    start = time.perf_counter()
+    with get_metrics().timer("warmup"):
+        for name in (*WARMUP_MODULES, *modules):
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                logger.warning(f"⚠️ Прогрев: не удалось импортировать {name}: {e}")
+        _warm_opencv()
+        templates = _warm_templates()
+    elapsed = time.perf_counter() - start
+    logger.info(f"🔥 Прогрев завершён за {elapsed * 1000:.0f} мс (шаблонов: {templates})")
+    return elapsed
+
+
+def start_warmup(modules=(), on_done=None):
+    """
+    Запускает прогрев в фоновом потоке.
+    :param on_done: callable(seconds) — вызывается в потоке прогрева по завершении
+    :return: threading.Thread
+    """
+    def run():
+        try:
+            elapsed = warm_up(modules)
+        except Exception as e:
+            # Ошибка прогрева не должна мешать работе окна: всё догрузится при первом обращении
+            logger.error(f"❌ Ошибка прогрева: {e}")
+            return
+        if on_done is not None:
+            on_done(elapsed)
+
+    thread = threading.Thread(target=run, name="warmup", daemon=True)
+    thread.start()
+    return thread
@@ -1,4 +1,25 @@
 # ui/__init__.py
-from .main_window import AlbionHelperMainWindow as MainWindow
-from .auto_template_food import FoodEffectPreviewWindow
-from .auto_food_mode_window import AutoFoodModeWindow
\ No newline at end of file
+# Окна загружаются при первом обращении (PEP 562): импорт ui.main_window не тянет
+# за собой окна авто-режима и галереи
+import importlib
+
+_EXPORTS = {
+    "MainWindow": ("main_window", "AlbionHelperMainWindow"),
+    "FoodCandidatesGallery": ("auto_template_food", "FoodCandidatesGallery"),
+    "AutoFoodModeWindow": ("auto_food_mode_window", "AutoFoodModeWindow"),
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module, attr = _EXPORTS[name]
+    value = getattr(importlib.import_module(f".{module}", __name__), attr)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
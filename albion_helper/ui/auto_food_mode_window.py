@@ -2,21 +2,27 @@ from PyQt5.QtWidgets import (
     QWidget, QLabel, QVBoxLayout, QHBoxLayout,
     QPushButton, QMessageBox, QApplication, QDialog
 )
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QPixmap, QImage, QFont
-import cv2
-import json
-import pyautogui
+from PyQt5.QtCore import Qt, QTimer, QEvent
+from PyQt5.QtGui import QFont
 import os
 import numpy as np
 import sys
+import logging
+from datetime import datetime
 
-from utils.paths import ROOT_DIR
+from utils.paths import DATA_DIR, TEMPLATES_DIR, RECORDINGS_DIR
 #
-from utils.paths import DATA_DIR, TEMPLATES_DIR
-#
-from modules.screenshot_handler import capture_screen
-from modules.template_matcher import find_template_in_image
+from modules.auto_food import AutoFoodDetector, FOOD_ACTIVE, SLOT_EMPTY, EAT, UNKNOWN
+from modules.pipeline import DetectionPipeline
+from modules.rules import build_auto_food_engine
+from modules.input_dispatcher import InputDispatcher, FakeBackend
+from modules.session_recorder import SessionRecorder, ReplayFrameSource
+from modules.metrics import get_metrics, FLUSH_INTERVAL
+from modules.ui_scale import screen_resolution
+from ui.pipeline_bridge import PipelineBridge
+from ui.config_bridge import ConfigBridge
+from config.service import get_config, Region
+from ui.preview_renderer import PreviewRenderer, preview_interval, PREVIEW_INACTIVE_FPS
 from utils.logger import setup_logger
 
 
@@ -27,45 +33,120 @@ class AutoFoodModeWindow(QDialog):
         self.main_window = parent
         self.setWindowTitle("Albion Helper — Авто-режим: Еда")
         self.resize(600, 600)
-        self.setFixedSize(1300, 400)  # Фиксированный размер окна
+        self.setFixedSize(1300, 440)  # Фиксированный размер окна
 
-        # Логгер
-        self.logger = setup_logger()
+        # Логгер (настраивается один раз в main)
+        self.logger = logging.getLogger("AlbionHelperLogger")
 
         # Состояние режима
         self.running = False
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.auto_food_check)
 
-        # Настройки
-        self.settings = self.load_settings()
-        self.effects_rect = self.settings.get("Область эффектов персонажа", {})
-        self.food_slot_rect = self.settings.get("Слот еды", {})
+        # Настройки: области уже проверены и разобраны службой настроек (Region или None)
+        self.config = get_config()
+        self.settings = self.config.settings
+        self.effects_rect = self.config.region("Область эффектов персонажа")
+        self.food_slot_rect = self.config.region("Слот еды")
 
         # Путь к шаблонам еды
         self.food_templates_dir = os.path.join(TEMPLATES_DIR, "food")
 
+        # Воспроизведение записи вместо захвата экрана (настройка "auto_food_replay" — путь к .albrec)
+        self.replay_path = self.settings.get("auto_food_replay")
+        frame_source = None
+        backend = None
+        if self.replay_path:
+            # Кадры берутся по именам областей: в записи могут быть области правил, которых при воспроизведении нет
+            frame_source = ReplayFrameSource(self.replay_path, realtime=True,
+                                             region_names=lambda: self.engine.region_names)
+            # При воспроизведении клавиша не нажимается — только пишем в лог
+            backend = FakeBackend(on_press=lambda key: self.logger.info(f"▶️ [воспроизведение] нажатие клавиши '{key}'"))
+            self.logger.info(f"▶️ Воспроизведение записи: {self.replay_path}")
+
+        # Нажатия выполняются в отдельном потоке с debounce/откатом по клавишам (секция "input")
+        self.dispatcher = InputDispatcher.from_settings(self.settings.get("input", {}), backend=backend).start()
+
+        # Детекция еды (выполняется в фоновом потоке конвейера)
+        # Масштаб UI берётся из настроек; если его нет — определяется по якорю и сохраняется,
+        # а до тех пор оценивается по разрешению экрана
+        ui_scale = self.settings.get("ui_scale")
+        self.detector = AutoFoodDetector(self.food_templates_dir, dispatcher=self.dispatcher,
+                                         scale=float(ui_scale) if ui_scale else None,
+                                         on_scale=lambda scale: self.config.set("ui_scale", scale),
+                                         resolution=None if self.replay_path else screen_resolution(),
+                                         reference_resolution=self.settings.get("default_resolution"))
+        self.recorder = None
+
+        # Авто-еда и правила из настроек (например, R/D) проверяются по одному общему кадру
+        resolve = self.config.region
+        if self.replay_path:
+            # Запись содержит только кадры еды; области берутся из неё, а не из настроек
+            resolve = lambda name: self.config.region(name) or Region(0, 0, 1, 1)
+        self.engine = build_auto_food_engine(self.detector, self.settings, resolve=resolve,
+                                             press_key=self.dispatcher.press, with_rules=not self.replay_path)
+
         # Инициализация интерфейса
         self.init_ui()
 
-        # Первое обновление превью
-        self.update_preview()
-
-        # Таймер обновления области
-        self.preview_timer = QTimer(self)
-        self.preview_timer.timeout.connect(self.update_preview)
-        self.preview_timer.start(500)  # Каждые 500 мс
+        # Конвейер захвата и детекции: GUI только рисует превью и статус
+        self.bridge = PipelineBridge(self)
+        self.bridge.frames_ready.connect(self.update_preview)
+        self.bridge.result_ready.connect(self.on_detection_result)
+        self.preview_fps = float(self.settings.get("auto_food_preview_fps", 2.0))
+        self.preview_inactive_fps = float(self.settings.get("preview_inactive_fps", PREVIEW_INACTIVE_FPS))
+        self.effects_renderer = PreviewRenderer(self.effects_preview, max_fps=self.preview_fps)
+        self.food_renderer = PreviewRenderer(self.food_preview, max_fps=self.preview_fps)
+        self.pipeline = DetectionPipeline(
+            [],
+            detect=self.engine,
+            on_frames=self.bridge.push_frames,
+            on_result=self.bridge.push_result,
+            capture_interval=1.0 / self.preview_fps,
+            # Движок правил сам планирует проверки: у каждого правила свой интервал
+            scheduler=self.engine,
+            frame_source=frame_source
+        )
+        # Время стадий: панель обновляется раз в секунду, снимки пишутся в logs/<дата>/metrics.jsonl
+        self.metrics = get_metrics()
+        self.metrics.start_flushing(float(self.settings.get("metrics_flush_interval", FLUSH_INTERVAL)))
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.update_metrics_panel)
+        self.metrics_timer.start(1000)
+
+        # Превью включается в showEvent, когда окно действительно показано
+        self.pipeline.set_preview_enabled(False)
+        self.apply_regions()
+
+        # Области, изменённые в главном окне или в файле, применяются без переоткрытия окна
+        self.config_bridge = ConfigBridge(self, self.config)
+        self.config_bridge.changed.connect(self.on_settings_changed)
 
     def load_settings(self):
-        config_path = os.path.join(ROOT_DIR, "config", "settings.json")
-        if not os.path.exists(config_path):
-            return {}
-        try:
-            with open(config_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            self.logger.error(f"Ошибка чтения settings.json: {e}")
-            return {}
+        """Снимок настроек из общей службы (файл читается один раз на процесс)"""
+        return self.config.settings
+
+    def apply_regions(self):
+        """Передаёт области всех правил в конвейер и запускает его, когда есть что проверять"""
+        rects = self.engine.refresh_regions()
+        if rects:
+            self.pipeline.set_regions(rects)
+            self.pipeline.start()
+        else:
+            self.pipeline.set_regions([])
+
+    def on_settings_changed(self, settings, changed_keys):
+        self.settings = settings
+        if self.engine.declared_regions & changed_keys:
+            self.effects_rect = self.config.region("Область эффектов персонажа")
+            self.food_slot_rect = self.config.region("Слот еды")
+            self.logger.info("🔄 Области авто-режима обновлены из настроек")
+            self.apply_regions()
+        if "ui_scale" in changed_keys:
+            ui_scale = settings.get("ui_scale")
+            if ui_scale:
+                self.detector.set_scale(float(ui_scale))
+                self.engine.set_scale(float(ui_scale))
+            else:
+                self.detector.recalibrate()
 
     def init_ui(self):
         main_layout = QVBoxLayout()
@@ -78,6 +159,18 @@ class AutoFoodModeWindow(QDialog):
         self.status_label.setAlignment(Qt.AlignCenter)
         main_layout.addWidget(self.status_label)
 
+        # === Результат последней проверки ===
+        self.check_label = QLabel("Последняя проверка: —")
+        self.check_label.setAlignment(Qt.AlignCenter)
+        main_layout.addWidget(self.check_label)
+
+        # === Время стадий (p50 / p99 / max за последнюю минуту) ===
+        self.metrics_label = QLabel("Метрики: —")
+        self.metrics_label.setFont(QFont("Consolas", 9))
+        self.metrics_label.setAlignment(Qt.AlignCenter)
+        self.metrics_label.setWordWrap(True)
+        main_layout.addWidget(self.metrics_label)
+
         # === Заголовки областей ===
         effects_title = QLabel("Область эффектов персонажа:")
         effects_title.setFont(QFont("Arial", 12, QFont.Bold))
@@ -116,9 +209,12 @@ class AutoFoodModeWindow(QDialog):
         control_layout = QHBoxLayout()
         self.toggle_button = QPushButton("🟢 Включить авто-режим")
         self.toggle_button.clicked.connect(self.toggle_auto_mode)
+        self.record_button = QPushButton("⏺️ Начать запись")
+        self.record_button.clicked.connect(self.toggle_recording)
         close_button = QPushButton("❌ Закрыть")
         close_button.clicked.connect(self.close)
         control_layout.addWidget(self.toggle_button)
+        control_layout.addWidget(self.record_button)
         control_layout.addWidget(close_button)
 
         # === Сборка основного layout ===
@@ -127,119 +223,84 @@ class AutoFoodModeWindow(QDialog):
         self.setLayout(main_layout)
 
     def update_preview(self):
-        if not self.effects_rect or not self.food_slot_rect:
+        frames = self.bridge.take_frames()
+        if frames is None:
             return
-
-        try:
-            x_e = int(self.effects_rect.get("x", 0))
-            y_e = int(self.effects_rect.get("y", 0))
-            w_e = int(self.effects_rect.get("width", 100))
-            h_e = int(self.effects_rect.get("height", 100))
-
-            x_f = int(self.food_slot_rect.get("x", 0))
-            y_f = int(self.food_slot_rect.get("y", 0))
-            w_f = int(self.food_slot_rect.get("width", 100))
-            h_f = int(self.food_slot_rect.get("height", 100))
-        except (ValueError, TypeError) as e:
-            self.logger.error(f"❌ Ошибка значений: {e}")
-            return
-
-        img_effects = capture_screen(x_e, y_e, w_e, h_e)
-        img_food = capture_screen(x_f, y_f, w_f, h_f)
+        by_region = dict(zip(self.engine.region_names, frames))
+        img_effects = by_region.get("Область эффектов персонажа")
+        img_food = by_region.get("Слот еды")
 
         if img_effects is None or img_food is None:
             self.logger.warning("⚠️ Не удалось сделать скриншот для превью")
             return
 
-        def scale_image(img, target_width, target_height):
-            h, w = img.shape[:2]
-            scaling_factor = min(target_width / w, target_height / h)
-            new_size = (int(w * scaling_factor), int(h * scaling_factor))
-            return cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
+        self.effects_renderer.render(img_effects)
+        self.food_renderer.render(img_food)
+
+    def update_preview_activity(self):
+        """Превью не захватывается, пока окно скрыто; детекция продолжается"""
+        interval = preview_interval(self, self.preview_fps, self.preview_inactive_fps)
+        self.pipeline.set_preview_enabled(interval is not None, interval)
+        if interval is not None:
+            self.effects_renderer.reset()
+            self.food_renderer.reset()
 
-        effects_scaled = scale_image(img_effects, self.effects_preview.width(), self.effects_preview.height())
-        q_img_effects = QImage(effects_scaled.data, effects_scaled.shape[1], effects_scaled.shape[0],
-                               effects_scaled.strides[0], QImage.Format_BGR888)
-        self.effects_preview.setPixmap(QPixmap.fromImage(q_img_effects))
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_preview_activity()
 
-        food_scaled = scale_image(img_food, self.food_preview.width(), self.food_preview.height())
-        q_img_food = QImage(food_scaled.data, food_scaled.shape[1], food_scaled.shape[0],
-                            food_scaled.strides[0], QImage.Format_BGR888)
-        self.food_preview.setPixmap(QPixmap.fromImage(q_img_food))
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.update_preview_activity()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() in (QEvent.WindowStateChange, QEvent.ActivationChange):
+            self.update_preview_activity()
 
     def auto_food_check(self):
         """
-        Основной цикл проверки наличия еды и её употребления
+        Внеочередная проверка наличия еды: выполняется в потоке детекции на ближайшем кадре
         """
         if not self.effects_rect or not self.food_slot_rect:
             return
+        self.pipeline.request_detection()
 
-        try:
-            x_e = int(self.effects_rect.get("x", 0))
-            y_e = int(self.effects_rect.get("y", 0))
-            w_e = int(self.effects_rect.get("width", 100))
-            h_e = int(self.effects_rect.get("height", 100))
-
-            x_f = int(self.food_slot_rect.get("x", 0))
-            y_f = int(self.food_slot_rect.get("y", 0))
-            w_f = int(self.food_slot_rect.get("width", 100))
-            h_f = int(self.food_slot_rect.get("height", 100))
-        except (ValueError, TypeError) as e:
-            self.logger.error(f"❌ Ошибка значений: {e}")
+    def on_detection_result(self, result):
+        """Результат тика движка правил из потока детекции (вызывается в потоке GUI)"""
+        food = result.results.get("food")
+        if food is None or food.detail is None:
             return
-
-        img_effects = capture_screen(x_e, y_e, w_e, h_e)
-        if img_effects is None:
-            self.logger.warning("⚠️ Не удалось сделать скриншот области эффектов")
+        result = food.detail
+        texts = {
+            FOOD_ACTIVE: "✅ Эффект еды активен",
+            SLOT_EMPTY: "❌ Слот еды пуст",
+            EAT: f"🟢 Нажата клавиша '{self.detector.key}'",
+            UNKNOWN: "⚠️ Проверка не выполнена",
+        }
+        gate = self.detector.gate
+        self.check_label.setText(
+            f"Последняя проверка: {texts.get(result.state, result.state)} · "
+            f"матчинг пропущен {gate.skipped} из {gate.checks} ({gate.skip_ratio:.0%})"
+        )
+
+    def update_metrics_panel(self):
+        if not self.isVisible():
             return
-
-        found_food = False
-        for template_file in os.listdir(self.food_templates_dir):
-            if not template_file.lower().endswith((".png", ".jpg")):
-                continue
-
-            template_path = os.path.join(self.food_templates_dir, template_file)
-            template = cv2.imread(template_path)
-
-            if template is None:
-                self.logger.warning(f"⚠️ Не удалось загрузить шаблон: {template_path}")
-                continue
-
-            match_result = find_template_in_image(img_effects, template)
-            if match_result:
-                self.logger.info(f"✅ Еда найдена: {template_file}")
-                found_food = True
-                break
-
-        if not found_food:
-            self.logger.info("🍽️ Еда не найдена. Проверяю слот еды...")
-
-            img_food_slot = capture_screen(x_f, y_f, w_f, h_f)
-            if img_food_slot is None:
-                self.logger.warning("⚠️ Не удалось сделать скриншот слота еды")
-                return
-
-            empty_food_path = os.path.join(TEMPLATES_DIR,"slots", "empty_food_slot.png")
-            if not os.path.exists(empty_food_path):
-                self.logger.warning("⚠️ Шаблон empty_food_slot.png не найден")
-                return
-
-            empty_food_template = cv2.imread(empty_food_path)
-            if empty_food_template is None:
-                self.logger.warning("⚠️ Не удалось загрузить шаблон empty_food_slot.png")
-                return
-
-            match_result = find_template_in_image(img_food_slot, empty_food_template)
-            if match_result:
-                self.logger.info("❌ Слот еды пуст")
-            else:
-                self.logger.info("🟢 Еда найдена в слоте. Нажимаем '2'")
-                pyautogui.press('2')
+        stages = self.metrics.snapshot()
+        if not stages:
+            return
+        keys = self.dispatcher.stats
+        self.metrics_label.setText("   ".join(
+            f"{name}: {s['p50_ms']:.1f}/{s['p99_ms']:.1f}/{s['max_ms']:.1f} мс ×{s['count']}"
+            for name, s in stages.items()
+        ) + f"   нажатия: {keys['pressed']} (подавлено {keys['debounced'] + keys['suppressed']}, "
+            f"повторов {keys['retries']}, без подтверждения {keys['failed']})")
 
     def toggle_auto_mode(self):
         self.running = not self.running
         if self.running:
-            self.timer.start(10000)
+            self.pipeline.set_detection_enabled(True)
             self.status_label.setText("Авто-прохватка: ✅ Активен")
             self.status_label.setStyleSheet("font-size: 18px; font-weight: bold; color: green;")
             self.toggle_button.setText("🔴 Выключить авто-режим")
@@ -248,7 +309,7 @@ class AutoFoodModeWindow(QDialog):
                 self.main_window.update_food_mode_status(True)
 
         else:
-            self.timer.stop()
+            self.pipeline.set_detection_enabled(False)
             self.status_label.setText("Авто-прохватка: ❌ Выключен")
             self.status_label.setStyleSheet("font-size: 18px; font-weight: bold; color: red;")
             self.toggle_button.setText("🟢 Включить авто-режим")
@@ -257,18 +318,39 @@ class AutoFoodModeWindow(QDialog):
                 self.main_window.update_food_mode_status(False)
 
 
-    def resizeEvent(self, event):
-        self.update_preview()
-        super().resizeEvent(event)
+    def toggle_recording(self):
+        """Запись кадров эффектов и слота еды в data/recordings для воспроизведения офлайн"""
+        if self.recorder is None:
+            if not self.effects_rect or not self.food_slot_rect:
+                QMessageBox.warning(self, "Ошибка", "Области эффектов и слота еды не заданы.")
+                return
+            path = os.path.join(RECORDINGS_DIR, datetime.now().strftime("session_%Y-%m-%d_%H-%M-%S.albrec"))
+            self.recorder = SessionRecorder(path, list(self.engine.region_names),
+                                            max_fps=float(self.settings.get("record_fps", 1.0)))
+            self.pipeline.recorder = self.recorder
+            self.record_button.setText("⏹️ Остановить запись")
+            self.logger.info(f"⏺️ Запись сессии: {path}")
+        else:
+            self.pipeline.recorder = None
+            self.recorder.close()
+            self.recorder = None
+            self.record_button.setText("⏺️ Начать запись")
 
     def closeEvent(self, event):
-        self.timer.stop()
-        self.preview_timer.stop()
+        self.config_bridge.close()
+        self.pipeline.stop()
+        self.dispatcher.stop()
+        self.metrics_timer.stop()
+        self.metrics.stop_flushing()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
         self.logger.info("Окно 'Авто-режим: Еда' закрыто")
         event.accept()
 
 
 def main():
+    setup_logger()
     app = QApplication(sys.argv)
     window = AutoFoodModeWindow()
     window.show()
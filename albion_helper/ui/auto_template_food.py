@@ -1,153 +1,220 @@
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QLineEdit, QPushButton, QComboBox,
+    QWidget, QVBoxLayout, QHBoxLayout, QGridLayout,
+    QLabel, QLineEdit, QPushButton, QComboBox, QCheckBox, QScrollArea,
     QApplication, QMessageBox, QDialog
 )
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap, QImage, QIcon
-import os
-import json
+from PyQt5.QtGui import QIcon
 import sys
-import cv2
 import logging
 import time
 from PyQt5.QtCore import QTimer
 from datetime import datetime
 from utils.paths import TEMP_DIR, LOGS_DIR, TEMPLATES_DIR, EFFECT_TEMPLATES_JSON, FOOD_TEMPLATES_JSON
+from ui.pixmap_cache import ScaledPixmapCache
+from modules.template_store import get_template_store, TemplateExistsError
+from modules.template_bank import MATCH_COLOR, MATCH_GRAY, MATCH_MASKED, MATCH_EDGES
+from config.service import get_config
+
+# Размер миниатюры кандидата в галерее, в пикселях
+THUMBNAIL_SIZE = 96
+
+# Режимы сравнения в выпадающем списке галереи: (подпись, режим)
+MATCH_MODE_CHOICES = (
+    ("Цвет (по умолчанию)", MATCH_COLOR),
+    ("Серый — быстрее", MATCH_GRAY),
+    ("С маской — без рамки иконки", MATCH_MASKED),
+    ("Контуры — если цвета плывут", MATCH_EDGES),
+)
 
-class FoodEffectPreviewWindow(QDialog):
-    def __init__(self, image_path, parent=None):
+# Что делать с вырезкой, почти совпадающей с существующим шаблоном
+DUPLICATE_MERGE = "merge"   # заменить изображение существующего шаблона новой вырезкой
+DUPLICATE_SKIP = "skip"     # не сохранять
+DUPLICATE_KEEP = "keep"     # сохранить отдельным шаблоном
+
+
+def _current_ui_scale():
+    ui_scale = get_config().get("ui_scale")
+    return float(ui_scale) if ui_scale else None
+
+
+def save_food_effect(image, user_name, x=0, y=0, resolution=None, store=None, match_mode=None):
+    """
+    Сохраняет эффект еды в хранилище шаблонов (категория "food") одной транзакцией.
+    Вместе с шаблоном запоминается текущий масштаб UI, чтобы на другом масштабе его можно было привести.
+    :param match_mode: str — режим сравнения шаблона (None — по умолчанию, color)
+    :return: (bool, str) — успех и сообщение об ошибке
+    """
+    ui_scale = _current_ui_scale()
+    meta = {}
+    if ui_scale:
+        meta["ui_scale"] = ui_scale
+    if match_mode and match_mode != MATCH_COLOR:
+        meta["match_mode"] = match_mode
+    try:
+        (store or get_template_store()).add(user_name, "food", image, x, y, label=user_name,
+                                            resolution=resolution, meta=meta or None)
+    except TemplateExistsError:
+        return False, f"Темплейт '{user_name}' уже существует"
+    return True, ""
+
+
+def find_food_duplicate(image, store=None):
+    """
+    Самый похожий на вырезку шаблон еды (pHash + корреляция, см. modules.template_dedup).
+    :return: Duplicate или None
+    """
+    found = (store or get_template_store()).find_similar(image, "food", ui_scale=_current_ui_scale())
+    return found[0] if found else None
+
+
+def merge_food_effect(image, duplicate, store=None):
+    """
+    Заменяет изображение похожего шаблона новой вырезкой (имя, подпись и режим сравнения остаются).
+    :return: bool — найден ли шаблон
+    """
+    ui_scale = _current_ui_scale()
+    return (store or get_template_store()).update_image(duplicate.entry.name, "food", image,
+                                                        meta={"ui_scale": ui_scale} if ui_scale else None)
+
+
+def ask_duplicate(parent, name, duplicate):
+    """
+    Спрашивает, что делать с вырезкой, почти совпадающей с существующим шаблоном.
+    :return: str — DUPLICATE_MERGE, DUPLICATE_SKIP или DUPLICATE_KEEP
+    """
+    box = QMessageBox(parent)
+    box.setIcon(QMessageBox.Question)
+    box.setWindowTitle("Похожий темплейт")
+    box.setText(f"'{name}' почти совпадает с темплейтом '{duplicate.entry.name}' "
+                f"(сходство {duplicate.score:.2f}).")
+    box.setInformativeText("Каждый лишний темплейт — ещё одно сравнение на каждой проверке.")
+    merge_btn = box.addButton("Заменить существующий", QMessageBox.AcceptRole)
+    box.addButton("Пропустить", QMessageBox.RejectRole)
+    keep_btn = box.addButton("Сохранить отдельно", QMessageBox.DestructiveRole)
+    box.setDefaultButton(merge_btn)
+    box.exec_()
+    clicked = box.clickedButton()
+    if clicked is merge_btn:
+        return DUPLICATE_MERGE
+    if clicked is keep_btn:
+        return DUPLICATE_KEEP
+    return DUPLICATE_SKIP
+
+
+class FoodCandidatesGallery(QDialog):
+    """
+    Все найденные кандидаты эффекта еды в одном окне: у каждого миниатюра,
+    флажок и имя. Сохраняются отмеченные кандидаты с непустым именем;
+    для кандидата, похожего на существующий шаблон, спрашивается, что с ним делать.
+    """
+
+    def __init__(self, changes, origin=(0, 0), parent=None, resolution=None):
+        """
+        :param changes: list[FoodChange] — вырезки в памяти (см. modules.food_processor)
+        :param origin: (x, y) — левый верхний угол области на экране
+        :param resolution: str — разрешение экрана, с которого сняты вырезки ("3440x1440")
+        """
         super().__init__(parent)
-        self.setWindowTitle("Albion Helper — Предпросмотр эффекта еды")
-        self.image_path = image_path
-        self.parent = parent  # Чтобы получить x, y области
-
-        # Начальный размер окна
-        self.resize(400, 300)
-
-        # Минимальный размер окна
-        self.setMinimumSize(300, 200)
-
-        # Инициализация интерфейса
+        self.setWindowTitle("Albion Helper — Найденные эффекты еды")
+        self.changes = changes
+        self.origin = origin
+        self.resolution = resolution
+        self.saved = []
+        self.merged = []    # имена существующих шаблонов, изображение которых заменено
+        self._rows = []
+        self.resize(720, 480)
         self.init_ui()
 
     def init_ui(self):
         layout = QVBoxLayout()
         layout.setContentsMargins(10, 10, 10, 10)
+        layout.addWidget(QLabel(f"Найдено кандидатов: {len(self.changes)}. Отметьте эффекты еды и задайте имена."))
+
+        grid_widget = QWidget()
+        grid = QGridLayout()
+        columns = 3
+        for i, change in enumerate(self.changes):
+            cell = QVBoxLayout()
+            thumb = QLabel()
+            thumb.setFixedSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+            thumb.setAlignment(Qt.AlignCenter)
+            thumb.setStyleSheet("background-color: #f0f0f0; border: 1px solid #ccc;")
+            thumb.setPixmap(ScaledPixmapCache(change.image).pixmap(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            x, y, w, h = change.bbox
+            check = QCheckBox(f"#{change.index}: {w}x{h} @ ({x}, {y})")
+            name_input = QLineEdit()
+            name_input.setPlaceholderText("Имя темплейта")
+            # Ввод имени сразу отмечает кандидата
+            name_input.textEdited.connect(lambda text, c=check: c.setChecked(bool(text.strip())))
+            cell.addWidget(thumb, alignment=Qt.AlignCenter)
+            cell.addWidget(check)
+            cell.addWidget(name_input)
+            grid.addLayout(cell, i // columns, i % columns)
+            self._rows.append((change, check, name_input))
+        grid_widget.setLayout(grid)
+
+        scroll = QScrollArea()
+        scroll.setWidgetResizable(True)
+        scroll.setWidget(grid_widget)
+        layout.addWidget(scroll, stretch=1)
+
+        mode_layout = QHBoxLayout()
+        mode_layout.addWidget(QLabel("Режим сравнения:"))
+        self.mode_combo = QComboBox()
+        for label, mode in MATCH_MODE_CHOICES:
+            self.mode_combo.addItem(label, mode)
+        mode_layout.addWidget(self.mode_combo, stretch=1)
+        layout.addLayout(mode_layout)
 
-        # Превью изображения
-        self.image_label = QLabel()
-        self.image_label.setAlignment(Qt.AlignCenter)
-        self.image_label.setStyleSheet("background-color: #f0f0f0; border: 1px solid #ccc;")
-        layout.addWidget(self.image_label, stretch=1)  # stretch=1 — занимает всё доступное пространство
-
-        # Поле ввода имени
-        self.name_input = QLineEdit()
-        self.name_input.setPlaceholderText("Введите имя темплейта")
-        layout.addWidget(QLabel("Имя темплейта:"))
-        layout.addWidget(self.name_input)
-
-        # Кнопки
         btn_layout = QHBoxLayout()
-        save_btn = QPushButton("✅ Сохранить")
-        cancel_btn = QPushButton("❌ Не сохранять")
-
-        save_btn.clicked.connect(self.save_effect)
+        save_btn = QPushButton("✅ Сохранить отмеченные")
+        cancel_btn = QPushButton("❌ Закрыть без сохранения")
+        save_btn.clicked.connect(self.save_selected)
         cancel_btn.clicked.connect(self.reject)
-
         btn_layout.addWidget(save_btn)
         btn_layout.addWidget(cancel_btn)
-
         layout.addLayout(btn_layout)
         self.setLayout(layout)
 
-        # Загружаем изображение
-        self.load_image()
-
-    def load_image(self):
-        """Загружает изображение и масштабирует его под размер QLabel"""
-        img = cv2.imread(self.image_path)
-        if img is None:
-            QMessageBox.critical(self, "Ошибка", "Не удалось загрузить изображение.")
-            self.close()
+    def save_selected(self):
+        selected = [(change, name.text().strip()) for change, check, name in self._rows if check.isChecked()]
+        if not selected:
+            QMessageBox.warning(self, "Ошибка", "Не отмечено ни одного кандидата")
             return
-
-        h, w = img.shape[:2]
-        available_size = self.image_label.size()
-        scaling_factor = min(
-            available_size.width() / w,
-            available_size.height() / h
-        )
-        new_size = (int(w * scaling_factor), int(h * scaling_factor))
-        resized_img = cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
-
-        q_img = QImage(resized_img.data, resized_img.shape[1], resized_img.shape[0],
-                       resized_img.strides[0], QImage.Format_BGR888)
-        pixmap = QPixmap.fromImage(q_img)
-        self.image_label.setPixmap(pixmap)
-
-    def resizeEvent(self, event):
-        """Обновляем изображение при изменении размера окна"""
-        self.load_image()
-        super().resizeEvent(event)
-
-    def reject(self):
-        """Действие при нажатии 'Не сохранять'"""
-        try:
-            os.remove(self.image_path)
-        except Exception as e:
-            print(f"❌ Ошибка удаления файла: {e}")
-        super().reject()
-
-    def save_effect(self):
-        """Действие при нажатии 'Сохранить'"""
-        user_name = self.name_input.text().strip()
-        if not user_name:
-            QMessageBox.warning(self, "Ошибка", "Введите имя для темплейта")
+        if any(not name for _, name in selected):
+            QMessageBox.warning(self, "Ошибка", "Введите имена для всех отмеченных кандидатов")
             return
-
-        food_dir = "../data/data/templates/food"
-        os.makedirs(food_dir, exist_ok=True)
-
-        effect_filename = f"effect_{user_name}.png"
-        full_path = os.path.join(food_dir, effect_filename)
-        original_img = cv2.imread(self.image_path)
-
-        if original_img is None:
-            QMessageBox.critical(self, "Ошибка", "Не удалось загрузить изображение для сохранения.")
-            self.reject()
+        names = [name for _, name in selected]
+        if len(set(names)) != len(names):
+            QMessageBox.warning(self, "Ошибка", "Имена темплейтов повторяются")
             return
 
-        cv2.imwrite(full_path, original_img)
-
-        # Сохраняем данные в JSON
-        template_file = os.path.join(food_dir, "food_templates.json")
-        new_data = {
-            "name": user_name,
-            "label": user_name,
-            "template": effect_filename,
-            "x": self.parent.x if self.parent else 0,
-            "y": self.parent.y if self.parent else 0,
-            "width": original_img.shape[1],
-            "height": original_img.shape[0]
-        }
-
-        if os.path.exists(template_file):
-            try:
-                with open(template_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            except json.JSONDecodeError:
-                data = []
-        else:
-            data = []
-
-        exists = any(item["name"] == user_name for item in data)
-        if exists:
-            QMessageBox.warning(self, "Ошибка", "Темплейт с таким именем уже существует")
+        errors = []
+        for change, check, name_input in self._rows:
+            name = name_input.text().strip()
+            if not check.isChecked():
+                continue
+            duplicate = find_food_duplicate(change.image)
+            action = ask_duplicate(self, name, duplicate) if duplicate is not None else DUPLICATE_KEEP
+            if action == DUPLICATE_MERGE:
+                merge_food_effect(change.image, duplicate)
+                self.merged.append(duplicate.entry.name)
+            elif action == DUPLICATE_KEEP:
+                x, y = self.origin[0] + change.bbox[0], self.origin[1] + change.bbox[1]
+                ok, message = save_food_effect(change.image, name, x, y, self.resolution,
+                                               match_mode=self.mode_combo.currentData())
+                if not ok:
+                    errors.append(message)
+                    continue
+                self.saved.append(name)
+            # Обработанный кандидат больше не редактируется и не сохраняется повторно
+            check.setChecked(False)
+            check.setEnabled(False)
+            name_input.setEnabled(False)
+
+        if errors:
+            # Окно остаётся открытым, чтобы можно было исправить имена
+            QMessageBox.warning(self, "Ошибка", "\n".join(errors))
             return
-
-        data.append(new_data)
-        with open(template_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
-
-        self.accept()
\ No newline at end of file
+        self.accept()
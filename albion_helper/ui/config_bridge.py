@@ -0,0 +1,25 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from config.service import get_config
+
+
+class ConfigBridge(QObject):
+    """
+    Переносит уведомления службы настроек в поток GUI через сигнал Qt.
+    Подписка снимается вместе с объектом (или явно через close()).
+    """
+
+    changed = pyqtSignal(object, object)
+
+    def __init__(self, parent=None, service=None):
+        super().__init__(parent)
+        self.service = service or get_config()
+        unsubscribe = self._unsubscribe = self.service.subscribe(self._on_changed)
+        self.destroyed.connect(lambda *_: unsubscribe())
+
+    def _on_changed(self, settings, changed_keys):
+        """Вызывается в потоке, где изменились настройки"""
+        self.changed.emit(settings, changed_keys)
+
+    def close(self):
+        self._unsubscribe()
@@ -3,25 +3,23 @@ from PyQt5.QtWidgets import (
     QLabel, QLineEdit, QPushButton, QComboBox,
     QApplication, QMessageBox, QDialog
 )
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap, QImage, QIcon
+from PyQt5.QtCore import Qt, QEvent
+from PyQt5.QtGui import QIcon
 import os
-import json
 import sys
-import cv2
 import logging
 import time
 from PyQt5.QtCore import QTimer
 from datetime import datetime
 
 
-from ui.auto_template_food import FoodEffectPreviewWindow
-from ui.auto_food_mode_window import AutoFoodModeWindow
 # Импорт утилит
-from utils.paths import ROOT_DIR, TEMP_DIR, LOGS_DIR, TEMPLATES_DIR, EFFECT_TEMPLATES_JSON, FOOD_TEMPLATES_JSON, ensure_directories
-# Импорт модулей
-from modules.screenshot_handler import capture_screen, resize_image, save_effect_template, find_image_difference
-from modules.food_processor import process_food_difference
+from utils.paths import TEMP_DIR, LOGS_DIR, EFFECT_TEMPLATES_JSON, FOOD_TEMPLATES_JSON, ensure_directories
+# Модули с OpenCV/numpy и окна второго плана импортируются в методах, которые их используют:
+# главное окно показывается, не дожидаясь их загрузки (см. modules/warmup.py)
+from ui.pipeline_bridge import PipelineBridge
+from ui.config_bridge import ConfigBridge
+from config.service import get_config
 
 
 
@@ -46,23 +44,34 @@ class AlbionHelperMainWindow(QWidget):
         self.temp_dir = TEMP_DIR
         self.last_food_effect = None
         self.resize(800, 600)
-
-        self.auto_update_timer = QTimer(self)
-        self.auto_update_timer.timeout.connect(self.update_preview)
-        self.auto_update_timer.start(200)
+        self.config = get_config()
 
         self.init_ui()
 
+        # Превью захватывается в фоновом потоке, GUI только рисует готовый кадр
+        self.preview_bridge = PipelineBridge(self)
+        self.preview_bridge.frames_ready.connect(self.show_preview)
+        self.preview_renderer = None
+        self.preview_pipeline = None
+        for line_edit in (self.x_input, self.y_input, self.width_input, self.height_input):
+            line_edit.textChanged.connect(self.update_preview)
+        # Захват превью запускается из цикла событий, когда окно уже показано
+        QTimer.singleShot(0, self.start_preview)
+
         self.food_mode_active = False
         self.template_1_path = ""
         self.template_2_path = ""
         self.found_changes = []
-        self.change_index = 0
+        self.before_stats = None
+        self.after_stats = None
         self.temp_dir = TEMP_DIR
+        # Отладочный режим мастера: кадры и вырезки дополнительно пишутся в temp/diff
+        self.discovery_debug_dump = bool(self.settings_data.get("discovery_debug_dump", False))
         os.makedirs(self.temp_dir, exist_ok=True)
 
-        # Загрузка настроек
-        self.settings_data = self.load_settings()
+        # Области в полях ввода обновляются, если настройки изменились на диске или в другом окне
+        self.config_bridge = ConfigBridge(self, self.config)
+        self.config_bridge.changed.connect(self.on_settings_changed)
         self.apply_region_settings(self.region_combo.currentText())
 
     def init_ui(self):
@@ -225,39 +234,75 @@ class AlbionHelperMainWindow(QWidget):
         row.addWidget(widget)
         return row
 
+    def start_preview(self):
+        """Создаёт поток захвата превью (при первом вызове загружаются захват экрана и OpenCV)"""
+        if self.preview_pipeline is not None:
+            return
+        from modules.pipeline import DetectionPipeline
+        from ui.preview_renderer import PreviewRenderer, PREVIEW_FPS, PREVIEW_INACTIVE_FPS
+
+        self.preview_fps = float(self.settings_data.get("preview_fps", PREVIEW_FPS))
+        self.preview_inactive_fps = float(self.settings_data.get("preview_inactive_fps", PREVIEW_INACTIVE_FPS))
+        self.preview_renderer = PreviewRenderer(self.image_preview, max_fps=self.preview_fps)
+        self.preview_pipeline = DetectionPipeline([], on_frames=self.preview_bridge.push_frames,
+                                                  capture_interval=1.0 / self.preview_fps)
+        self.preview_pipeline.set_preview_enabled(False)
+        self.preview_pipeline.start()
+        self.update_preview()
+        self.update_preview_activity()
+
     def update_preview(self):
+        """Передаёт область из полей ввода в поток захвата превью"""
+        if self.preview_pipeline is None:
+            return
         try:
             x = int(self.x_input.text())
             y = int(self.y_input.text())
             width = int(self.width_input.text())
             height = int(self.height_input.text())
         except ValueError:
+            self.preview_pipeline.set_regions([])
             self.status_label.setText("Ошибка: все поля должны быть числами.")
             self.logger.warning("⚠️ Некорректные данные ввода: не числа")
             return
 
-        self.logger.info(f"📸 Обновление превью: X={x}, Y={y}, W={width}, H={height}")
-        image = capture_screen(x, y, width, height)
-        if image is None:
-            self.status_label.setText("Ошибка: не удалось сделать скриншот.")
+        if width <= 0 or height <= 0:
+            self.preview_pipeline.set_regions([])
             return
 
-        # Получаем доступный размер для превью
-        available_size = self.image_preview.size()
+        self.logger.debug(f"📸 Обновление превью: X={x}, Y={y}, W={width}, H={height}")
+        self.preview_pipeline.set_regions([(x, y, width, height)])
 
-        # Ресайз с сохранением пропорций
-        h, w = image.shape[:2]
-        scaling_factor = min(available_size.width() / w, available_size.height() / h)
-        new_size = (int(w * scaling_factor), int(h * scaling_factor))
-        resized_image = cv2.resize(image, new_size, interpolation=cv2.INTER_AREA)
+    def show_preview(self):
+        """Рисует последний захваченный кадр превью (вызывается в потоке GUI)"""
+        frames = self.preview_bridge.take_frames()
+        if not frames:
+            return
+        self.preview_renderer.render(frames[0])
 
-        # Преобразуем под QPixmap
-        q_img = QImage(resized_image.data, resized_image.shape[1], resized_image.shape[0],
-                       resized_image.strides[0], QImage.Format_BGR888)
-        pixmap = QPixmap.fromImage(q_img)
+    def update_preview_activity(self):
+        """Останавливает захват превью, когда окно скрыто, и замедляет его, когда окно неактивно"""
+        if self.preview_pipeline is None:
+            return
+        from ui.preview_renderer import preview_interval
 
-        # Устанавливаем изображение
-        self.image_preview.setPixmap(pixmap)
+        interval = preview_interval(self, self.preview_fps, self.preview_inactive_fps)
+        self.preview_pipeline.set_preview_enabled(interval is not None, interval)
+        if interval is not None:
+            self.preview_renderer.reset()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_preview_activity()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.update_preview_activity()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() in (QEvent.WindowStateChange, QEvent.ActivationChange):
+            self.update_preview_activity()
 
     def save_region(self):
         region_name = self.region_combo.currentText()
@@ -270,29 +315,14 @@ class AlbionHelperMainWindow(QWidget):
             self.status_label.setText("Ошибка: все поля должны быть числами.")
             return
 
-        config_path = resource_path(os.path.join(ROOT_DIR, "config", "settings.json"))
-        if os.path.exists(config_path):
-            with open(config_path, "r") as f:
-                data = json.load(f)
-        else:
-            data = {}
-
-        data[region_name] = {
-            "x": x,
-            "y": y,
-            "width": width,
-            "height": height,
-            "label": region_name
-        }
-
-        with open(config_path, "w") as f:
-            json.dump(data, f, indent=4)
+        try:
+            self.config.set_region(region_name, (x, y, width, height))
+        except ValueError as e:
+            self.status_label.setText(f"Ошибка: {e}")
+            return
 
         self.status_label.setText(f"✅ Сохранено: {region_name}")
 
-        self.settings_data = self.load_settings()
-        self.apply_region_settings(self.region_combo.currentText())
-
     def save_template(self):
         region_name = self.region_combo.currentText()
         try:
@@ -304,92 +334,61 @@ class AlbionHelperMainWindow(QWidget):
             self.status_label.setText("Ошибка: все поля должны быть числами.")
             return
 
+        from modules.screenshot_handler import save_effect_template
+
         filename = save_effect_template(x, y, width, height, region_name)
         self.status_label.setText(f"💾 Темплейт сохранён: {filename}")
 
     def save_template_data(self, x, y, width, height, label):
-        template_dir = TEMPLATES_DIR
-        os.makedirs(template_dir, exist_ok=True)
-        template_file = os.path.join(template_dir, "region_templates.json")
-
         # Получаем имя из поля ввода
         user_name = self.name_input.text().strip()
         if not user_name:
             user_name = label.lower().replace(" ", "_")
 
-        new_data = {
-            "x": x,
-            "y": y,
-            "width": width,
-            "height": height,
-            "label": label,
-            "name": user_name
-        }
-
-        if os.path.exists(template_file):
-            with open(template_file, "r", encoding="utf-8") as f:
-                try:
-                    data = json.load(f)
-                except json.JSONDecodeError:
-                    data = []
-        else:
-            data = []
-
-        exists = any(item["name"] == user_name for item in data)
-        if exists:
+        from modules.template_store import get_template_store, TemplateExistsError
+        try:
+            get_template_store().add(user_name, "region", x=x, y=y, width=width, height=height, label=label,
+                                     resolution=self.settings_data.get("default_resolution"))
+        except TemplateExistsError:
             self.status_label.setText("⚠️ Темплейт с таким именем уже существует.")
             return False
 
-        data.append(new_data)
-        with open(template_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
-
-        self.status_label.setText(f"✅ Темплейт '{user_name}' сохранён в region_templates.json")
+        self.status_label.setText(f"✅ Темплейт '{user_name}' сохранён")
         return True
 
     def save_food_template(self, x, y, width, height, label="Эффект еды"):
         """
-        Сохраняет изображение эффекта еды и JSON с координатами
+        Сохраняет изображение эффекта еды с координатами в хранилище шаблонов.
+        Если оно почти совпадает с существующим шаблоном, спрашивает, что с ним делать.
         """
-        food_dir = os.path.join(ROOT_DIR, "food")
-        os.makedirs(food_dir, exist_ok=True)
-
-        filename = f"effect_{label.lower().replace(' ', '_')}_{width}x{height}.png"
-        full_path = os.path.join(food_dir, filename)
+        from modules.screenshot_handler import capture_screen
+        from modules.template_store import get_template_store, TemplateExistsError
+        from ui.auto_template_food import (find_food_duplicate, ask_duplicate, merge_food_effect,
+                                           DUPLICATE_MERGE, DUPLICATE_SKIP)
 
         # Сохраняем изображение области
         food_image = capture_screen(x, y, width, height)
-        cv2.imwrite(full_path, food_image)
-
-        # Сохраняем данные в JSON
-        template_file = os.path.join(food_dir, "food_templates.json")
-
-        new_data = {
-            "x": x,
-            "y": y,
-            "width": width,
-            "height": height,
-            "label": label,
-            "name": label.lower().replace(" ", "_"),
-            "template": filename
-        }
-
-        if os.path.exists(template_file):
-            with open(template_file, "r", encoding="utf-8") as f:
-                try:
-                    data = json.load(f)
-                except json.JSONDecodeError:
-                    data = []
-        else:
-            data = []
-
-        exists = any(item["name"] == new_data["name"] for item in data)
-        if not exists:
-            data.append(new_data)
-            with open(template_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
+        duplicate = find_food_duplicate(food_image)
+        if duplicate is not None:
+            action = ask_duplicate(self, label, duplicate)
+            if action == DUPLICATE_SKIP:
+                self.status_label.setText(f"🗑️ Эффект еды не сохранён: похож на '{duplicate.entry.name}'")
+                return False
+            if action == DUPLICATE_MERGE:
+                merge_food_effect(food_image, duplicate)
+                self.status_label.setText(f"🔄 Темплейт '{duplicate.entry.name}' обновлён новой вырезкой")
+                return True
+        try:
+            ui_scale = self.settings_data.get("ui_scale")
+            get_template_store().add(label.lower().replace(" ", "_"), "food", food_image, x, y, label=label,
+                                     resolution=self.settings_data.get("default_resolution"),
+                                     meta={"ui_scale": float(ui_scale)} if ui_scale else None)
+        except TemplateExistsError:
+            self.status_label.setText(f"⚠️ Эффект еды '{label}' уже сохранён.")
+            return False
 
         self.status_label.setText(f"🍱 Эффект еды '{label}' сохранён")
+        return True
 
     def find_and_save_food_effect(self):
         if not hasattr(self, 'img1') or not hasattr(self, 'img2'):
@@ -400,31 +399,26 @@ class AlbionHelperMainWindow(QWidget):
             self.status_label.setText("❌ Один из скриншотов пуст")
             return
 
-        from modules.image_comparer import find_image_difference
-        boxes, result_img = find_image_difference(self.img1, self.img2)
-
-        if not boxes:
-            self.status_label.setText("❌ Не удалось обнаружить эффект от еды.")
-            return
+        from modules.burst_diff import stable_difference
+        from modules.food_processor import extract_food_changes, dump_food_changes
 
-        # Сохраняем результат сравнения
-        result_path = os.path.join(self.temp_dir, "food_diff.png")
-        cv2.imwrite(result_path, result_img)
+        boxes = None
+        if self.before_stats is not None and self.after_stats is not None:
+            # Только стабильные изменения между сериями: анимации и курсор отсеиваются
+            boxes = stable_difference(self.before_stats, self.after_stats).boxes
+            self.logger.info(f"🔍 Найдено {len(boxes)} стабильных изменений")
 
-        output_dir = os.path.join(self.temp_dir, "diff")
-        os.makedirs(output_dir, exist_ok=True)
+        # Вырезки остаются в памяти; на диск — только в отладочном режиме
+        self.found_changes, result_img = extract_food_changes(self.img1, self.img2, boxes)
+        if self.discovery_debug_dump:
+            dump_food_changes(self.found_changes, result_img, os.path.join(self.temp_dir, "diff"),
+                              self.img1, self.img2)
 
-        # Обрезаем и сохраняем каждую найденную область
-        self.found_changes = []
-        for idx, (x, y, w, h) in enumerate(boxes):
-            cropped = self.img2[y:y + h, x:x + w]
-            cropped_path = os.path.join(output_dir, f"change_{idx}.png")
-            cv2.imwrite(cropped_path, cropped)
-            self.found_changes.append(cropped_path)
+        if not self.found_changes:
+            self.status_label.setText("❌ Не удалось обнаружить эффект от еды.")
+            return
 
-        # Запускаем показ изменений через таймер
-        self.change_index = 0
-        QTimer.singleShot(500, self.show_next_change)
+        self.show_candidates_gallery()
 
     def start_auto_food_mode(self):
         try:
@@ -458,12 +452,48 @@ class AlbionHelperMainWindow(QWidget):
         if reply == QMessageBox.Ok:
             self.take_first_screenshot()
 
+    def start_burst(self, on_done):
+        """
+        Снимает серию кадров выбранной области по таймеру, не блокируя GUI.
+        :param on_done: callable(FrameBurst или None) — вызывается, когда серия снята
+        """
+        from modules.burst_diff import FrameBurst, BURST_FRAMES, BURST_INTERVAL
+        from modules.screenshot_handler import capture_screen
+
+        count = int(self.settings_data.get("burst_frames", BURST_FRAMES))
+        interval_ms = int(float(self.settings_data.get("burst_interval", BURST_INTERVAL)) * 1000)
+        burst = FrameBurst(max(1, count), self.height, self.width)
+        timer = QTimer(self)
+
+        def grab_next():
+            frame = capture_screen(self.x, self.y, self.width, self.height)
+            if frame is None or burst.add(frame):
+                timer.stop()
+                timer.deleteLater()
+                on_done(burst if burst.filled else None)
+
+        timer.timeout.connect(grab_next)
+        timer.start(interval_ms)
+        grab_next()
+
     def take_first_screenshot(self):
-        self.status_label.setText("📸 Первый скриншот (без еды)")
-        self.logger.info("📸 Первый скриншот (без еды)")
+        self.status_label.setText("📸 Первая серия скриншотов (без еды)")
+        self.logger.info("📸 Первая серия скриншотов (без еды)")
+        self.before_stats = None
+        self.after_stats = None
+        self.start_burst(self.on_first_burst)
+
+    def on_first_burst(self, burst):
+        if burst is None:
+            self.status_label.setText("❌ Не удалось сделать первый скриншот")
+            self.logger.error("❌ Не удалось сделать первый скриншот")
+            return
 
-        self.img1 = capture_screen(self.x, self.y, self.width, self.height)
-        cv2.imwrite(os.path.join(self.temp_dir, "before_food.png"), self.img1)
+        from modules.burst_diff import temporal_stats
+
+        # Медиана серии (без курсора и случайных всплывающих элементов) и разброс пикселей
+        self.before_stats = temporal_stats(burst.stack())
+        self.img1 = self.before_stats[0]
 
         reply = QMessageBox.information(
             self,
@@ -475,24 +505,26 @@ class AlbionHelperMainWindow(QWidget):
             QTimer.singleShot(5000, self.take_second_screenshot)  # Ждём 5 секунд
 
     def take_second_screenshot(self):
-        self.status_label.setText("📸 Второй скриншот (с едой)")
-        self.logger.info("📸 Второй скриншот (с едой)")
+        self.status_label.setText("📸 Вторая серия скриншотов (с едой)")
+        self.logger.info("📸 Вторая серия скриншотов (с едой)")
+        self.start_burst(self.on_second_burst)
 
-        self.img2 = capture_screen(self.x, self.y, self.width, self.height)
-        if self.img2 is None:
+    def on_second_burst(self, burst):
+        if burst is None:
             self.status_label.setText("❌ Не удалось сделать второй скриншот")
             self.logger.error("❌ Не удалось сделать второй скриншот")
             return
 
-        cv2.imwrite(os.path.join(self.temp_dir, "after_food.png"), self.img2)
+        from modules.burst_diff import temporal_stats
+
+        self.after_stats = temporal_stats(burst.stack())
+        self.img2 = self.after_stats[0]
         self.find_and_save_food_effect()
 
     def process_food_effect(self):
-        before_img = os.path.join(self.temp_dir, "before_food.png")
-        after_img = os.path.join(self.temp_dir, "after_food.png")
-        output_dir = os.path.join(self.temp_dir, "diff")
+        from modules.food_processor import extract_food_changes
 
-        changes = process_food_difference(before_img, after_img, output_dir)
+        changes, _ = extract_food_changes(self.img1, self.img2)
 
         if changes:
             self.status_label.setText("✅ Эффект от еды обнаружен")
@@ -503,9 +535,9 @@ class AlbionHelperMainWindow(QWidget):
                 QMessageBox.Yes | QMessageBox.No
             )
             if reply == QMessageBox.Yes:
-                # Сохраняем первое найденное изменение как шаблон
-                effect_img = cv2.imread(changes[0])
-                x, y, w, h = self.get_coords_from_filename(changes[0])
+                # Сохраняем первое найденное изменение как шаблон (координаты — на экране)
+                bx, by, w, h = changes[0].bbox
+                x, y = self.x + bx, self.y + by
                 self.save_food_template(x, y, w, h, label="Эффект еды")
                 self.save_template_data(x, y, w, h, "Эффект еды")
                 self.last_food_effect = {
@@ -519,32 +551,22 @@ class AlbionHelperMainWindow(QWidget):
         else:
             self.status_label.setText("❌ Не удалось обнаружить эффект от еды.")
 
-    def get_coords_from_filename(self, path):
-        """Вспомогательная функция для получения координат из имени файла"""
-        filename = os.path.basename(path)
-        if "change_" in filename:
-            return 0, 0, 80, 80  # Пример, замени на реальные данные при необходимости
-        return 0, 0, 80, 80
-
     def load_settings(self):
-        config_path = resource_path(os.path.join(ROOT_DIR, "config", "settings.json"))
-        if os.path.exists(config_path):
-            with open(config_path, "r", encoding="utf-8") as f:
-                try:
-                    return json.load(f)
-                except json.JSONDecodeError:
-                    self.status_label.setText("⚠️ Ошибка чтения settings.json")
-                    return {}
-        else:
-            self.status_label.setText("⚠️ Файл settings.json не найден")
-            return {}
+        """Снимок настроек из общей службы (файл читается один раз на процесс)"""
+        return self.config.settings
+
+    def on_settings_changed(self, settings, changed_keys):
+        self.settings_data = settings
+        region_name = self.region_combo.currentText()
+        if region_name in changed_keys:
+            self.apply_region_settings(region_name)
 
     def apply_region_settings(self, region_name):
-        data = self.settings_data.get(region_name, {})
-        self.x_input.setText(str(data.get("x", "")))
-        self.y_input.setText(str(data.get("y", "")))
-        self.width_input.setText(str(data.get("width", "")))
-        self.height_input.setText(str(data.get("height", "")))
+        region = self.config.region(region_name)
+        for line_edit, value in zip((self.x_input, self.y_input, self.width_input, self.height_input),
+                                    region or ("", "", "", "")):
+            if line_edit.text() != str(value):
+                line_edit.setText(str(value))
 
     def on_region_changed(self):
         selected_region = self.region_combo.currentText()
@@ -605,34 +627,40 @@ class AlbionHelperMainWindow(QWidget):
         if reply == QMessageBox.Ok:
             self.take_first_screenshot()
 
-    def show_next_change(self):
+    def show_candidates_gallery(self):
+        """Все найденные кандидаты в одном окне вместо цепочки модальных диалогов"""
         if not self.found_changes:
             self.status_label.setText("❌ Нет изменений для просмотра")
             return
 
-        change_path = self.found_changes[self.change_index]
-
-        # Правильный вызов с parent=self
-        preview_window = FoodEffectPreviewWindow(image_path=change_path, parent=self)
-
-        result = preview_window.exec_()  # Модальное окно
-
-        if result == QDialog.Accepted:
-            self.status_label.setText("✅ Эффект сохранён")
-        else:
-            self.status_label.setText("🗑️ Эффект удалён")
-
-        if self.change_index < len(self.found_changes) - 1:
-            self.change_index += 1
-            QTimer.singleShot(500, self.show_next_change)
+        from ui.auto_template_food import FoodCandidatesGallery
+        gallery = FoodCandidatesGallery(self.found_changes, origin=(self.x, self.y), parent=self,
+                                        resolution=self.settings_data.get("default_resolution"))
+        gallery.exec_()
+
+        if gallery.saved or gallery.merged:
+            parts = []
+            if gallery.saved:
+                parts.append(f"Сохранено эффектов: {len(gallery.saved)} ({', '.join(gallery.saved)})")
+            if gallery.merged:
+                parts.append(f"Обновлено похожих: {len(gallery.merged)} ({', '.join(gallery.merged)})")
+            self.status_label.setText("✅ " + "; ".join(parts))
         else:
-            self.status_label.setText("✅ Все изменения просмотрены")
+            self.status_label.setText("🗑️ Эффекты не сохранены")
+        self.found_changes = []
 
     def open_auto_food_mode_window(self):
+        from ui.auto_food_mode_window import AutoFoodModeWindow
+
         ensure_directories()
         self.auto_food_window = AutoFoodModeWindow(parent=self)
         self.auto_food_window.show()
 
+    def closeEvent(self, event):
+        if self.preview_pipeline is not None:
+            self.preview_pipeline.stop()
+        super().closeEvent(event)
+
     def update_food_mode_status(self, is_active):
         if is_active:
             self.food_mode_label.setText("🍱 Режим авто-еды: включен")
@@ -0,0 +1,37 @@
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class PipelineBridge(QObject):
+    """
+    Переносит колбэки DetectionPipeline из рабочих потоков в поток GUI через сигналы Qt.
+    Кадры превью схлопываются: пока GUI не отрисовал предыдущий кадр,
+    новые кадры только заменяют ожидающий, а не копятся в очереди событий.
+    """
+
+    frames_ready = pyqtSignal()
+    result_ready = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._lock = threading.Lock()
+        self._pending_frames = None
+
+    def push_frames(self, frames):
+        """Вызывается из потока захвата"""
+        with self._lock:
+            already_pending = self._pending_frames is not None
+            self._pending_frames = frames
+        if not already_pending:
+            self.frames_ready.emit()
+
+    def take_frames(self):
+        """Вызывается из потока GUI: забирает самый свежий кадр"""
+        with self._lock:
+            frames, self._pending_frames = self._pending_frames, None
+        return frames
+
+    def push_result(self, result):
+        """Вызывается из потока детекции"""
+        self.result_ready.emit(result)
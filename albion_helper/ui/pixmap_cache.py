@@ -0,0 +1,75 @@
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PyQt5.QtGui import QPixmap, QImage
+
+# Сколько отмасштабированных вариантов одного изображения держать в кэше
+PIXMAP_CACHE_SIZE = 8
+
+
+def fitted_size(image_size, width, height):
+    """
+    Размер изображения, вписанного в width x height с сохранением пропорций.
+    :param image_size: (w, h) исходного изображения
+    :return: (w, h)
+    """
+    w, h = image_size
+    scaling_factor = min(width / w, height / h)
+    return max(1, int(w * scaling_factor)), max(1, int(h * scaling_factor))
+
+
+class ScaledPixmapCache:
+    """
+    Декодированное BGR-изображение и LRU-кэш его QPixmap по целевому размеру.
+    Ключ — итоговый размер после вписывания, поэтому разные размеры окна,
+    дающие одинаковую картинку, делят одну запись.
+    """
+
+    def __init__(self, image=None, max_entries=PIXMAP_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._pixmaps = OrderedDict()
+        self._buffer = None
+        self.image = None
+        self.hits = 0
+        self.misses = 0
+        if image is not None:
+            self.set_image(image)
+
+    def set_image(self, image):
+        """Меняет исходное изображение и сбрасывает кэш"""
+        self.image = image
+        self._pixmaps.clear()
+
+    def clear(self):
+        self._pixmaps.clear()
+
+    def pixmap(self, width, height):
+        """
+        QPixmap, вписанный в width x height (None, если изображения нет).
+        """
+        if self.image is None or width <= 0 or height <= 0:
+            return None
+        h, w = self.image.shape[:2]
+        size = fitted_size((w, h), width, height)
+        pixmap = self._pixmaps.get(size)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(size)
+            self.hits += 1
+            return pixmap
+
+        self.misses += 1
+        new_w, new_h = size
+        if self._buffer is None or self._buffer.shape[:2] != (new_h, new_w):
+            self._buffer = np.empty((new_h, new_w, 3), dtype=np.uint8)
+        interpolation = cv2.INTER_AREA if new_w <= w else cv2.INTER_LINEAR
+        cv2.resize(self.image, size, dst=self._buffer, interpolation=interpolation)
+
+        # QPixmap.fromImage копирует данные, поэтому буфер можно переиспользовать
+        q_img = QImage(self._buffer.data, new_w, new_h, self._buffer.strides[0], QImage.Format_BGR888)
+        pixmap = QPixmap.fromImage(q_img)
+        self._pixmaps[size] = pixmap
+        if len(self._pixmaps) > self.max_entries:
+            self._pixmaps.popitem(last=False)
+        return pixmap
+
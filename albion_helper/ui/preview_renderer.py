@@ -0,0 +1,83 @@
+import time
+
+from modules.change_gate import FrameChangeGate
+from ui.pixmap_cache import ScaledPixmapCache, fitted_size
+
+# Частота превью по умолчанию: когда окно активно и когда на переднем плане другое окно (игра)
+PREVIEW_FPS = 5.0
+PREVIEW_INACTIVE_FPS = 1.0
+
+# Допуск ограничения частоты: кадры от захвата с тем же FPS не должны отбрасываться из-за дрожания таймера
+FPS_TOLERANCE = 0.9
+
+
+def preview_interval(window, fps=PREVIEW_FPS, inactive_fps=PREVIEW_INACTIVE_FPS):
+    """
+    Интервал захвата превью для окна в секундах.
+    :return: float или None, если окно скрыто или свёрнуто и превью не нужно
+    """
+    if not window.isVisible() or window.isMinimized():
+        return None
+    fps = fps if window.isActiveWindow() else inactive_fps
+    if fps <= 0:
+        return None
+    return 1.0 / fps
+
+
+class PreviewRenderer:
+    """
+    Рисует кадры превью в QLabel:
+    - не рисует, если метка не видна;
+    - ограничивает частоту отрисовки max_fps;
+    - пропускает кадр, если он не изменился и размер метки прежний;
+    - пока кадр не меняется, отмасштабированные варианты берутся из ScaledPixmapCache.
+    """
+
+    def __init__(self, label, max_fps=PREVIEW_FPS):
+        self.label = label
+        self.max_fps = max_fps
+        self.gate = FrameChangeGate(pixel_delta=8, min_changed_pixels=1)
+        self.pixmaps = ScaledPixmapCache()
+        self._last_render = 0.0
+        self._last_target = None
+        self.rendered = 0
+        self.skipped = 0
+
+    def reset(self):
+        """Следующий кадр будет нарисован, даже если не изменился"""
+        self.gate.reset()
+        self.pixmaps.clear()
+        self._last_target = None
+
+    def _target_size(self, frame):
+        h, w = frame.shape[:2]
+        return fitted_size((w, h), self.label.width(), self.label.height())
+
+    def render(self, frame):
+        """
+        Рисует кадр, если это нужно.
+        :return: bool — был ли кадр нарисован
+        """
+        if frame is None or not self.label.isVisible():
+            self.skipped += 1
+            return False
+
+        now = time.monotonic()
+        if self.max_fps and now - self._last_render < FPS_TOLERANCE / self.max_fps:
+            self.skipped += 1
+            return False
+
+        target = self._target_size(frame)
+        changed = self.gate.changed(frame)
+        if not changed and target == self._last_target:
+            self.skipped += 1
+            return False
+
+        if changed or self.pixmaps.image is None:
+            self.pixmaps.set_image(frame)
+        self.label.setPixmap(self.pixmaps.pixmap(self.label.width(), self.label.height()))
+
+        self._last_render = now
+        self._last_target = target
+        self.rendered += 1
+        return True
@@ -0,0 +1,121 @@
+"""
+Профиль времени импорта модулей при запуске (python main.py --profile-imports).
+
+Профайлер подменяет builtins.__import__ и замеряет каждый модуль, который ещё не
+был загружен: полное время (вместе с вложенными импортами) и собственное время.
+Вехи запуска (окно показано, прогрев завершён) отмечаются через mark().
+Отчёт — самые медленные модули и вехи — пишется в logs/<дата>/import_profile.txt.
+
+Модуль не должен импортировать ничего тяжёлого: он загружается раньше всех.
+"""
+import builtins
+import importlib.util
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from utils.paths import LOGS_DIR
+
+PROFILE_FLAG = "--profile-imports"
+PROFILE_FILENAME = "import_profile.txt"
+
+# Сколько самых медленных модулей выводить в отчёт
+REPORT_TOP = 30
+
+
+class ImportProfiler:
+    """Замер импортов текущего процесса (см. описание модуля)"""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.records = {}       # модуль -> [полное время, собственное время]
+        self.marks = []         # (название, секунды от старта)
+        self._original = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def install(self):
+        if self._original is None:
+            self._original = builtins.__import__
+            builtins.__import__ = self._import
+        return self
+
+    def uninstall(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def mark(self, name):
+        """Отмечает веху запуска (время от создания профайлера)"""
+        with self._lock:
+            self.marks.append((name, self.clock() - self.started))
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        fullname = name
+        if level:
+            try:
+                fullname = importlib.util.resolve_name("." * level + name, (globals or {}).get("__package__"))
+            except (ImportError, ValueError):
+                fullname = None
+        if not fullname or fullname in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+
+        # Стек вложенных импортов свой у каждого потока: в нём копится время дочерних модулей
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)
+        start = self.clock()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = self.clock() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self._lock:
+                record = self.records.setdefault(fullname, [0.0, 0.0])
+                record[0] += elapsed
+                record[1] += elapsed - children
+
+    def report(self, top=REPORT_TOP):
+        """:return: str — текст отчёта"""
+        with self._lock:
+            records = sorted(self.records.items(), key=lambda item: item[1][0], reverse=True)
+            marks = list(self.marks)
+        lines = [f"Профиль импорта — {datetime.now().isoformat(timespec='seconds')}", ""]
+        for name, seconds in marks:
+            lines.append(f"{seconds * 1000:9.1f} мс  {name}")
+        lines += ["", f"{'всего, мс':>10} {'своё, мс':>10}  модуль"]
+        for name, (total, own) in records[:top]:
+            lines.append(f"{total * 1000:10.1f} {own * 1000:10.1f}  {name}")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path=None):
+        """
+        Записывает отчёт в файл.
+        :param path: str — файл (по умолчанию logs/<дата>/import_profile.txt)
+        :return: str — путь к отчёту
+        """
+        if path is None:
+            path = os.path.join(LOGS_DIR, datetime.now().strftime("%Y-%m-%d"), PROFILE_FILENAME)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.report())
+        return path
+
+
+def profiler_from_argv(argv=None):
+    """
+    Включает профайлер, если в аргументах есть --profile-imports (флаг убирается из argv,
+    чтобы его не увидели QApplication и argparse).
+    :return: ImportProfiler или None
+    """
+    argv = sys.argv if argv is None else argv
+    if PROFILE_FLAG not in argv:
+        return None
+    argv.remove(PROFILE_FLAG)
+    return ImportProfiler().install()
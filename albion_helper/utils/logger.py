@@ -1,43 +1,164 @@
 import os
+import atexit
+import queue
+import threading
+import time
 from datetime import datetime
 import logging
+import logging.handlers
 from .paths import (TEMP_DIR, LOGS_DIR, TEMPLATES_DIR, EFFECT_TEMPLATES_JSON, FOOD_TEMPLATES_JSON, ensure_directories)
 
-def setup_logger(base_log_dir=LOGS_DIR):
+LOGGER_NAME = "AlbionHelperLogger"
+
+# Ротация по размеру: размер одного файла и сколько старых файлов хранить
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 5
+
+# Ограничение частоты: не больше RATE_LIMIT_BURST сообщений с одной строки кода
+# за RATE_LIMIT_PERIOD секунд (ошибки не ограничиваются)
+RATE_LIMIT_BURST = 5
+RATE_LIMIT_PERIOD = 10.0
+
+_lock = threading.Lock()
+_listener = None
+_rate_filter = None
+
+
+class RateLimitFilter(logging.Filter):
     """
-    Настраивает логгер, который пишет логи в папку по дате запуска
-    Пример: logs/2025-06-15/app_12-30.log
+    Ограничивает повторяющиеся сообщения (например, покадровые).
+    Сообщения группируются по месту вызова (файл и строка), а не по тексту:
+    f-строки с меняющимися числами считаются одним и тем же сообщением.
+    Число отброшенных сообщений дописывается к следующему пропущенному.
     """
-    # Получаем текущую дату и время
-    now = datetime.now()
-    date_str = now.strftime("%Y-%m-%d")
-    time_str = now.strftime("%H-%M")
 
-    # Создаём путь к папке по дате
-    date_dir = os.path.join(base_log_dir, date_str)
+    def __init__(self, burst=RATE_LIMIT_BURST, period=RATE_LIMIT_PERIOD, max_level=logging.WARNING,
+                 clock=time.monotonic):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.max_level = max_level
+        self.clock = clock
+        self.suppressed_total = 0
+        # (pathname, lineno) -> [начало окна, сообщений в окне, отброшено]
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.max_level or not self.burst:
+            return True
+        key = (record.pathname, record.lineno)
+        now = self.clock()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.period:
+                suppressed = site[2] if site is not None else 0
+                self._sites[key] = [now, 1, 0]
+            elif site[1] < self.burst:
+                site[1] += 1
+                suppressed = 0
+            else:
+                site[2] += 1
+                self.suppressed_total += 1
+                return False
+        if suppressed:
+            record.msg = f"{record.getMessage()} (пропущено похожих: {suppressed})"
+            record.args = None
+        return True
+
+
+def _file_handler(base_log_dir, rotation):
+    if rotation == "time":
+        # Один файл с ежедневной ротацией: logs/app.log, logs/app.log.2025-06-15, ...
+        os.makedirs(base_log_dir, exist_ok=True)
+        return logging.handlers.TimedRotatingFileHandler(
+            os.path.join(base_log_dir, "app.log"), when="midnight",
+            backupCount=BACKUP_COUNT * 6, encoding="utf-8", delay=True)
+
+    # Папка по дате запуска и файл на запуск с ротацией по размеру
+    now = datetime.now()
+    date_dir = os.path.join(base_log_dir, now.strftime("%Y-%m-%d"))
     os.makedirs(date_dir, exist_ok=True)
+    log_path = os.path.join(date_dir, f"app_{now.strftime('%H-%M')}.log")
+    return logging.handlers.RotatingFileHandler(
+        log_path, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding="utf-8", delay=True)
 
-    # Путь к файлу лога
-    log_filename = f"app_{time_str}.log"
-    log_path = os.path.join(date_dir, log_filename)
 
-    # Настройка логгера
-    logger = logging.getLogger("AlbionHelperLogger")
-    logger.setLevel(logging.INFO)
+def setup_logger(base_log_dir=LOGS_DIR, level=logging.INFO, rotation="size",
+                 rate_limit_burst=RATE_LIMIT_BURST, rate_limit_period=RATE_LIMIT_PERIOD):
+    """
+    Настраивает логгер приложения один раз на процесс.
+    Пример: logs/2025-06-15/app_12-30.log (rotation="size") или logs/app.log (rotation="time").
+    Вызывающий поток только кладёт запись в очередь; запись на диск идёт в фоновом потоке.
+    Повторные вызовы возвращают уже настроенный логгер, не открывая новых файлов.
+    :param rotation: str — "size" (по размеру) или "time" (ежедневно)
+    :param rate_limit_burst: int — сколько сообщений с одной строки кода пропускать
+                             за rate_limit_period секунд (0 — без ограничения)
+    """
+    global _listener, _rate_filter
+    logger = logging.getLogger(LOGGER_NAME)
+    with _lock:
+        if _listener is not None:
+            return logger
+
+        logger.setLevel(level)
+        logger.propagate = False
+        # Хендлеры от прежних настроек (если были) больше не нужны
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+
+        # Форматтер
+        formatter = logging.Formatter(
+            fmt="%(asctime)s [%(levelname)s] %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S"
+        )
+
+        # Файловый хендлер работает в потоке QueueListener
+        file_handler = _file_handler(base_log_dir, rotation)
+        file_handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        # Фильтр стоит до очереди: отброшенные сообщения не стоят ничего, кроме проверки
+        _rate_filter = RateLimitFilter(rate_limit_burst, rate_limit_period)
+        queue_handler.addFilter(_rate_filter)
+        logger.addHandler(queue_handler)
+
+        _listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logger)
+
+    return logger
+
+
+def set_log_level(level):
+    """
+    Меняет уровень логирования на лету.
+    Неизвестный уровень (например, опечатка в settings.json) заменяется на INFO с предупреждением.
+    :param level: int или str — logging.DEBUG / "DEBUG" / "info" и т.п.
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    resolved = logging.getLevelName(level.upper()) if isinstance(level, str) else level
+    if not isinstance(resolved, int):
+        logger.setLevel(logging.INFO)
+        logger.warning(f"⚠️ Неизвестный уровень логирования: {level!r}, используется INFO")
+        return
+    logger.setLevel(resolved)
 
-    # Очищаем старые хендлеры, чтобы не было дублирования
-    if logger.handlers:
-        logger.handlers.clear()
 
-    # Форматтер
-    formatter = logging.Formatter(
-        fmt="%(asctime)s [%(levelname)s] %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
+def get_rate_limit_filter():
+    """Фильтр частоты настроенного логгера (None, если setup_logger не вызывался)"""
+    return _rate_filter
 
-    # Файловый хендлер
-    file_handler = logging.FileHandler(log_path, encoding='utf-8')
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
 
-    return logger
\ No newline at end of file
+def shutdown_logger():
+    """Дописывает очередь на диск и закрывает файлы (вызывается автоматически при выходе)"""
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
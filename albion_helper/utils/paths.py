@@ -11,11 +11,16 @@ TEMP_DIR = os.path.join(TEMPLATES_DIR, "temp")
 # Логи
 LOGS_DIR = os.path.join(ROOT_DIR, "logs")
 
+# Записи сессий авто-режима (.albrec)
+RECORDINGS_DIR = os.path.join(DATA_DIR, "recordings")
+
 # Базы данных темплейтов
+TEMPLATE_STORE_DB = os.path.join(DATA_DIR, "templates.db")
+# Старые JSON-файлы (переносятся в TEMPLATE_STORE_DB при запуске)
 EFFECT_TEMPLATES_JSON = os.path.join(TEMPLATES_DIR, "effects", "region_templates.json")
 FOOD_TEMPLATES_JSON = os.path.join(TEMPLATES_DIR, "food", "food_templates.json")
 
 def ensure_directories():
     """Создаёт все нужные папки, если их нет"""
-    for path in [DATA_DIR, TEMPLATES_DIR, TEMP_DIR, LOGS_DIR]:
+    for path in [DATA_DIR, TEMPLATES_DIR, TEMP_DIR, LOGS_DIR, RECORDINGS_DIR]:
         os.makedirs(path, exist_ok=True)
\ No newline at end of file